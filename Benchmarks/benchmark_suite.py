@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import math
+import time
+import warnings
+import tempfile
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.exceptions import ConvergenceWarning
+
+# The kernels, the export layer and the models live in their own folders
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("Mie Scattering", "Rayleigh Scattering", "Data Export", "Machine Learning"):
+    sys.path.append(os.path.join(_root, folder))
+from mie_engine import batch_scattering_function, scattering_intensity
+from rayleigh_kernel import rayleigh_intensity
+from scattering_io import write_table
+from model_benchmark import default_models, load_notebook_dataset, machine_info
+
+GROUPS = ("rayleigh", "mie", "export", "ml")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+def time_call(function, repeat=5, min_time=0.2, max_time=30):
+    """
+    This function times a function of no arguments.\n
+    One warm-up call estimates the cost. Every sample then calls the function often enough to last about
+    min_time / repeat seconds, and slow functions get fewer samples so that one case takes about max_time at most.\n
+    Returns:
+        Dictionary with the median, minimum and standard deviation of the time per call (s), the number of
+        samples and the calls per sample
+    """
+    start = time.perf_counter()
+    function()
+    first = time.perf_counter() - start
+    number = max(1, math.ceil(min_time / repeat / max(first, 1e-9)))
+    repeat = max(1, min(repeat, int(max_time / max(first, 1e-9))))
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        samples.append((time.perf_counter() - start) / number)
+    samples = np.array(samples)
+    return {"median": float(np.median(samples)), "min": float(samples.min()), "std": float(samples.std()),
+            "repeats": repeat, "number": number}
+
+def rayleigh_cases(points=(1e3, 1e6, 1e8), chunk_points=2**20):
+    """
+    This function gives the Rayleigh kernel cases: rayleigh_intensity over (distances x 1000 angles) grids of the
+    given numbers of points, evaluated in chunks of about chunk_points points so that 1e8 points fit in memory.
+    """
+    theta_degrees = np.linspace(0, 180, 1000)
+    for count in points:
+        d_cm = np.linspace(1, 10, max(1, int(count) // theta_degrees.size))[:, np.newaxis]
+        rows = max(1, chunk_points // theta_degrees.size)
+
+        def run(d_cm=d_cm, rows=rows):
+            for start in range(0, len(d_cm), rows):
+                rayleigh_intensity(650, 1, 0.01, 1.33257, d_cm[start:start + rows], theta_degrees)
+        yield "rayleigh", f"rayleigh_intensity {count:.0e} points", run
+
+def mie_cases(size_parameters=(1, 100, 1000, 10000), resolutions=(0.1, 0.01), m=1.33257 + 1.67e-8j):
+    """
+    This function gives the Mie engine cases: SL and SR of one particle over 0-180 degrees for every size
+    parameter and angular resolution.
+    """
+    for resolution in resolutions:
+        theta = np.deg2rad(np.linspace(0, 180, int(round(180 / resolution)) + 1))
+        for x in size_parameters:
+            yield "mie", f"scattering_intensity x={x} {resolution} deg", lambda x=x, theta=theta: \
+                scattering_intensity(m, x, theta)
+
+def export_cases(folder):
+    """
+    This function gives the export cases of mie_data_ext.py and intensity_loop_d_range.py: the columnar tables
+    they write now, next to the CSV and XLSX files they wrote before, for the same data. The XLSX case is skipped
+    when pandas has no Excel writer installed.
+    """
+    m, w, r = 1.33257 + 1.67e-8j, 630, 1000
+
+    def mie_data(table):
+        theta, SL, SR, SU = batch_scattering_function(m, w, 2 * r, angularResolution=0.1)
+        data = {"Angle(degree)": theta * (180 / np.pi), "Perpendicular": SL, "Parallel": SR, "Unpolarized": SU}
+        if table:
+            write_table(os.path.join(folder, "Mie Scattering Data"), data, metadata={
+                "m": [m.real, m.imag], "wavelength_nm": w, "radius_nm": r, "angularResolution": 0.1})
+        else:
+            pd.DataFrame(data).to_csv(os.path.join(folder, "Mie Scattering Data.csv"))
+
+    theta_degrees = np.arange(0, 180.1, 0.1)
+    d_range = np.arange(2.1, 5.1, 0.1)
+
+    def rayleigh_data(table):
+        parallel, perpendicular, _, _ = rayleigh_intensity(650, 1, 0.01, 1.33257, d_range[:, np.newaxis],
+                                                           theta_degrees)
+        if table:
+            write_table(os.path.join(folder, "rayleigh_intensity_data"),
+                        {"d_cm": d_range, "Intensity Perpendicular": perpendicular, "Intensity Parallel": parallel},
+                        metadata={"lambda_nm": 650, "I_0": 1, "r_um": 0.01, "n": 1.33257},
+                        axes={"theta_deg": theta_degrees})
+            return
+        with pd.ExcelWriter(os.path.join(folder, "rayleigh_intensity_data.xlsx")) as writer:
+            for d_cm, parallel_d, perpendicular_d in zip(d_range, parallel, perpendicular):
+                pd.DataFrame({"Scattering Angle (degrees)": theta_degrees, "Intensity Perpendicular": perpendicular_d,
+                              "Intensity Parallel": parallel_d}).to_excel(writer, sheet_name=f"d_cm_{d_cm:.1f}",
+                                                                          index=False)
+
+    yield "export", "mie_data_ext table", lambda: mie_data(True)
+    yield "export", "mie_data_ext csv (original)", lambda: mie_data(False)
+    yield "export", "intensity_loop_d_range table", lambda: rayleigh_data(True)
+    yield "export", "intensity_loop_d_range xlsx (original)", lambda: rayleigh_data(False)
+
+def ml_cases(models=None, dataset=None):
+    """
+    This function gives one case per classifier: fitting it on the whole 'Dataframe used for ML'.
+    """
+    X, y = load_notebook_dataset() if dataset is None else dataset
+
+    def fit(model):
+        # The notebook settings do not always converge on the raw features; that is not what is measured here
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", ConvergenceWarning)
+            clone(model).fit(X, y)
+
+    for name, model in (default_models() if models is None else models).items():
+        yield "ml", f"fit {name}", lambda model=model: fit(model)
+
+def compare(results, baseline, threshold=0.25):
+    """
+    This function compares benchmark results with a baseline.\n
+    Args:
+        results : DataFrame of run_suite
+        baseline : Dictionary loaded from a baseline file, or None
+        threshold : Relative slowdown that counts as a regression (0.25 = 25 % slower)
+    Returns:
+        The results with the baseline time, the ratio to it and a status: 'slower' (regression), 'faster',
+        'ok', 'new' (not in the baseline) or 'skipped'. The fastest samples are compared, because they are the
+        least disturbed by other load on the machine
+    """
+    results = results.copy()
+    reference = {} if baseline is None else baseline["results"]
+    results["baseline"] = [reference.get(case, {}).get("min", np.nan) for case in results["case"]]
+    results["ratio"] = results["min"] / results["baseline"]
+    status = np.where(results["ratio"] > 1 + threshold, "slower",
+                      np.where(results["ratio"] < 1 / (1 + threshold), "faster", "ok"))
+    status = np.where(results["baseline"].isna(), "new", status)
+    results["status"] = np.where(results["min"].isna(), "skipped", status)
+    return results
+
+def load_baseline(path=BASELINE_PATH):
+    """
+    This function loads a baseline file, or gives None when there is none yet.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_baseline(results, path=BASELINE_PATH):
+    """
+    This function stores the times of a run, with the machine they were taken on, as the new baseline.
+    """
+    measured = results.dropna(subset=["min"])
+    baseline = {"created": datetime.now().isoformat(timespec="seconds"), "machine": machine_info(),
+                "results": {row.case: {"median": row.median, "min": row.min} for row in measured.itertuples()}}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=1)
+    return path
+
+def run_suite(groups=GROUPS, quick=False, repeat=5, min_time=0.2, max_time=30, threshold=0.25,
+              baseline_path=BASELINE_PATH, report_dir="benchmark_reports"):
+    """
+    This function runs the benchmark suite, compares it with the stored baseline and writes one report.\n
+    The cases are the Rayleigh kernel at 1e3, 1e6 and 1e8 points, the Mie engine at size parameters 1, 100, 1000
+    and 10000 on 0.1 and 0.01 degree grids, the two export scripts (current tables and original CSV/XLSX) and
+    fitting the eight notebook classifiers. Every case is timed by time_call in this process; run it on a quiet
+    machine.\n
+    Input the parameters in the following format -\n
+    Args:
+        groups : Groups of cases to run (any of GROUPS)
+        quick : Leave out the largest cases (1e8 Rayleigh points and x = 10000 at 0.01 degrees)
+        repeat, min_time, max_time : Timing settings of time_call
+        threshold : Relative slowdown against the baseline that is flagged as a regression
+        baseline_path : Baseline file (see save_baseline)
+        report_dir : Folder of the JSON reports (None writes no report)
+    Returns:
+        DataFrame with one row per case (see compare)
+    """
+    for group in groups:
+        if group not in GROUPS:
+            raise ValueError(f"Unknown benchmark group {group}.\nUse any of {GROUPS}")
+
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        cases = {"rayleigh": lambda: rayleigh_cases((1e3, 1e6) if quick else (1e3, 1e6, 1e8)),
+                 "mie": lambda: (case for case in mie_cases()
+                                 if not (quick and case[1] == "scattering_intensity x=10000 0.01 deg")),
+                 "export": lambda: export_cases(folder),
+                 "ml": ml_cases}
+        for group in groups:
+            for group_name, case, function in cases[group]():
+                try:
+                    timing = time_call(function, repeat, min_time, max_time)
+                except ImportError as error:
+                    # Optional writers (e.g. no Excel engine for the XLSX case)
+                    timing = {"median": np.nan, "min": np.nan, "error": str(error)}
+                rows.append({"group": group_name, "case": case, **timing})
+                print(f"{case:45s} {1000 * timing['median']:10.3f} ms")
+
+    results = compare(pd.DataFrame(rows), load_baseline(baseline_path), threshold)
+    if report_dir is not None:
+        os.makedirs(report_dir, exist_ok=True)
+        created = datetime.now()
+        baseline = load_baseline(baseline_path)
+        report = {"created": created.isoformat(timespec="seconds"), "threshold": threshold, "quick": quick,
+                  "machine": machine_info(), "baseline_machine": None if baseline is None else baseline["machine"],
+                  "results": json.loads(results.to_json(orient="records"))}
+        with open(os.path.join(report_dir, f"suite_{created:%Y%m%d_%H%M%S}.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    return results
+
+# Example usage:
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the scattering kernels, exports and ML training")
+    parser.add_argument("groups", nargs="*", default=list(GROUPS), help=f"any of {GROUPS}")
+    parser.add_argument("--quick", action="store_true", help="leave out the largest cases")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown flagged as a regression")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    args = parser.parse_args()
+
+    results = run_suite(args.groups, quick=args.quick, threshold=args.threshold)
+    baseline = load_baseline()
+    if baseline is not None and baseline["machine"] != machine_info():
+        print("Warning: the baseline was measured on a different machine or library versions")
+    print(results[["case", "median", "min", "baseline", "ratio", "status"]].to_string(index=False))
+    if args.save_baseline:
+        print("Baseline stored in", save_baseline(results))
+    elif (results["status"] == "slower").any():
+        sys.exit(1)
@@ -0,0 +1,380 @@
+import os
+import sys
+import json
+import numpy as np
+
+# The instrumentation layer lives in the Mie Scattering folder
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Mie Scattering"))
+from instrumentation import instrumented, span
+
+FORMAT_VERSION = 2
+
+# float32 keeps about 7 significant digits; non-zero values outside this range do not fit in it
+FLOAT32_RANGE = (float(np.finfo(np.float32).tiny), float(np.finfo(np.float32).max))
+
+def _uniform_grid(values, tolerance):
+    # Gives (start, step) when the values are start + step * arange(count) to within tolerance * step, else None
+    values = np.asarray(values, dtype=np.float64).ravel()
+    if values.size < 2 or not np.all(np.isfinite(values)):
+        return None
+    start, step = float(values[0]), float((values[-1] - values[0]) / (values.size - 1))
+    if step == 0 or np.abs(values - (start + step * np.arange(values.size))).max() > tolerance * abs(step):
+        return None
+    return start, step
+
+def _relative_error(values, decoded):
+    # Largest relative error of a round trip; zeros, infinities and NaNs must come back exactly
+    values = np.asarray(values, dtype=np.float64)
+    same = (decoded == values) | (np.isnan(values) & np.isnan(decoded))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        error = np.where(same, 0.0, np.abs(decoded - values) / np.abs(values))
+    return float(np.nan_to_num(error, nan=np.inf).max()) if error.size else 0.0
+
+def _grid_values(info, index):
+    # Values of a periodic grid column at the given row numbers
+    if info["count"] is not None:
+        index = index % info["count"]
+    return (info["start"] + info["step"] * index).astype(np.dtype(info["source_dtype"]))
+
+def _decode(info, values):
+    # Expands stored values (integer codes, float32 or log10) to the values that were written
+    if "categories" in info:
+        return np.asarray(info["categories"], dtype=info.get("label_dtype", object))[values]
+    encoding = info.get("encoding")
+    if encoding == "log10":
+        # -inf is stored for zero intensities and comes back as 0
+        return np.power(10.0, np.asarray(values, dtype=np.float64)).astype(np.dtype(info["source_dtype"]))
+    if encoding == "float32":
+        return np.asarray(values).astype(np.dtype(info["source_dtype"]))
+    return values
+
+class ColumnarWriter:
+    """
+    This class streams a table to disk as typed binary columns, chunk by chunk.\n
+    The table is a folder with one raw binary file per column, the fixed axes (e.g. the angle grid) as .npy files
+    and a metadata.json header with the dtypes, the number of rows and the sweep parameters. Columns may be
+    1-D (one value per row, e.g. the radius) or have trailing dimensions (e.g. one intensity curve per row).
+    String columns are stored as integer codes, with the labels kept in the header.\n
+    The compact mode stores large angular tables in about a half to a quarter of the space. Uniform axes and
+    the grid columns are kept as (start, step, count) in the header instead of on disk, non-negative float
+    columns (intensities) as float32 log10 values, other float columns as float32 and the label columns as
+    int16 codes. Every chunk is decoded again as it is written and a ValueError is raised when the round trip
+    is off by more than the tolerance; the largest error of every column is kept in the header. ColumnarTable
+    expands the columns again on read.\n
+    Input the parameters in the following format -\n
+    Args:
+        path : Folder of the table
+        metadata : Dictionary of parameters to record in the header (must be JSON serializable)
+        axes : Dictionary of 1-D arrays shared by all rows, e.g. {'theta_deg': theta_deg}
+        compact : Store the table in the compact mode
+        labels : Names of numeric columns to store as integer codes as well (e.g. a radius with few values)
+        grids : Names of 1-D columns that repeat one uniform grid (e.g. theta_deg of the 'Dataframe used for ML')
+        tolerance : Largest relative round-trip error of the compact mode (in steps for axes and grid columns)
+    """
+    def __init__(self, path, metadata=None, axes=None, compact=False, labels=(), grids=(), tolerance=1e-4):
+        self.path = path
+        self.metadata = dict(metadata or {})
+        self.compact = compact
+        self.labels = set(labels)
+        self.grids = set(grids)
+        self.tolerance = tolerance
+        self.columns = {}
+        self.rows = 0
+        os.makedirs(path, exist_ok=True)
+        for f in os.listdir(path):
+            if f.endswith(".bin") or f.endswith(".npy"):
+                os.remove(os.path.join(path, f))
+        self.axes = {}
+        for name, values in (axes or {}).items():
+            values = np.asarray(values)
+            grid = _uniform_grid(values, tolerance) if compact else None
+            if grid is not None:
+                self.axes[name] = {"start": grid[0], "step": grid[1], "count": int(values.size)}
+            else:
+                np.save(os.path.join(path, f"{name}.npy"), values)
+                self.axes[name] = int(values.size)
+        self._write_header()
+
+    def append(self, **columns):
+        """
+        This function appends one chunk of rows; every column must have the same number of rows.
+        """
+        lengths = {len(np.atleast_1d(values)) for values in columns.values()}
+        if len(lengths) != 1:
+            raise ValueError("All columns of a chunk must have the same number of rows")
+        if self.columns and set(columns) != set(self.columns):
+            raise ValueError(f"Expected the columns {sorted(self.columns)}, got {sorted(columns)}")
+
+        # Write every column, counting the bytes for the instrumentation
+        with span("ColumnarWriter.append", rows=next(iter(lengths)), bytes_written=0) as counters:
+            for name, values in columns.items():
+                values = np.atleast_1d(np.asarray(values))
+                info = self.columns.get(name)
+
+                # Grid columns are checked against their (start, step, count) and nothing is written
+                if name in self.grids:
+                    self.columns[name] = self._check_grid(name, values, info)
+                    continue
+
+                # Strings (and the label columns) become integer codes into a growing list of labels
+                if values.dtype.kind in "UOS" or name in self.labels:
+                    values, info = self._encode_labels(name, values, info)
+                if info is None:
+                    info = {"dtype": values.dtype.str, "shape": list(values.shape[1:])}
+                    if self.compact and values.dtype.kind == "f":
+                        # Intensities are non-negative and span decades, so they keep their precision as log10
+                        log10 = not np.any(values < 0)
+                        info = {"dtype": "<f4", "shape": info["shape"], "encoding": "log10" if log10 else "float32",
+                                "source_dtype": values.dtype.str, "max_error": 0.0}
+                if list(values.shape[1:]) != info["shape"]:
+                    raise ValueError(f"Column {name} has rows of shape {values.shape[1:]}, "
+                                     f"expected {tuple(info['shape'])}")
+                if info.get("encoding") in ("log10", "float32"):
+                    values = self._encode_float(name, values, info)
+                self.columns[name] = info
+
+                with open(os.path.join(self.path, f"{name}.bin"), "ab") as f:
+                    data = np.ascontiguousarray(values, dtype=np.dtype(info["dtype"])).tobytes()
+                    counters["bytes_written"] += f.write(data)
+
+        self.rows += lengths.pop()
+        self._write_header()
+
+    def _encode_labels(self, name, values, info):
+        # Integer codes of a string or label column, with the new labels added to the header
+        categories = info["categories"] if info else []
+        numeric = values.dtype.kind not in "UOS"
+        lookup = {label: code for code, label in enumerate(categories)}
+        codes = np.empty(values.shape, dtype=np.int16 if self.compact else np.int32)
+        for i, label in enumerate(values.ravel()):
+            label = label.item() if numeric else str(label)
+            if label not in lookup:
+                if len(categories) > np.iinfo(codes.dtype).max:
+                    raise ValueError(f"Column {name} has more than {np.iinfo(codes.dtype).max + 1} labels.\n"
+                                     "Store it without the compact mode or leave it out of labels")
+                lookup[label] = len(categories)
+                categories.append(label)
+            codes.ravel()[i] = lookup[label]
+        if info is None:
+            info = {"dtype": codes.dtype.str, "shape": list(values.shape[1:]), "categories": categories}
+            if numeric:
+                info["label_dtype"] = values.dtype.str
+        return codes, info
+
+    def _encode_float(self, name, values, info):
+        # float32 (or float32 log10) values of a chunk, checked by decoding them again
+        if info["encoding"] == "log10":
+            if np.any(values < 0):
+                raise ValueError(f"Column {name} has negative values and cannot be stored as log10.\n"
+                                 "Its first chunk was non-negative; store it without the compact mode")
+            with np.errstate(divide="ignore"):
+                stored = np.log10(values, dtype=np.float64).astype(np.float32)
+        else:
+            magnitude = np.abs(values[np.isfinite(values) & (values != 0)])
+            if magnitude.size and (magnitude.min() < FLOAT32_RANGE[0] or magnitude.max() > FLOAT32_RANGE[1]):
+                raise ValueError(f"Column {name} spans {magnitude.min():.3g} to {magnitude.max():.3g}, "
+                                 f"outside the float32 range {FLOAT32_RANGE[0]:.3g} to {FLOAT32_RANGE[1]:.3g}.\n"
+                                 "Store it without the compact mode")
+            stored = values.astype(np.float32)
+        error = _relative_error(values, _decode(info, stored))
+        if error > self.tolerance:
+            raise ValueError(f"Column {name} is off by up to {error:.3g} after the compact round trip, "
+                             f"more than the tolerance {self.tolerance:g}")
+        info["max_error"] = max(info["max_error"], error)
+        return stored
+
+    def _check_grid(self, name, values, info):
+        # Header of a grid column: value = start + step * (row % count), with count found at the first repeat
+        if values.ndim != 1:
+            raise ValueError(f"Grid column {name} must be 1-D")
+        index = self.rows + np.arange(values.size)
+        if info is None:
+            # The grid runs up to the first value that is not above the one before (the start of a repeat)
+            values_f = np.asarray(values, dtype=np.float64)
+            repeat = np.flatnonzero(np.diff(values_f) <= 0)
+            run = values_f[:repeat[0] + 1] if repeat.size else values_f
+            grid = _uniform_grid(run, self.tolerance)
+            if grid is None:
+                raise ValueError(f"Column {name} is not a uniform grid (it needs two or more increasing values "
+                                 "in the first chunk)")
+            info = {"dtype": None, "shape": [], "encoding": "grid", "start": grid[0], "step": grid[1],
+                    "count": int(repeat[0] + 1) if repeat.size else None, "source_dtype": values.dtype.str,
+                    "max_error": 0.0}
+        elif info["count"] is None:
+            # The first repeat in a later chunk fixes the period
+            wrap = np.flatnonzero(np.abs(values - info["start"]) <= self.tolerance * abs(info["step"]))
+            wrap = wrap[index[wrap] > 0]
+            if wrap.size:
+                info["count"] = int(index[wrap[0]])
+        error = float(np.abs(values - _grid_values(info, index)).max()) / abs(info["step"])
+        if not error <= self.tolerance:
+            raise ValueError(f"Column {name} is off its grid by up to {error:.3g} steps, "
+                             f"more than the tolerance {self.tolerance:g}")
+        info["max_error"] = max(info["max_error"], error)
+        return info
+
+    def _write_header(self):
+        # Rewrite the header after every chunk, so a stream that is cut short is still readable
+        header = {"version": FORMAT_VERSION, "rows": self.rows, "columns": self.columns,
+                  "axes": self.axes, "metadata": self.metadata}
+        tmp_path = os.path.join(self.path, "metadata.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(header, f, indent=1)
+        os.replace(tmp_path, os.path.join(self.path, "metadata.json"))
+
+    def close(self):
+        self._write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ColumnarTable:
+    """
+    This class opens a table written by ColumnarWriter with every column memory-mapped (read-only, zero-copy).
+    Compact tables are expanded as the columns are read: implicit axes and grid columns are rebuilt and float32
+    or log10 values come back in their original dtype.\n
+    Args:
+        path : Folder of the table
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "metadata.json")) as f:
+            header = json.load(f)
+        if header["version"] not in (1, FORMAT_VERSION):
+            raise ValueError(f"Unsupported table version {header['version']}")
+        self.rows = header["rows"]
+        self.metadata = header["metadata"]
+        self.info = header["columns"]
+        self.axes = {}
+        for name, axis in header["axes"].items():
+            if isinstance(axis, dict):
+                self.axes[name] = axis["start"] + axis["step"] * np.arange(axis["count"])
+            else:
+                self.axes[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        self.columns = {}
+        for name, info in self.info.items():
+            shape = (self.rows,) + tuple(info["shape"])
+            if info.get("encoding") == "grid":
+                # Nothing is stored, the values are rebuilt from the row numbers
+                self.columns[name] = None
+            elif self.rows == 0:
+                self.columns[name] = np.empty(shape, dtype=np.dtype(info["dtype"]))
+            else:
+                self.columns[name] = np.memmap(os.path.join(path, f"{name}.bin"), dtype=np.dtype(info["dtype"]),
+                                               mode="r", shape=shape)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def column(self, name, decode=True):
+        """
+        This function gives a column; string and compact columns are decoded unless decode is False.
+        """
+        return self.select(name, decode=decode)
+
+    def angle_slice(self, lo, hi, axis="theta_deg"):
+        """
+        This function gives the slice of a sorted axis with lo <= value <= hi, for zero-copy slicing of curves.
+        """
+        values = self.axes[axis]
+        return slice(int(np.searchsorted(values, lo, side="left")), int(np.searchsorted(values, hi, side="right")))
+
+    def select(self, name, rows=None, angles=None, axis="theta_deg", decode=True):
+        """
+        This function gives a column restricted to some rows and an angle range. The selection is made on the
+        stored values before they are decoded, so only the selected part of a compact column is expanded.\n
+        Args:
+            name : Column name
+            rows : Row index, slice or boolean mask (e.g. table['r_um'] == 10)
+            angles : (lo, hi) range on the axis, applied to the trailing dimension
+            decode : Decode string and compact columns (False gives the stored codes and float32 values as a view)
+        """
+        info = self.info[name]
+        if info.get("encoding") == "grid":
+            index = np.arange(self.rows)
+            return _grid_values(info, index if rows is None else index[rows])
+        values = self.columns[name]
+        if rows is not None:
+            values = values[rows]
+        if angles is not None:
+            values = values[..., self.angle_slice(angles[0], angles[1], axis)]
+        return _decode(info, values) if decode else values
+
+    def to_pandas(self):
+        """
+        This function gives the 1-D columns as a pandas DataFrame.
+        """
+        import pandas as pd
+        return pd.DataFrame({name: self.column(name) for name, info in self.info.items() if not info["shape"]})
+
+@instrumented("write_table")
+def write_table(path, columns, metadata=None, axes=None, compact=False, labels=(), grids=(), tolerance=1e-4):
+    """
+    This function writes a whole table in one call (see ColumnarWriter for the compact mode).
+    """
+    with ColumnarWriter(path, metadata, axes, compact, labels, grids, tolerance) as writer:
+        writer.append(**columns)
+    return path
+
+def open_table(path):
+    """
+    This function opens a table written by ColumnarWriter or write_table.
+    """
+    return ColumnarTable(path)
+
+@instrumented("to_parquet", lambda result, *args, **kwargs: {"bytes_written": os.path.getsize(result)})
+def to_parquet(path, parquet_path):
+    """
+    This function converts the 1-D columns of a table to a Parquet file (needs pyarrow).
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("pyarrow is needed for Parquet export.\nInstall it with pip install pyarrow")
+    table = ColumnarTable(path)
+    arrays = {}
+    for name, info in table.info.items():
+        if info["shape"]:
+            continue
+        if "categories" in info:
+            arrays[name] = pa.DictionaryArray.from_arrays(np.asarray(table.columns[name]), info["categories"])
+        else:
+            arrays[name] = pa.array(np.asarray(table.column(name)))
+    schema_metadata = {"metadata": json.dumps(table.metadata)}
+    pq.write_table(pa.table(arrays).replace_schema_metadata(schema_metadata), parquet_path)
+    return parquet_path
+
+def convert_csv(csv_path, path, chunksize=100000, metadata=None, compact=False, labels=(), grids=(),
+                tolerance=1e-4):
+    """
+    This function converts a CSV table (e.g. 'Dataframe used for ML') to a columnar table, chunk by chunk.
+    For the compact mode see ColumnarWriter, e.g. grids=('theta_deg',) for the ML tables.
+    """
+    import pandas as pd
+    with ColumnarWriter(path, metadata, compact=compact, labels=labels, grids=grids, tolerance=tolerance) as writer:
+        for chunk in pd.read_csv(csv_path, index_col=0, chunksize=chunksize):
+            writer.append(**{name: chunk[name].to_numpy() for name in chunk.columns})
+    return path
+
+# Example usage:
+if __name__ == "__main__":
+    theta_deg = np.arange(0, 180.1, 0.1)
+    with ColumnarWriter("example_table", metadata={"wavelength_nm": 632}, axes={"theta_deg": theta_deg}) as writer:
+        for r_um in [1, 5, 10]:
+            writer.append(r_um=[r_um], SL=np.cos(np.deg2rad(theta_deg))[np.newaxis, :]**2 * r_um)
+
+    table = open_table("example_table")
+    print(table.select("SL", rows=table["r_um"] == 5, angles=(30, 40)).shape)
+
+    # The same table in the compact mode: implicit angles, log10 float32 curves and int16 radius codes
+    SL = np.cos(np.deg2rad(theta_deg))[np.newaxis, :]**2 * np.array([[1], [5], [10]])
+    write_table("example_table_compact", {"r_um": [1, 5, 10], "SL": SL},
+                axes={"theta_deg": theta_deg}, compact=True, labels=("r_um",))
+    print(open_table("example_table_compact").info["SL"]["max_error"])
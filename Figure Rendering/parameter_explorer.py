@@ -0,0 +1,317 @@
+import os
+import sys
+import time
+from abc import ABC, abstractmethod
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.widgets import Slider
+
+# The Mie engine and the Rayleigh kernel live in their own folders
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(_root, "Mie Scattering"))
+sys.path.append(os.path.join(_root, "Rayleigh Scattering"))
+from mie_engine import mie_n_max, mie_ab, mie_pi_tau, scattering_angles
+from mie_cache import MieCache
+from rayleigh_kernel import rayleigh_intensity
+
+def _limits(y, current, log):
+    # New y limits for the curves y, or None while the current limits still fit them. The limits are padded
+    # (one decade on log axes) so that small slider moves are drawn by blitting only
+    y = y[np.isfinite(y)]
+    if log:
+        y = y[y > 0]
+    if y.size == 0:
+        return None
+    lo, hi = y.min(), y.max()
+    if log:
+        lo = max(lo, hi * 1e-8)
+        if current[0] <= lo and hi <= current[1] and hi > current[1] * 1e-3:
+            return None
+        return 10.0**(np.floor(np.log10(lo)) - 1), 10.0**(np.ceil(np.log10(hi)) + 1)
+    if current[0] <= min(lo, 0) and hi <= current[1] and hi > current[1] / 4:
+        return None
+    return min(lo, 0), 1.5 * hi
+
+class SliderExplorer(ABC):
+    """
+    This class is the common part of the explorers: a figure with parameter sliders whose curves are updated in
+    place.\n
+    Slider moves are throttled: the first move is drawn at once and the moves that arrive during the next
+    interval seconds are merged into one update with the latest slider values. The curves are animated artists
+    drawn over a saved background (blitting), so an update only redraws the curves and the moved slider; the whole
+    figure is redrawn only when the curves leave the current axis limits. The time from every slider move to
+    the end of its redraw is kept in latencies.\n
+    Subclasses create the curves with animated=True, put them in self.artists and implement update(values,
+    changed), which sets the new curve data and gives True when the axis limits changed. A subclass without
+    update cannot be instantiated.
+    """
+    def __init__(self, fig, sliders, interval=0.02):
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.interval = interval
+        self.artists = []
+        self.background = None
+        self.latencies = []
+        self._last = {}
+        self._requested = None
+        self._waiting = False
+        self._pending = False
+
+        # One slider per parameter, below the plots
+        self.sliders = {}
+        for i, (name, label, lo, hi, value) in enumerate(reversed(sliders)):
+            slider = Slider(fig.add_axes([0.2, 0.02 + 0.04 * i, 0.6, 0.025]), label, lo, hi, valinit=value,
+                            valfmt="%.4g")
+            slider.drawon = False
+            slider.on_changed(self._on_change)
+            self.sliders[name] = slider
+
+        self._timer = None
+        if interval:
+            self._timer = self.canvas.new_timer(interval=int(1000 * interval))
+            self._timer.single_shot = True
+            self._timer.add_callback(self._on_timer)
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+
+    def values(self):
+        """
+        This function gives the current slider values.
+        """
+        return {name: slider.val for name, slider in self.sliders.items()}
+
+    @abstractmethod
+    def update(self, values, changed):
+        """
+        This function sets the curve data for the slider values (a dictionary) and the names of the changed
+        sliders, and gives True when the axis limits changed.
+        """
+
+    def _on_change(self, value):
+        if self._requested is None:
+            self._requested = time.perf_counter()
+        if self._timer is None:
+            self.refresh()
+        elif self._waiting:
+            self._pending = True
+        else:
+            self.refresh()
+            self._waiting = True
+            self._timer.start()
+
+    def _on_timer(self):
+        # End of a throttle interval: draw the merged moves, if any, and start the next interval
+        if self._pending:
+            self._pending = False
+            self.refresh()
+            self._timer.start()
+        else:
+            self._waiting = False
+
+    def refresh(self):
+        """
+        This function recomputes the curves whose parameters changed and redraws them.
+        """
+        values = self.values()
+        changed = {name for name, value in values.items() if self._last.get(name) != value}
+        self._last = values
+        if self.update(values, changed) or self.background is None:
+            self.canvas.draw_idle()
+            return
+        # Moved sliders become part of the background, the curves are drawn over it
+        self.canvas.restore_region(self.background)
+        for name in changed:
+            self.fig.draw_artist(self.sliders[name].ax)
+        if changed:
+            self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self.artists:
+            artist.axes.draw_artist(artist)
+        self.canvas.blit(self.fig.bbox)
+        self._done()
+
+    def _on_draw(self, event):
+        # Save the background without the animated curves after every full redraw, then draw the curves on it
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self.artists:
+            artist.axes.draw_artist(artist)
+        self.canvas.blit(self.fig.bbox)
+        self._done()
+
+    def _done(self):
+        if self._requested is not None:
+            self.latencies.append(time.perf_counter() - self._requested)
+            self._requested = None
+
+    def latency_summary(self):
+        """
+        This function gives the median, 99th percentile and largest slider-to-redraw time in milliseconds.
+        """
+        if not self.latencies:
+            return {}
+        latencies = 1000 * np.array(self.latencies)
+        return {"p50": np.percentile(latencies, 50), "p99": np.percentile(latencies, 99), "max": latencies.max()}
+
+    def show(self):
+        plt.show()
+
+class MieExplorer(SliderExplorer):
+    """
+    This class is an interactive version of mie_int_vs_angle.py: SL and SR of one particle against the
+    scattering angle, with sliders for the wavelength, the radius and the real and imaginary parts of m.\n
+    The angular functions pi_n and tau_n depend only on the angle grid, so they are computed once, for the
+    largest number of series terms the slider ranges can need. A slider move then only computes the Mie
+    coefficients a_n and b_n and sums the series with one matrix product per angular table. The curves go
+    through a MieCache, so that moving back is free (and, with mie_cache.default_cache(), so are the curves of
+    earlier sessions and scripts).\n
+    Input the parameters in the following format -\n
+    Args:
+        m : Initial refractive index of the particle
+        wavelength : Initial wavelength of light in nanometers
+        radius : Initial radius of the particle in micrometers
+        nMedium : Refractive index of the surrounding medium
+        minAngle, maxAngle, angularResolution : Angle range and step in degrees
+        wavelength_range, radius_range, m_real_range, m_imag_range : Slider ranges
+        interval : Throttle interval in seconds (0 draws every slider move)
+        cache : MieCache of the curves (defaults to an in-memory one)
+    """
+    def __init__(self, m=1.33257 + 1.67e-8j, wavelength=632, radius=10, nMedium=1.0, minAngle=0, maxAngle=180,
+                 angularResolution=0.1, wavelength_range=(400, 800), radius_range=(0.01, 50),
+                 m_real_range=(1.0, 2.0), m_imag_range=(0, 0.1), interval=0.02, cache=None):
+        self.nMedium = np.real(nMedium)
+        self.cache = cache if cache is not None else MieCache()
+
+        # Angular functions for the largest series the sliders can need
+        _, theta, _ = scattering_angles(minAngle, maxAngle, angularResolution)
+        self.theta_deg = np.rad2deg(theta)
+        self.grid = (self.theta_deg[0], (self.theta_deg[-1] - self.theta_deg[0]) / max(self.theta_deg.size - 1, 1),
+                     self.theta_deg.size)
+        x_max = 2 * np.pi * radius_range[1] * 1000 / (wavelength_range[0] / self.nMedium)
+        self.pin, self.taun = mie_pi_tau(np.cos(theta), int(mie_n_max(x_max)))
+        n = np.arange(1, self.pin.shape[0] + 1)
+        self.n2 = (2 * n + 1) / (n * (n + 1))
+
+        fig, self.ax = plt.subplots(figsize=(10, 8))
+        fig.subplots_adjust(bottom=0.3)
+        super().__init__(fig, [("wavelength", "Wavelength λ (nm)", *wavelength_range, wavelength),
+                               ("radius", "Radius r (µm)", *radius_range, radius),
+                               ("m_real", "Re(m)", *m_real_range, np.real(m)),
+                               ("m_imag", "Im(m)", *m_imag_range, np.imag(m))], interval)
+
+        self.ax.set_yscale("log")
+        self.SR_line, = self.ax.plot(self.theta_deg, np.ones_like(theta), "g--", lw=1, label="Parallel Polarization",
+                                     animated=True)
+        self.SL_line, = self.ax.plot(self.theta_deg, np.ones_like(theta), "g", lw=1,
+                                     label="Perpendicular Polarization", animated=True)
+        self.text = self.ax.text(0.02, 0.03, "", transform=self.ax.transAxes, animated=True)
+        self.artists = [self.SR_line, self.SL_line, self.text]
+        self.ax.set_xlim(minAngle, maxAngle)
+        self.ax.set_xticks(np.arange(0, 181, 30))
+        self.ax.tick_params(which="both", direction="in")
+        self.ax.set_xlabel("Scattering angle(ϴ)", fontsize=16)
+        self.ax.set_ylabel("Intensity ($\\mathregular{|S|^2}$)", fontsize=16, labelpad=10)
+        self.ax.legend(loc="upper right")
+        self.ax.set_title("Scattering Intensity Functions", fontsize=18)
+        self.refresh()
+
+    def intensity(self, m, wavelength, radius):
+        """
+        This function gives SL and SR of one particle (m of the particle, wavelength in nm, radius in um), from the
+        cache when the same particle was seen before.
+        """
+        diameter = 2000 * radius
+        tables = self.cache.lookup(m, wavelength, diameter, self.nMedium, *self.grid)
+        if tables is not None:
+            return tables
+        an, bn = mie_ab(m / self.nMedium, np.pi * diameter / (wavelength / self.nMedium))
+        n = an.shape[1]
+        a = an[0] * self.n2[:n]
+        b = bn[0] * self.n2[:n]
+
+        # S1 and S2 from one real matrix product with each of the pi_n and tau_n tables
+        C = np.vstack([a.real, a.imag, b.real, b.imag])
+        P = C @ self.pin[:n]
+        T = C @ self.taun[:n]
+        S1 = P[:2] + T[2:]
+        S2 = T[:2] + P[2:]
+        SL = S1[0]**2 + S1[1]**2
+        SR = S2[0]**2 + S2[1]**2
+        self.cache.store(m, wavelength, diameter, self.nMedium, self.grid[0], self.grid[1], SL, SR)
+        return SL, SR
+
+    def update(self, values, changed):
+        SL, SR = self.intensity(complex(values["m_real"], values["m_imag"]), values["wavelength"], values["radius"])
+        x = 2 * np.pi * values["radius"] * 1000 / (values["wavelength"] / self.nMedium)
+        self.SL_line.set_ydata(SL)
+        self.SR_line.set_ydata(SR)
+        self.text.set_text(f"x = {x:.2f}, {mie_n_max(x)} terms")
+
+        limits = _limits(np.concatenate([SL, SR]), self.ax.get_ylim(), log=True)
+        if limits is not None:
+            self.ax.set_ylim(limits)
+        return limits is not None
+
+class RayleighExplorer(SliderExplorer):
+    """
+    This class is an interactive version of rayleigh_intensity.py: the parallel and perpendicular Rayleigh
+    intensity on linear and log scales, with sliders for λ, r, n, d and I_0.\n
+    The angular part cos^2(theta) is computed once; a slider move only evaluates the angle independent prefactor
+    with the Rayleigh kernel and rescales the cached angular part.\n
+    Input the parameters in the following format -\n
+    Args:
+        lambda_nm, I_0, r_um, n, d_cm : Initial parameters, as in rayleigh_intensity.py
+        lambda_range, I_0_range, r_range, n_range, d_range : Slider ranges
+        interval : Throttle interval in seconds (0 draws every slider move)
+    """
+    def __init__(self, lambda_nm=650, I_0=1, r_um=0.01, n=1.33257, d_cm=4, lambda_range=(400, 800),
+                 I_0_range=(0.1, 10), r_range=(0.001, 0.2), n_range=(1.0, 2.0), d_range=(1, 10), interval=0.02):
+        self.theta_degrees = np.linspace(0, 180, 1000)
+        self.cos2_theta = np.cos(np.deg2rad(self.theta_degrees))**2
+
+        fig, self.axs = plt.subplots(1, 2, figsize=(14, 8))
+        fig.subplots_adjust(bottom=0.35)
+        fig.suptitle("Rayleigh Scattering Intensity vs Scattering Angle", fontsize=16)
+        super().__init__(fig, [("lambda_nm", "λ (nm)", *lambda_range, lambda_nm),
+                               ("r_um", "Radius r (µm)", *r_range, r_um),
+                               ("n", "Ref. Index n", *n_range, n),
+                               ("d_cm", "Distance d (cm)", *d_range, d_cm),
+                               ("I_0", "$I_0$ (W/m²)", *I_0_range, I_0)], interval)
+
+        self.lines = []
+        for ax, title in zip(self.axs, ("Linear Scale", "Log Scale")):
+            if title == "Log Scale":
+                ax.set_yscale("log")
+            parallel, = ax.plot(self.theta_degrees, self.cos2_theta, color="red", label="Parallel Polarization",
+                                animated=True)
+            perpendicular, = ax.plot(self.theta_degrees, np.ones_like(self.cos2_theta), color="red",
+                                     linestyle="--", label="Perpendicular Polarization", animated=True)
+            self.lines.append((parallel, perpendicular))
+            ax.set_xlabel("Scattering Angle (degrees)")
+            ax.set_ylabel("Intensity" if title == "Linear Scale" else "Intensity (log scale)")
+            ax.set_xlim(0, 180)
+            ax.set_xticks(np.arange(0, 181, 30))
+            ax.tick_params(which="both", direction="in")
+            ax.set_title(title, fontweight="bold")
+            ax.legend(loc="lower left", frameon=False, prop={"size": 8})
+        self.artists = [line for pair in self.lines for line in pair]
+        self.refresh()
+
+    def update(self, values, changed):
+        # Prefactor = perpendicular intensity, the same at every angle
+        _, prefactor, _, _ = rayleigh_intensity(values["lambda_nm"], values["I_0"], values["r_um"], values["n"],
+                                                values["d_cm"], 0)
+        parallel = prefactor * self.cos2_theta
+        perpendicular = np.full_like(self.cos2_theta, prefactor)
+        rescaled = False
+        for ax, (parallel_line, perpendicular_line) in zip(self.axs, self.lines):
+            parallel_line.set_ydata(parallel)
+            perpendicular_line.set_ydata(perpendicular)
+            limits = _limits(np.concatenate([parallel, perpendicular]), ax.get_ylim(), ax.get_yscale() == "log")
+            if limits is not None:
+                ax.set_ylim(limits)
+                rescaled = True
+        return rescaled
+
+# Example usage:
+if __name__ == "__main__":
+    explorer = MieExplorer(radius=10)
+    explorer.show()
+    print("slider to redraw (ms):", explorer.latency_summary())
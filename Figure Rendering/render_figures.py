@@ -0,0 +1,441 @@
+import os
+import sys
+import json
+import math
+import multiprocessing as mp
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+# The Mie engine and the Rayleigh kernel live in their own folders
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(_root, "Mie Scattering"))
+sys.path.append(os.path.join(_root, "Rayleigh Scattering"))
+from mie_cache import cached_batch_scattering_function
+from mie_sweep import estimate_cost, schedule_tasks
+from rayleigh_kernel import rayleigh_intensity
+
+# Templates and output settings of a render worker, set up by _init_worker
+_worker = {}
+
+FORMATS = ("png", "svg", "pdf")
+
+# Angle grids (degrees) used by the scripts: PyMieScatt.ScatteringFunction's default grid for Mie, and the two
+# grids of the Rayleigh scripts
+MIE_ANGLES = {"minAngle": 0, "maxAngle": 180, "angularResolution": 0.5}
+RAYLEIGH_GRIDS = {"linspace": np.linspace(0, 180, 1000), "arange": np.arange(0, 180.1, 0.1)}
+
+# Parameters hard-coded in the scripts, used for every parameter a spec leaves out
+M_WATER = 1.33257 + 1.67e-8j
+DEFAULTS = {
+    "mie_int_vs_angle": {"m": M_WATER, "w": 532, "r": 1000},
+    "mie_int_vs_angle_combined": {"m": M_WATER, "w": 650, "r": 1000},
+    "mie_diff_r": {"m": M_WATER, "w": 650, "radii": [500, 5000, 50000]},
+    "mie_r_10-50": {"m": M_WATER, "w": 800, "radii": [10, 20, 25, 30, 40, 50]},
+    "mie_int_diff_wavelength": {"m": M_WATER, "r": 1000, "wavelengths": [532, 650, 800]},
+    "rayleigh_intensity": {"lambda_nm": 650, "I_0": 1, "r_um": 0.01, "n": 1.33257, "d_cm": 4},
+    "rayleigh_intensity_diff_d": {"lambda_nm": 650, "I_0": 1, "r_um": 0.01, "n": 1.33257,
+                                  "d_cm_values": [1, 2, 3, 4, 5]},
+    "rayleigh_intensity_diff_r": {"lambda_nm": 650, "I_0": 1, "d_cm": 4, "n": 1.33257,
+                                  "r_um_values": [0.0001, 0.001, 0.01, 0.1]},
+    "rayleigh_intensity_diff_wavelength": {"wavelengths": [532, 650, 800], "r_um": 0.01, "n": 1.33257, "I_0": 1,
+                                           "d_cm": 4},
+    "rayleigh_stheta": {"lambda_nm": 650, "r_um": 0.01, "n": 1.33257},
+}
+
+# Static part of every figure: size, panels, table placement and where the title goes
+_intensity_label = "Intensity ($\\mathregular{|S|^2}$)"
+_linear_log = [
+    {"xlabel": "Scattering Angle (degrees)", "ylabel": "Intensity", "title": "Linear Scale",
+     "legend": {"loc": "lower left", "frameon": False, "prop": {"size": 8}}},
+    {"xlabel": "Scattering Angle (degrees)", "ylabel": "Intensity (log scale)", "title": "Log Scale", "log": True,
+     "legend": {"loc": "lower left", "frameon": False, "prop": {"size": 8}}},
+]
+LAYOUTS = {
+    "mie_int_vs_angle": {
+        "figsize": (10, 6), "title": "axes",
+        "panels": [{"xlabel": "Scattering angle(ϴ)", "ylabel": _intensity_label, "log": True, "fontsize": 16,
+                    "legend": {}}],
+        "table": {"colWidths": [0.16, 0.16], "colLabels": True, "loc": "lower left"}},
+    "mie_int_vs_angle_combined": {
+        "figsize": (12, 10), "grid": (2, 2),
+        "panels": [{"ylabel": "Intensity ($|S_R|^2$)", "log": True, "legend": {}},
+                   {"ylabel": "Intensity ($|S_L|^2$)", "log": True, "legend": {}},
+                   {"xlabel": "Scattering angle (θ) [degrees]", "ylabel": "Intensity ($|S_U|^2$)", "log": True,
+                    "legend": {}},
+                   {"xlabel": "Scattering angle (θ) [degrees]", "ylabel": "Intensity", "log": True, "legend": {}}]},
+    "mie_diff_r": {
+        "figsize": (10, 6), "title": "axes",
+        "panels": [{"xlabel": "Scattering angle (ϴ)", "ylabel": _intensity_label, "log": True, "fontsize": 16,
+                    "legend": {}}],
+        "table": {"colWidths": [0.16, 0.17], "loc": "lower left"}},
+    "mie_r_10-50": {
+        "figsize": (10, 6), "title": "axes",
+        "panels": [{"xlabel": "Scattering angle (ϴ)", "ylabel": _intensity_label, "log": True, "fontsize": 16,
+                    "legend": {"loc": "upper right"}}]},
+    "mie_int_diff_wavelength": {
+        "figsize": (12, 8), "title": "axes",
+        "panels": [{"xlabel": "Scattering angle (ϴ)", "ylabel": "Intensity ($|S|^2$)", "log": True, "fontsize": 16,
+                    "legend": {}}],
+        "table": {"colWidths": [0.16, 0.16], "colLabels": True, "loc": "lower left",
+                  "bbox": [0.015, 0.015, 0.24, 0.2]}},
+    "rayleigh_intensity": {
+        "figsize": (14, 6), "grid": (1, 2), "title": "suptitle", "rect": [0, 0, 1, 0.95], "panels": _linear_log,
+        "table": {"panel": 1, "colWidths": [0.25, 0.15], "loc": "lower right"}},
+    "rayleigh_intensity_diff_d": {
+        "figsize": (10, 6), "title": "axes",
+        "panels": [{"xlabel": "Scattering Angle (degrees)", "ylabel": "Intensity", "legend": {}}],
+        "table": {"colWidths": [0.2, 0.1], "colLabels": True, "loc": "upper center"}},
+    "rayleigh_intensity_diff_r": {
+        "figsize": (14, 6), "grid": (1, 2),
+        "panels": [{"xlabel": "Scattering Angle (degrees)", "ylabel": "Intensity", "title": "Linear Scale",
+                    "legend": {}},
+                   {"xlabel": "Scattering Angle (degrees)", "title": "Log Scale", "log": True, "legend": {}}],
+        "table": {"panel": 1, "colWidths": [0.25, 0.15], "colLabels": True, "loc": "lower right"}},
+    "rayleigh_intensity_diff_wavelength": {
+        "figsize": (16, 6), "grid": (1, 2),
+        "panels": [dict(_linear_log[0], legend={"frameon": False}), dict(_linear_log[1], legend={"frameon": False})],
+        "table": {"panel": 1, "colWidths": [0.25, 0.15], "loc": "lower right"}},
+    "rayleigh_stheta": {
+        "figsize": (14, 6), "grid": (1, 2), "title": "suptitle", "rect": [0, 0, 1, 0.95],
+        "panels": [dict(panel, ylabel="$|S(θ)|^2$") for panel in _linear_log],
+        "table": {"panel": 1, "colWidths": [0.25, 0.15], "colLabels": True, "loc": "lower right"}},
+}
+
+def _complex(value):
+    # Refractive indices may be given as numbers, strings ("1.33+1e-8j") or [real, imaginary] pairs in JSON specs
+    if isinstance(value, (list, tuple)):
+        return complex(value[0], value[1])
+    return complex(value)
+
+def _parameters(spec):
+    # Plot type and full parameter set of a spec
+    plot = spec.get("plot") or os.path.splitext(os.path.basename(spec["script"]))[0]
+    if plot not in DEFAULTS:
+        raise ValueError(f"Unknown plot type {plot}.\nUse one of {sorted(DEFAULTS)}")
+    p = dict(DEFAULTS[plot])
+    p.update({key: value for key, value in spec.items() if key not in ("plot", "script", "name")})
+    if "m" in p:
+        p["m"] = _complex(p["m"])
+    return plot, p
+
+def curve_keys(plot, p):
+    """
+    This function gives the keys of the curves a figure needs. Figures that share a key share its data.\n
+    Mie keys are ('mie', m, wavelength in nm, diameter in nm), Rayleigh keys ('rayleigh', angle grid, lambda_nm,
+    I_0, r_um, n, d_cm) and the amplitude curves of rayleigh_stheta ('stheta', lambda_nm, r_um, n).
+    """
+    if plot in ("mie_int_vs_angle", "mie_int_vs_angle_combined"):
+        return [("mie", p["m"], float(p["w"]), 2.0 * p["r"])]
+    if plot == "mie_diff_r":
+        return [("mie", p["m"], float(p["w"]), 2.0 * r) for r in p["radii"]]
+    if plot == "mie_r_10-50":
+        return [("mie", p["m"], float(p["w"]), 2000.0 * r) for r in p["radii"]]
+    if plot == "mie_int_diff_wavelength":
+        return [("mie", p["m"], float(w), 2.0 * p["r"]) for w in p["wavelengths"]]
+    if plot == "rayleigh_intensity":
+        return [("rayleigh", "linspace", p["lambda_nm"], p["I_0"], p["r_um"], p["n"], p["d_cm"])]
+    if plot == "rayleigh_intensity_diff_d":
+        return [("rayleigh", "arange", p["lambda_nm"], p["I_0"], p["r_um"], p["n"], d) for d in p["d_cm_values"]]
+    if plot == "rayleigh_intensity_diff_r":
+        return [("rayleigh", "arange", p["lambda_nm"], p["I_0"], r, p["n"], p["d_cm"]) for r in p["r_um_values"]]
+    if plot == "rayleigh_intensity_diff_wavelength":
+        return [("rayleigh", "linspace", w, p["I_0"], p["r_um"], p["n"], p["d_cm"]) for w in p["wavelengths"]]
+    return [("stheta", p["lambda_nm"], p["r_um"], p["n"])]
+
+def _mie_curves(keys):
+    # SL, SR and SU of a group of Mie keys in one batched engine call, for the keys missing from the Mie cache
+    m, wavelength, diameter = (np.array(values) for values in zip(*[key[1:] for key in keys]))
+    _, SL, SR, SU = cached_batch_scattering_function(m, wavelength, diameter, **MIE_ANGLES)
+    return list(zip(SL, SR, SU))
+
+def compute_curves(keys, pool=None, processes=1):
+    """
+    This function computes the data of every unique curve key once.\n
+    The Mie curves are split into groups of similar cost (mie_sweep.schedule_tasks) that are evaluated with the
+    batched engine through the Mie cache (mie_cache.default_cache, shared on disk by the workers and later runs), in
+    the pool if one is given. The Rayleigh curves are evaluated in one broadcast pass per angle
+    grid with the Rayleigh kernel.\n
+    Returns:
+        Dictionary key -> tuple of curves: (SL, SR, SU) for Mie, (parallel, perpendicular) for Rayleigh and
+        (S1^2, S2^2) for rayleigh_stheta
+    """
+    keys = list(dict.fromkeys(keys))
+    curves = {}
+
+    # Mie curves, largest first in groups of similar cost
+    mie = [key for key in keys if key[0] == "mie"]
+    if mie:
+        n_angles = int(round((MIE_ANGLES["maxAngle"] - MIE_ANGLES["minAngle"]) / MIE_ANGLES["angularResolution"])) + 1
+        m, wavelength, diameter = (np.array(values) for values in zip(*[key[1:] for key in mie]))
+        groups = [[mie[i] for i in group]
+                  for group in schedule_tasks(estimate_cost(m, wavelength, diameter, n_angles), processes)]
+        results = pool.map(_mie_curves, groups) if pool is not None else map(_mie_curves, groups)
+        for group, result in zip(groups, results):
+            curves.update(zip(group, result))
+
+    # Rayleigh curves, one pass per angle grid
+    for grid, theta_degrees in RAYLEIGH_GRIDS.items():
+        part = [key for key in keys if key[0] == "rayleigh" and key[1] == grid]
+        if not part:
+            continue
+        lambda_nm, I_0, r_um, n, d_cm = (np.array(values, dtype=float)[:, np.newaxis]
+                                         for values in zip(*[key[2:] for key in part]))
+        parallel, perpendicular, _, valid = rayleigh_intensity(lambda_nm, I_0, r_um, n, d_cm, theta_degrees)
+        if not valid.all():
+            raise ValueError("Rayleigh scattering condition not satisfied.\n Radius of particle r should not be greater than the wavelength of light λ")
+        curves.update(zip(part, zip(parallel, perpendicular)))
+
+    # Amplitudes of rayleigh_stheta
+    theta_radians = np.deg2rad(RAYLEIGH_GRIDS["linspace"])
+    for key in keys:
+        if key[0] == "stheta":
+            _, lambda_nm, r_um, n = key
+            if r_um * 1e-6 >= lambda_nm * 1e-9:
+                raise ValueError("Rayleigh scattering condition not satisfied.\n Radius of particle r should not be greater than the wavelength of light λ")
+            S1 = (2 * np.pi * r_um * 1e-6 / (lambda_nm * 1e-9))**2 * (n**2 - 1) / (n**2 + 2)
+            curves[key] = (np.full(theta_radians.shape, S1**2), (S1 * np.cos(theta_radians))**2)
+    return curves
+
+def figure_content(plot, p, curves):
+    """
+    This function gives the variable part of a figure: its lines as (panel, x, y, label, style), the table rows
+    and the title, from the parameters and the curves of its keys (in curve_keys order).
+    """
+    mie_x = np.arange(MIE_ANGLES["minAngle"], MIE_ANGLES["maxAngle"] + 1e-9, MIE_ANGLES["angularResolution"])
+    content = {"lines": [], "table": [], "title": ""}
+    lines = content["lines"]
+
+    if plot == "mie_int_vs_angle":
+        SL, SR, _ = curves[0]
+        lines += [(0, mie_x, SR, "Parallel Polarization", {"color": "g", "linestyle": "--", "lw": 1}),
+                  (0, mie_x, SL, "Perpendicular Polarization", {"color": "g", "lw": 1})]
+        content["table"] = [["Wavelength λ", f" {p['w']} nm"], ["Radius of particle(r)", f"{p['r'] / 1000} µm"],
+                            ["Ref. Index(m)", p["m"]]]
+        content["title"] = "Scattering Intensity Functions"
+    elif plot == "mie_int_vs_angle_combined":
+        SL, SR, SU = curves[0]
+        parallel = {"color": "r", "linestyle": "--", "lw": 1}
+        perpendicular = {"color": "r", "lw": 1}
+        unpolarized = {"color": "b", "lw": 1}
+        lines += [(0, mie_x, SR, "Parallel", parallel), (1, mie_x, SL, "Perpendicular", perpendicular),
+                  (2, mie_x, SU, "Unpolarized", unpolarized), (3, mie_x, SR, "Parallel", parallel),
+                  (3, mie_x, SL, "Perpendicular", perpendicular), (3, mie_x, SU, "Unpolarized", unpolarized)]
+    elif plot == "mie_diff_r":
+        lines += [(0, mie_x, SU, f"Radius {r / 1000} µm (Unpolarized)", {})
+                  for r, (_, _, SU) in zip(p["radii"], curves)]
+        content["table"] = [["Wavelength λ", f" {p['w']} nm"],
+                            ["Refractive Index (m)", f"{p['m'].real:.5f} + {p['m'].imag:.2E}j"]]
+        content["title"] = "Scattering Intensity Functions for Different Radii"
+    elif plot == "mie_r_10-50":
+        lines += [(0, mie_x, SU, f"Radius {r} μm", {}) for r, (_, _, SU) in zip(p["radii"], curves)]
+        content["title"] = f"Scattering Intensity for Different Radii at λ={p['w']}nm (Unpolarized)"
+    elif plot == "mie_int_diff_wavelength":
+        lines += [(0, mie_x, SU, f"λ = {w} nm", {}) for w, (_, _, SU) in zip(p["wavelengths"], curves)]
+        content["table"] = [["Ref. Index (m)", p["m"]], ["Radius (r)", f"{p['r'] / 1000} µm"]]
+        content["title"] = "Scattering Intensity Functions for Multiple Wavelengths(Unpolarized)"
+    elif plot == "rayleigh_intensity":
+        x = RAYLEIGH_GRIDS["linspace"]
+        parallel, perpendicular = curves[0]
+        for panel in (0, 1):
+            lines += [(panel, x, parallel, "Parallel Polarization", {"color": "red"}),
+                      (panel, x, perpendicular, "Perpendicular Polarization", {"color": "red", "linestyle": "--"})]
+        content["table"] = [["λ", f" {p['lambda_nm']} nm"], ["Radius of particle(r)", f"{p['r_um']} μm"],
+                            ["Ref. Index(n)", p["n"]], ["Observer Distance", f"{p['d_cm']} cm"],
+                            ["Incident Intensity $I_0$", f"{p['I_0']} (W/m²)"]]
+        content["title"] = "Rayleigh Scattering Intensity vs Scattering Angle"
+    elif plot == "rayleigh_intensity_diff_d":
+        x = RAYLEIGH_GRIDS["arange"]
+        lines += [(0, x, parallel, f"d = {d} cm", {}) for d, (parallel, _) in zip(p["d_cm_values"], curves)]
+        content["table"] = [["λ", f" {p['lambda_nm']} nm"], ["Radius of particle(r)", f"{p['r_um']} μm"],
+                            ["Ref. Index(n)", p["n"]], ["Incident Intensity $I_0$", f"{p['I_0']} (W/m²)"]]
+        content["title"] = "Rayleigh Scattering Intensity (Parallel) vs Scattering Angle"
+    elif plot == "rayleigh_intensity_diff_r":
+        x = RAYLEIGH_GRIDS["arange"]
+        for panel in (0, 1):
+            lines += [(panel, x, parallel, f"r = {r} μm", {}) for r, (parallel, _) in zip(p["r_um_values"], curves)]
+        content["table"] = [["λ", f" {p['lambda_nm']} nm"], ["Observer Distance(d)", f"{p['d_cm']} cm"],
+                            ["Ref. Index(n)", p["n"]], ["Incident Intensity $I_0$", f"{p['I_0']} (W/m²)"]]
+    elif plot == "rayleigh_intensity_diff_wavelength":
+        x = RAYLEIGH_GRIDS["linspace"]
+        for panel in (0, 1):
+            lines += [(panel, x, parallel, f"λ = {w} nm", {}) for w, (parallel, _) in zip(p["wavelengths"], curves)]
+        content["table"] = [["Radius of particle(r)", f"{p['r_um']} μm"], ["Ref. Index(n)", p["n"]],
+                            ["Observer Distance", f"{p['d_cm']} cm"],
+                            ["Incident Intensity $I_0$", f"{p['I_0']} (W/m²)"]]
+    else:
+        x = RAYLEIGH_GRIDS["linspace"]
+        S1_squared, S2_squared = curves[0]
+        for panel in (0, 1):
+            lines += [(panel, x, S1_squared, "S1: Perpendicular Polarization", {"color": "red", "linestyle": "--"}),
+                      (panel, x, S2_squared, "S2: Parallel Polarization", {"color": "red"})]
+        content["table"] = [["λ", f" {p['lambda_nm']} nm"], ["Radius of particle(r)", f"{p['r_um']} μm"],
+                            ["Ref. Index(n)", p["n"]]]
+        content["title"] = "Rayleigh Scattering"
+    return content
+
+def _legends(template):
+    # (Re)build the legends of the panels that have one, after the line labels changed
+    for ax, panel in zip(template["axes"], template["layout"]["panels"]):
+        if "legend" in panel:
+            ax.legend(**panel["legend"])
+
+def build_template(plot, content):
+    """
+    This function builds the figure of a plot type with all its static parts (axes, labels, ticks, table cells)
+    and the lines, table and title of a first content. Later variants only call fill_template.
+    """
+    layout = LAYOUTS[plot]
+    fig, axs = plt.subplots(*layout.get("grid", (1, 1)), figsize=layout["figsize"], squeeze=False)
+    axes = list(axs.ravel())
+    for ax, panel in zip(axes, layout["panels"]):
+        label_kwargs = {"fontsize": panel["fontsize"]} if "fontsize" in panel else {}
+        if panel.get("log"):
+            ax.set_yscale("log")
+        ax.set_xlim(0, 180)
+        ax.set_xticks(np.arange(0, 181, 30))
+        ax.tick_params(which="both", direction="in")
+        if "xlabel" in panel:
+            ax.set_xlabel(panel["xlabel"], **label_kwargs)
+        if "ylabel" in panel:
+            ax.set_ylabel(panel["ylabel"], labelpad=10 if label_kwargs else None, **label_kwargs)
+        if "title" in panel:
+            ax.set_title(panel["title"], fontweight="bold")
+
+    lines = [axes[panel].plot(x, y, label=label, **style)[0] for panel, x, y, label, style in content["lines"]]
+    template = {"fig": fig, "axes": axes, "lines": lines, "layout": layout, "table": None, "title": None}
+    _legends(template)
+
+    if "table" in layout:
+        table = layout["table"]
+        template["table"] = axes[table.get("panel", 0)].table(
+            cellText=[[str(value) for value in row] for row in content["table"]], colWidths=table["colWidths"],
+            colLabels=["Input Parameters", "Values"] if table.get("colLabels") else None, loc=table["loc"],
+            bbox=table.get("bbox"))
+    if layout.get("title") == "axes":
+        template["title"] = axes[0].set_title(content["title"], fontsize=18)
+    elif layout.get("title") == "suptitle":
+        template["title"] = fig.suptitle(content["title"], fontsize=16)
+    fig.tight_layout(rect=layout.get("rect"))
+    return template
+
+def fill_template(template, content):
+    """
+    This function swaps the line data, labels, table values and title of a template to a new content.
+    """
+    for line, (_, x, y, label, _) in zip(template["lines"], content["lines"]):
+        line.set_data(x, y)
+        line.set_label(label)
+    if template["table"] is not None:
+        first = 1 if template["layout"]["table"].get("colLabels") else 0
+        for i, row in enumerate(content["table"]):
+            for j, value in enumerate(row):
+                template["table"][first + i, j].get_text().set_text(str(value))
+    if template["title"] is not None:
+        template["title"].set_text(content["title"])
+    for ax in template["axes"]:
+        ax.relim()
+        ax.autoscale_view(scalex=False)
+    _legends(template)
+
+def _init_worker(out_dir, formats, dpi):
+    _worker["out_dir"] = out_dir
+    _worker["formats"] = formats
+    _worker["dpi"] = dpi
+    _worker["templates"] = {}
+
+def _render(items):
+    # Render a run of figures, reusing one template per plot type and number of lines
+    paths = []
+    for plot, name, content in items:
+        key = (plot, len(content["lines"]))
+        template = _worker["templates"].get(key)
+        if template is None:
+            template = _worker["templates"][key] = build_template(plot, content)
+        else:
+            fill_template(template, content)
+        for fmt in _worker["formats"]:
+            path = os.path.join(_worker["out_dir"], f"{name}.{fmt}")
+            template["fig"].savefig(path, dpi=_worker["dpi"])
+            paths.append(path)
+    return paths
+
+def load_specs(path):
+    """
+    This function reads a list of figure specs from a JSON file.
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def render_figures(specs, out_dir, formats=("png",), processes=None, dpi=100):
+    """
+    This function renders a batch of figures of the plotting scripts without a display.\n
+    Every spec is a dictionary with the plot type ('plot', the script name without .py, or 'script', its file
+    name), an optional output 'name' and any of the script's parameters; the parameters it leaves out take the
+    values hard-coded in the script (see DEFAULTS). The data of every unique curve is computed once for the whole
+    batch (compute_curves). The figures are then sorted by plot type and rendered with the Agg backend in a
+    process pool: every worker builds one template figure per plot type and only swaps the line data, labels,
+    table values and title for the following variants.\n
+    Input the parameters in the following format -\n
+    Args:
+        specs : List of figure specs, or the path of a JSON file holding one
+        out_dir : Folder for the figures
+        formats : Any of 'png', 'svg' and 'pdf'; every figure is written in all of them
+        processes : Number of worker processes (defaults to the number of CPUs, 1 runs in this process)
+        dpi : Resolution of the PNG files
+    Returns:
+        List of the written files
+    """
+    if isinstance(specs, str):
+        specs = load_specs(specs)
+    formats = tuple(formats)
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format {fmt}.\nUse any of {FORMATS}")
+    if processes is None:
+        processes = os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+
+    figures = []
+    for index, spec in enumerate(specs):
+        plot, p = _parameters(spec)
+        figures.append((plot, spec.get("name", f"{index:04d}_{plot}"), p, curve_keys(plot, p)))
+
+    pool = mp.Pool(processes, initializer=_init_worker, initargs=(out_dir, formats, dpi)) if processes > 1 else None
+    try:
+        # Data of every unique curve, once for the whole batch
+        curves = compute_curves([key for figure in figures for key in figure[3]], pool, processes)
+
+        # Runs of figures of the same plot type, so that the templates are reused
+        items = sorted(((plot, name, figure_content(plot, p, [curves[key] for key in keys]))
+                        for plot, name, p, keys in figures), key=lambda item: item[0])
+        run = max(1, math.ceil(len(items) / (4 * processes)))
+        runs = [items[i:i + run] for i in range(0, len(items), run)]
+        if pool is None:
+            _init_worker(out_dir, formats, dpi)
+            results = map(_render, runs)
+        else:
+            results = pool.imap(_render, runs)
+        return [path for paths in results for path in paths]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+# Example usage:
+if __name__ == "__main__":
+    import time
+
+    # The figures of every script, followed by a report-sized batch of variants
+    specs = [{"plot": plot} for plot in DEFAULTS]
+    for w in range(400, 800, 4):
+        specs.append({"plot": "mie_int_vs_angle", "w": w, "r": 1000})
+        specs.append({"plot": "mie_int_diff_wavelength", "r": w * 2, "wavelengths": [532, 650, 800]})
+        specs.append({"plot": "mie_diff_r", "w": w})
+        specs.append({"plot": "rayleigh_intensity", "lambda_nm": w})
+        specs.append({"plot": "rayleigh_intensity_diff_d", "lambda_nm": w})
+
+    start = time.perf_counter()
+    paths = render_figures(specs, "report_figures")
+    print(f"{len(paths)} files in {time.perf_counter() - start:.1f} s")
@@ -0,0 +1,173 @@
+import os
+import sys
+import multiprocessing as mp
+import numpy as np
+
+# The Mie engine and the export layer live in the Mie Scattering and Data Export folders
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(_root, "Mie Scattering"))
+sys.path.append(os.path.join(_root, "Data Export"))
+from mie_engine import scattering_angles
+from mie_sweep import run_sweep
+from scattering_io import ColumnarWriter
+
+# Class labels, as in the notebooks: particle 1 alone, particle 2 alone, resultant of both
+LABELS = ("p1", "p2", "res")
+NOISE_MODELS = ("none", "gaussian", "poisson", "gain")
+
+# Generator shared with the worker processes, set up by _init_worker
+_worker = {}
+
+class DetectorDatasetGenerator:
+    """
+    This class generates labeled detector windows of two-particle Mie scattering in fixed-size NumPy batches.\n
+    Particle 1 is seen on the detector window [minAngle, minAngle + detector_width] and particle 2 on the same
+    window shifted by the detector offset (1 deg per 10 um of distance). Every sample is one window of intensity
+    labeled 'p1', 'p2' or 'res' (the sum), as in the notebooks. The intensity of every radius is computed once
+    over the whole span of angles, so a batch is only indexing and noise. Every batch is drawn from its own seed
+    (seed, batch index), which makes the dataset reproducible for any number of worker processes.\n
+    Input the parameters in the following format -\n
+    Args:
+        radius_pairs : List of (r1, r2) radii in micrometers
+        offsets_deg : Detector offsets of particle 2 in degrees (multiples of angularResolution)
+        m : Refractive index of the particles
+        wavelength : Wavelength of light in nanometers
+        nMedium : Refractive index of the surrounding medium
+        minAngle, detector_width, angularResolution : Detector window in degrees
+        noise_models : Noise models sampled per window, from 'none', 'gaussian' (relative), 'poisson'
+                       (photon counts) and 'gain' (laser power fluctuation)
+        noise_level : Relative standard deviation of the 'gaussian' and 'gain' noise
+        photons : Photon count at the brightest angle of a window for the 'poisson' noise
+        radius_jitter : Radii are drawn uniformly within +- radius_jitter (um) of the nominal radius
+        radius_step : Radius grid (um) the jittered radii are snapped to
+        component : 'SL', 'SR' or 'SU'
+        seed : Seed of the whole dataset
+        processes : Number of worker processes used for the pattern tables
+        surrogate : MieSurrogate of m / nMedium (see Mie Scattering/mie_surrogate.py) covering the radii and the
+                    span of angles; the pattern table is then interpolated from it instead of summed
+    """
+    def __init__(self, radius_pairs=((10, 20), (10, 50), (20, 50), (50, 100)), offsets_deg=(1, 2, 5, 10),
+                 m=1.33257 + 1.67e-8j, wavelength=632, nMedium=1.0, minAngle=30, detector_width=10,
+                 angularResolution=0.01, noise_models=("none", "gaussian", "poisson"), noise_level=0.05,
+                 photons=1e4, radius_jitter=0.0, radius_step=0.01, component="SL", seed=0, processes=None,
+                 surrogate=None):
+        for name in noise_models:
+            if name not in NOISE_MODELS:
+                raise ValueError(f"Unknown noise model {name}.\nUse one of {NOISE_MODELS}")
+        if component not in ("SL", "SR", "SU"):
+            raise ValueError("component must be 'SL', 'SR' or 'SU'")
+        self.radius_pairs = np.asarray(radius_pairs, dtype=float).reshape(-1, 2)
+        self.offsets_deg = np.asarray(offsets_deg, dtype=float)
+        self.noise_codes = np.array([NOISE_MODELS.index(name) for name in noise_models])
+        self.noise_level = noise_level
+        self.photons = photons
+        self.radius_jitter = radius_jitter
+        self.radius_step = radius_step
+        self.seed = seed
+
+        # Detector window and offsets on the angle grid
+        self.window = int(round(detector_width / angularResolution)) + 1
+        self.offset_steps = np.rint(self.offsets_deg / angularResolution).astype(int)
+        if not np.allclose(self.offset_steps * angularResolution, self.offsets_deg):
+            raise ValueError("The detector offsets must be multiples of angularResolution")
+        maxAngle = minAngle + (self.window - 1 + self.offset_steps.max()) * angularResolution
+
+        # Radius grid: every nominal radius with its jitter range, in units of radius_step
+        jitter = int(round(radius_jitter / radius_step))
+        nominal = np.rint(np.unique(self.radius_pairs) / radius_step).astype(int)
+        self.radius_codes = np.unique((nominal[:, np.newaxis] + np.arange(-jitter, jitter + 1)).ravel())
+        radii = self.radius_codes * radius_step
+
+        # Intensity of every radius over the whole span of angles, computed once
+        if surrogate is None:
+            theta, SL, SR, SU = run_sweep(m, wavelength, 2 * radii * 1000, nMedium, minAngle, maxAngle,
+                                          angularResolution, processes)
+            SL, SR, SU = SL[0, 0], SR[0, 0], SU[0, 0]
+        else:
+            if m / np.real(nMedium) != surrogate.m:
+                raise ValueError(f"The surrogate was built for m = {surrogate.m}.\n"
+                                 f"The particles have m / nMedium = {m / np.real(nMedium)}")
+            _, theta, _ = scattering_angles(minAngle, maxAngle, angularResolution)
+            x = 2 * np.pi * radii * 1000 * np.real(nMedium) / wavelength
+            SL, SR = surrogate.intensity(x[:, np.newaxis], theta)
+            SU = (SL + SR) / 2
+        self.theta_deg = np.rad2deg(theta[:self.window])
+        self.table = {"SL": SL, "SR": SR, "SU": SU}[component]
+
+    def batch(self, index, batch_size=4096):
+        """
+        This function gives batch number index as a dictionary of arrays.\n
+        Returns:
+            {'I': (batch_size, window) float32 intensities, 'label': int8 codes into LABELS,
+             'r1', 'r2': radii in um, 'offset_deg': detector offset, 'noise': int8 codes into NOISE_MODELS}
+        """
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(index,)))
+
+        # Draw the particle pair, radius jitter, detector offset, label and noise model of every window
+        pair = self.radius_pairs[rng.integers(len(self.radius_pairs), size=batch_size)]
+        r = pair + rng.uniform(-self.radius_jitter, self.radius_jitter, size=pair.shape)
+        rows = np.searchsorted(self.radius_codes, np.rint(r / self.radius_step).astype(int))
+        rows = np.clip(rows, 0, self.radius_codes.size - 1)
+        offset = rng.integers(self.offset_steps.size, size=batch_size)
+        label = rng.integers(len(LABELS), size=batch_size).astype(np.int8)
+        noise = self.noise_codes[rng.integers(self.noise_codes.size, size=batch_size)].astype(np.int8)
+
+        # Gather the windows of both particles and keep the ones the label asks for
+        columns = np.arange(self.window)
+        I1 = self.table[rows[:, 0, np.newaxis], columns]
+        I2 = self.table[rows[:, 1, np.newaxis], self.offset_steps[offset, np.newaxis] + columns]
+        I = I1 * (label != 1)[:, np.newaxis] + I2 * (label != 0)[:, np.newaxis]
+
+        # Noise models
+        gaussian = noise == NOISE_MODELS.index("gaussian")
+        I[gaussian] *= 1 + self.noise_level * rng.standard_normal((gaussian.sum(), self.window))
+        gain = noise == NOISE_MODELS.index("gain")
+        I[gain] *= np.exp(self.noise_level * rng.standard_normal((gain.sum(), 1)))
+        poisson = noise == NOISE_MODELS.index("poisson")
+        if poisson.any():
+            scale = np.maximum(I[poisson].max(axis=1, keepdims=True), np.finfo(float).tiny) / self.photons
+            I[poisson] = rng.poisson(I[poisson] / scale) * scale
+
+        return {"I": I.astype(np.float32), "label": label, "r1": self.radius_codes[rows[:, 0]] * self.radius_step,
+                "r2": self.radius_codes[rows[:, 1]] * self.radius_step,
+                "offset_deg": self.offsets_deg[offset], "noise": noise}
+
+    def iter_batches(self, n_batches, batch_size=4096, processes=None, start=0):
+        """
+        This function yields the batches start, ..., start + n_batches - 1 in order, generated across a process
+        pool (processes=1 generates them in this process).
+        """
+        if processes is None:
+            processes = os.cpu_count() or 1
+        indices = range(start, start + n_batches)
+        if processes == 1 or n_batches <= 1:
+            for index in indices:
+                yield self.batch(index, batch_size)
+            return
+        with mp.Pool(processes, initializer=_init_worker, initargs=(self, batch_size)) as pool:
+            for batch in pool.imap(_make_batch, indices, chunksize=1):
+                yield batch
+
+    def write(self, path, n_batches, batch_size=4096, processes=None):
+        """
+        This function streams n_batches batches into a columnar table (see Data Export/scattering_io.py).
+        """
+        metadata = {"labels": list(LABELS), "noise_models": list(NOISE_MODELS), "seed": self.seed,
+                    "batch_size": batch_size}
+        with ColumnarWriter(path, metadata, axes={"theta_deg": self.theta_deg}) as writer:
+            for batch in self.iter_batches(n_batches, batch_size, processes):
+                writer.append(**batch)
+        return path
+
+def _init_worker(generator, batch_size):
+    _worker["generator"] = generator
+    _worker["batch_size"] = batch_size
+
+def _make_batch(index):
+    return _worker["generator"].batch(index, _worker["batch_size"])
+
+# Example usage:
+if __name__ == "__main__":
+    generator = DetectorDatasetGenerator(radius_jitter=0.5, seed=42)
+    for batch in generator.iter_batches(8, batch_size=4096):
+        print(batch["I"].shape, np.bincount(batch["label"], minlength=len(LABELS)))
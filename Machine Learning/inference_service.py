@@ -0,0 +1,193 @@
+import os
+import time
+import pickle
+import queue
+import threading
+from concurrent.futures import Future, InvalidStateError
+import numpy as np
+
+def save_model(model, path, features=("theta_deg", "I"), metadata=None):
+    """
+    This function saves a trained model together with the order of its input features.\n
+    Args:
+        model : Fitted scikit-learn estimator
+        path : File to write
+        features : Names of the input columns, in order
+        metadata : Optional dictionary stored with the model (e.g. the training dataset)
+    """
+    bundle = {"model": model, "features": list(features), "metadata": dict(metadata or {})}
+    with open(path, "wb") as f:
+        pickle.dump(bundle, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+def load_model(path):
+    """
+    This function loads a model saved by save_model and gives (model, features, metadata).
+    """
+    with open(path, "rb") as f:
+        bundle = pickle.load(f)
+    return bundle["model"], bundle["features"], bundle["metadata"]
+
+class InferenceService:
+    """
+    This class serves predictions of a saved model to many callers at once.\n
+    The model is loaded once. Arrays are predicted directly, without building a DataFrame per call. Single
+    measurements submitted from any number of threads are collected into micro-batches by a background thread:
+    a batch is predicted as soon as max_batch requests are waiting or the oldest request has waited max_delay
+    seconds, so one model call serves many requests.\n
+    Input the parameters in the following format -\n
+    Args:
+        model : Path (str or path-like) of a model saved with save_model, or a fitted estimator
+        features : Names of the input columns (read from the saved model if a path is given)
+        max_batch : Largest number of requests predicted in one model call
+        max_delay : Longest time (s) a request waits for its batch to fill
+    """
+    def __init__(self, model, features=("theta_deg", "I"), max_batch=1024, max_delay=0.002):
+        if isinstance(model, (str, os.PathLike)):
+            model, features, _ = load_model(model)
+        self.model = model
+        self.features = list(features)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.served = 0
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def predict(self, X):
+        """
+        This function predicts a 2-D array of measurements (rows) in one model call.
+        """
+        X = np.asarray(X, dtype=float)
+        if X.ndim != 2 or X.shape[1] != len(self.features):
+            raise ValueError(f"Expected measurements of shape (n, {len(self.features)}) with columns {self.features}")
+        return self.model.predict(X)
+
+    def predict_r(self, theta_deg, I):
+        """
+        This function is the array version of the notebook's predict_r: theta_deg and I may be scalars or arrays.
+        """
+        theta_deg, I = np.broadcast_arrays(np.asarray(theta_deg, dtype=float), np.asarray(I, dtype=float))
+        predicted = self.predict(np.column_stack([theta_deg.ravel(), I.ravel()]))
+        return predicted.reshape(theta_deg.shape) if theta_deg.ndim else predicted[0]
+
+    def stream(self, measurements, batch_size=4096):
+        """
+        This function yields the predictions of an iterable of measurements (one row each), batch by batch.
+        """
+        batch = []
+        for row in measurements:
+            batch.append(row)
+            if len(batch) == batch_size:
+                yield from self.predict(batch)
+                batch = []
+        if batch:
+            yield from self.predict(batch)
+
+    def submit(self, measurement):
+        """
+        This function queues one measurement for the next micro-batch and gives a Future of its prediction.\n
+        A measurement with the wrong number of features is rejected here, so it cannot fail the batch of others.
+        """
+        item = (np.asarray(measurement, dtype=float), Future())
+        if item[0].shape != (len(self.features),):
+            raise ValueError(f"Expected one measurement of shape ({len(self.features)},) with columns {self.features}"
+                             f"\nGot shape {item[0].shape}")
+        # The check and the put are done under the lock taken by close, so no request can land after the sentinel
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The service is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._serve, daemon=True)
+                self._thread.start()
+            self.requests.put(item)
+        return item[1]
+
+    def predict_one(self, measurement, timeout=None):
+        """
+        This function predicts one measurement through the micro-batcher (blocking).
+        """
+        return self.submit(measurement).result(timeout)
+
+    def _serve(self):
+        # Collect requests until the batch is full or the oldest one has waited max_delay, then predict them at once
+        while True:
+            item = self.requests.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.max_delay
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            # Drop the requests whose callers cancelled their Future (e.g. after a timeout); the others can no
+            # longer be cancelled, and no failure of one Future may end this thread
+            batch = [(measurement, future) for measurement, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                try:
+                    predicted = self.predict(np.stack([measurement for measurement, _ in batch]))
+                except Exception as error:
+                    predicted = [error] * len(batch)
+                for (_, future), value in zip(batch, predicted):
+                    try:
+                        if isinstance(value, Exception):
+                            future.set_exception(value)
+                        else:
+                            future.set_result(value)
+                    except InvalidStateError:
+                        pass
+                self.batches += 1
+                self.served += len(batch)
+            if stop:
+                return
+
+    def close(self):
+        """
+        This function stops the micro-batching thread after the queued requests are served.
+        """
+        with self._lock:
+            self._closed = True
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self.requests.put(None)
+        if thread is not None:
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Example usage:
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+    from sklearn.ensemble import RandomForestClassifier
+    from model_benchmark import load_notebook_dataset
+
+    X, y = load_notebook_dataset()
+    save_model(RandomForestClassifier().fit(X, y), "random_forest.pkl")
+
+    with InferenceService("random_forest.pkl") as service:
+        # Whole arrays in one call
+        start = time.perf_counter()
+        predicted = service.predict_r(X[:, 0], X[:, 1])
+        print(f"array: {len(X) / (time.perf_counter() - start):.0f} readings/s")
+
+        # Many concurrent single readings, micro-batched
+        start = time.perf_counter()
+        with ThreadPoolExecutor(32) as pool:
+            predicted = list(pool.map(service.predict_one, X))
+        print(f"micro-batched: {len(X) / (time.perf_counter() - start):.0f} readings/s, "
+              f"{service.served / service.batches:.0f} readings per model call")
@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import time
+import pickle
+import platform
+import tracemalloc
+import multiprocessing as mp
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold
+from sklearn.linear_model import LogisticRegression
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier, AdaBoostClassifier, GradientBoostingClassifier
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.naive_bayes import GaussianNB
+from sklearn.svm import SVC
+from sklearn.metrics import accuracy_score
+
+# Datasets shared with the worker processes, set up by _init_worker
+_worker = {}
+
+def default_models():
+    """
+    This function gives the eight models of the notebooks, with their default settings.
+    """
+    return {
+        "Logistic Regression": LogisticRegression(),
+        "Decision Tree": DecisionTreeClassifier(),
+        "Random Forest": RandomForestClassifier(),
+        "AdaBoost": AdaBoostClassifier(),
+        "Gradient Boosting": GradientBoostingClassifier(),
+        "K-Nearest Neighbors": KNeighborsClassifier(),
+        "Naive Bayes": GaussianNB(),
+        "Support Vector Machine": SVC()
+    }
+
+def load_notebook_dataset(path=None):
+    """
+    This function gives (X, y) of the saved 'Dataframe used for ML': X = (theta_deg, I) per row, y = r.
+    """
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Dataframe used for ML")
+    df = pd.read_csv(path, index_col=0)
+    return df[["theta_deg", "I"]].to_numpy(), df["r"].to_numpy()
+
+def benchmark_model(model, X, y, cv=5, seed=42, latency_samples=200):
+    """
+    This function cross-validates one model and measures its cost next to its accuracy.\n
+    Input the parameters in the following format -\n
+    Args:
+        model : Unfitted scikit-learn classifier (cloned for every fold)
+        X, y : Features and labels
+        cv : Number of stratified folds
+        seed : Seed of the fold split
+        latency_samples : Number of single-sample predictions timed per fold
+    Returns:
+        Dictionary with the mean and standard deviation of the accuracy, the fit time (s), the batched and
+        single-sample predict latency (s per sample), the peak memory of fit on the first fold (bytes) and the pickled
+        model size (bytes)
+    """
+    rows = []
+    rng = np.random.default_rng(seed)
+    for train, test in StratifiedKFold(cv, shuffle=True, random_state=seed).split(X, y):
+        fold_model = clone(model)
+        start = time.perf_counter()
+        fold_model.fit(X[train], y[train])
+        fit_time = time.perf_counter() - start
+
+        # Peak memory allocated while fitting, from a separate traced fit (tracing slows the fit down)
+        if not rows:
+            tracemalloc.start()
+            clone(model).fit(X[train], y[train])
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        # Batched prediction of the whole test fold, then single samples as a detector would send them
+        start = time.perf_counter()
+        y_pred = fold_model.predict(X[test])
+        batch_latency = (time.perf_counter() - start) / len(test)
+        single = rng.choice(test, size=min(latency_samples, len(test)), replace=False)
+        start = time.perf_counter()
+        for i in single:
+            fold_model.predict(X[i:i + 1])
+        single_latency = (time.perf_counter() - start) / len(single)
+
+        rows.append({"accuracy": accuracy_score(y[test], y_pred), "fit_time": fit_time,
+                     "predict_latency": batch_latency, "single_predict_latency": single_latency,
+                     "peak_memory": peak_memory, "model_size": len(pickle.dumps(fold_model))})
+
+    folds = pd.DataFrame(rows)
+    result = {name: float(folds[name].mean()) for name in folds.columns}
+    result["accuracy_std"] = float(folds["accuracy"].std(ddof=0))
+    return result
+
+def machine_info():
+    """
+    This function describes the machine and library versions that benchmark timings were taken on.
+    """
+    import sklearn
+    return {"platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count(),
+            "python": sys.version.split()[0], "numpy": np.__version__, "sklearn": sklearn.__version__}
+
+def _init_worker(datasets, models, options):
+    _worker["datasets"] = datasets
+    _worker["models"] = models
+    _worker["options"] = options
+
+def _run_task(task):
+    # Benchmark one (dataset, model) pair in a worker process
+    dataset_name, model_name = task
+    X, y = _worker["datasets"][dataset_name]
+    result = benchmark_model(_worker["models"][model_name], X, y, **_worker["options"])
+    return {"dataset": dataset_name, "model": model_name, **result}
+
+def run_benchmark(datasets, models=None, cv=5, seed=42, processes=None, report_dir="benchmark_reports"):
+    """
+    This function benchmarks every model on every dataset variant across a process pool and writes one report.\n
+    Every worker fits one (dataset, model) pair at a time. Timings taken while other workers run are comparable
+    with each other but not with a quiet machine; use processes=1 for reference numbers.\n
+    Input the parameters in the following format -\n
+    Args:
+        datasets : Dictionary {name: (X, y)} of dataset variants
+        models : Dictionary {name: unfitted classifier} (defaults to default_models())
+        cv, seed : Stratified cross-validation folds and split seed
+        processes : Number of worker processes (defaults to the number of CPUs, 1 runs in this process)
+        report_dir : Folder of the JSON reports (None writes no report)
+    Returns:
+        DataFrame with one row per (dataset, model)
+    """
+    if models is None:
+        models = default_models()
+    if processes is None:
+        processes = os.cpu_count() or 1
+    tasks = [(dataset_name, model_name) for dataset_name in datasets for model_name in models]
+    options = {"cv": cv, "seed": seed}
+
+    start = time.perf_counter()
+    if processes == 1 or len(tasks) <= 1:
+        _init_worker(datasets, models, options)
+        results = [_run_task(task) for task in tasks]
+        _worker.clear()
+    else:
+        with mp.Pool(min(processes, len(tasks)), initializer=_init_worker,
+                     initargs=(datasets, models, options)) as pool:
+            results = pool.map(_run_task, tasks, chunksize=1)
+    wall_time = time.perf_counter() - start
+
+    report = pd.DataFrame(results)
+    if report_dir is not None:
+        os.makedirs(report_dir, exist_ok=True)
+        created = datetime.now()
+        header = {"created": created.isoformat(timespec="seconds"), "wall_time": wall_time, "cv": cv, "seed": seed,
+                  "processes": processes, "datasets": {name: {"rows": int(len(y)), "features": int(np.shape(X)[1])}
+                                                       for name, (X, y) in datasets.items()},
+                  "machine": machine_info(),
+                  "results": results}
+        with open(os.path.join(report_dir, f"report_{created:%Y%m%d_%H%M%S}.json"), "w") as f:
+            json.dump(header, f, indent=1)
+    return report
+
+# Example usage:
+if __name__ == "__main__":
+    from detector_dataset import DetectorDatasetGenerator
+    from window_features import featurize_batch
+
+    # The per-point notebook data next to one feature row per generated window
+    generator = DetectorDatasetGenerator(radius_jitter=0.5, seed=42)
+    datasets = {"notebook rows": load_notebook_dataset(),
+                "window features": featurize_batch(generator.batch(0, batch_size=6000), generator.theta_deg)}
+
+    report = run_benchmark(datasets)
+    print(report[["dataset", "model", "accuracy", "fit_time", "single_predict_latency", "model_size"]])
@@ -0,0 +1,135 @@
+import os
+import sys
+import numpy as np
+from scipy.spatial import cKDTree
+
+# The Mie engine lives in the Mie Scattering folder
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Mie Scattering"))
+from mie_sweep import run_sweep
+
+def normalize_patterns(I):
+    """
+    This function gives the normalized shape of angular patterns: log10 of the intensity with its mean removed,
+    scaled to unit length. The dot product of two normalized patterns is their correlation, and an unknown
+    overall intensity (laser power, detector gain) drops out.
+    """
+    L = np.log10(np.maximum(np.atleast_2d(np.asarray(I, dtype=float)), np.finfo(float).tiny))
+    L -= L.mean(axis=1, keepdims=True)
+    L /= np.maximum(np.linalg.norm(L, axis=1, keepdims=True), np.finfo(float).tiny)
+    return L
+
+class PatternLibrary:
+    """
+    This class retrieves the radius and refractive index of a particle from one detector window by matching
+    against a library of precomputed patterns.\n
+    The SL patterns of every (m, radius) on the grid are computed once with the batched Mie engine, normalized
+    (normalize_patterns) and, when shifts are given, also stored at every angular shift of the detector. A KD tree
+    over their first principal components finds the nearest candidates, which are then ranked by their exact
+    correlation with the measured window.\n
+    Input the parameters in the following format -\n
+    Args:
+        radii : Radius grid in micrometers
+        m_values : Refractive indices
+        wavelength : Wavelength of light in nanometers
+        nMedium : Refractive index of the surrounding medium
+        minAngle, maxAngle, angularResolution : Detector window in degrees
+        shifts_deg : Angular offsets of the detector to tolerate, in degrees (multiples of angularResolution)
+        n_components : Number of principal components indexed by the KD tree
+        processes : Number of worker processes for the pattern computation
+    """
+    def __init__(self, radii, m_values=(1.33257 + 1.67e-8j,), wavelength=632, nMedium=1.0, minAngle=30, maxAngle=40,
+                 angularResolution=0.01, shifts_deg=(0,), n_components=48, processes=None):
+        self.radii = np.atleast_1d(np.asarray(radii, dtype=float))
+        self.m_values = np.atleast_1d(np.asarray(m_values, dtype=complex))
+        shift_steps = np.rint(np.asarray(shifts_deg, dtype=float) / angularResolution).astype(int)
+        if not np.allclose(shift_steps * angularResolution, shifts_deg):
+            raise ValueError("The detector shifts must be multiples of angularResolution")
+        self.shifts_deg = shift_steps * angularResolution
+        window = int(round((maxAngle - minAngle) / angularResolution)) + 1
+
+        # Patterns over the window widened by the largest shifts. The engine counts the angles with a truncating
+        # int(1 + (max - min) / step), which can come out one short for float endpoints, so the step passed is
+        # chosen to give exactly count angles; the angles themselves are evenly spaced between the two endpoints
+        low, high = min(shift_steps.min(), 0), max(shift_steps.max(), 0)
+        count = window + high - low
+        lo = minAngle + low * angularResolution
+        hi = lo + (count - 1) * angularResolution
+        theta, SL, _, _ = run_sweep(self.m_values, wavelength, 2 * self.radii * 1000, nMedium, lo, hi,
+                                    (hi - lo) / (count - 0.5), processes)
+        SL = SL[:, 0].reshape(-1, SL.shape[-1])
+        assert SL.shape[-1] == count, f"Expected {count} angles in the widened window, got {SL.shape[-1]}"
+        self.theta_deg = np.rad2deg(theta[-low:-low + window])
+
+        # One normalized library row per (shift, m, radius)
+        self.patterns = np.concatenate([normalize_patterns(SL[:, s - low:s - low + window])
+                                        for s in shift_steps]).astype(np.float32)
+        self.m_index = np.tile(np.repeat(np.arange(self.m_values.size), self.radii.size), shift_steps.size)
+        self.r_index = np.tile(np.arange(self.radii.size), self.m_values.size * shift_steps.size)
+        self.shift_index = np.repeat(np.arange(shift_steps.size), self.m_values.size * self.radii.size)
+
+        # Principal components of the library and the KD tree over them
+        self.mean = self.patterns.mean(axis=0)
+        _, _, Vt = np.linalg.svd(self.patterns - self.mean, full_matrices=False)
+        self.components = np.ascontiguousarray(Vt[:n_components])
+        self.tree = cKDTree((self.patterns - self.mean) @ self.components.T)
+
+    def query(self, I, k=16):
+        """
+        This function gives the best-matching library entry of every measured window.\n
+        Args:
+            I : Measured intensities on theta_deg, shape (windows, angles) or (angles,)
+            k : Number of KD tree candidates ranked by their exact correlation
+        Returns:
+            Dictionary of arrays: 'radius' (um), 'm', 'shift_deg', 'score' (correlation of the best match, 1 is a
+            perfect match) and 'confidence' (0 when a clearly different radius fits as well, 1 when the best match
+            is far better than any other)
+        """
+        u = normalize_patterns(I)
+        if u.shape[1] != self.theta_deg.size:
+            raise ValueError(f"Expected windows of {self.theta_deg.size} angles")
+        k = min(k, len(self.patterns))
+        _, candidates = self.tree.query((u - self.mean) @ self.components.T, k=k)
+        candidates = candidates.reshape(u.shape[0], k)
+
+        # Exact correlation of every candidate, then rank
+        correlation = np.einsum("wa,wka->wk", u, self.patterns[candidates])
+        order = np.argsort(-correlation, axis=1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        correlation = np.take_along_axis(correlation, order, axis=1)
+        best = candidates[:, 0]
+
+        # Confidence from the distance to the best match relative to the nearest clearly different radius
+        distance = np.sqrt(np.maximum(2 - 2 * correlation, 0))
+        different = np.abs(self.r_index[candidates] - self.r_index[best][:, np.newaxis]) > 1
+        different[:, -1] = True
+        rival = distance[np.arange(len(best)), np.argmax(different, axis=1)]
+        confidence = 1 - distance[:, 0] / np.maximum(rival, np.finfo(float).tiny)
+
+        return {"radius": self.radii[self.r_index[best]], "m": self.m_values[self.m_index[best]],
+                "shift_deg": self.shifts_deg[self.shift_index[best]], "score": correlation[:, 0],
+                "confidence": np.clip(confidence, 0, 1)}
+
+# Example usage:
+if __name__ == "__main__":
+    import time
+
+    radii = np.arange(5, 20.001, 0.01)  # microns
+    library = PatternLibrary(radii, shifts_deg=np.arange(-0.5, 0.51, 0.1))
+
+    # Noisy windows of particles between the grid radii, seen with a detector offset
+    rng = np.random.default_rng(0)
+    true_radii = rng.uniform(6, 19, size=200)
+    theta, SL, _, _ = run_sweep(1.33257 + 1.67e-8j, 632, 2 * true_radii * 1000, minAngle=30.2, maxAngle=40.2,
+                                angularResolution=0.01)
+    measured = SL[0, 0] * (1 + 0.05 * rng.standard_normal(SL[0, 0].shape))
+
+    start = time.perf_counter()
+    result = library.query(measured)
+    elapsed = time.perf_counter() - start
+    print(f"{1000 * elapsed / len(measured):.3f} ms per window, "
+          f"max radius error {np.abs(result['radius'] - true_radii).max():.3f} um")
+
+    # Shift sets whose widened windows have float endpoints
+    for minAngle, maxAngle, shifts in [(30, 35, np.arange(-0.3, 0.31, 0.1)), (20, 30, (0, 0.2))]:
+        small = PatternLibrary(np.arange(5, 6.001, 0.05), minAngle=minAngle, maxAngle=maxAngle, shifts_deg=shifts)
+        print(f"{minAngle}-{maxAngle} deg, shifts {np.round(small.shifts_deg, 2)}: {small.patterns.shape}")
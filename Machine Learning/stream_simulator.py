@@ -0,0 +1,213 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from detector_dataset import DetectorDatasetGenerator
+from window_features import window_features
+
+class DetectorStreamSimulator:
+    """
+    This class simulates the detector in real time: particles cross the beam at random times and every crossing
+    is a timestamped frame (one detector window of intensity) that goes through a pipeline of processing stages.\n
+    The frames come from the precomputed patterns of a DetectorDatasetGenerator (particle 1, particle 2 seen
+    with the detector offset, or both), so emitting a frame costs no Mie evaluation. Crossings arrive as a
+    Poisson process at the requested rate. The stages (by default featurize -> classify) are connected by
+    bounded asyncio queues; every stage takes all the frames waiting for it, up to max_batch, and runs its
+    function on them in its own worker thread, so the event loop keeps emitting frames on time while a stage
+    computes. When a queue is full the detector either waits for room (overflow='block', backpressure up to the
+    detector) or loses the frame (overflow='drop', as a detector with a fixed readout would).\n
+    Every run reports the sustained throughput, the latency from the crossing to the end of the pipeline
+    (p50/p99), the queue depths and the dropped frames.\n
+    Input the parameters in the following format -\n
+    Args:
+        stages : List of (name, function) pairs; every function maps an array of inputs (one row per frame) to
+                 an array of outputs (one row per frame). None gives featurize -> classify with model
+        model : Fitted classifier of window_features rows (only used for the default stages)
+        generator : DetectorDatasetGenerator giving the frames (a default one is made if None)
+        queue_size : Capacity of every queue between stages, in frames
+        max_batch : Largest number of frames a stage processes at once
+        overflow : 'block' or 'drop'
+        seed : Seed of the arrival times and frames
+    """
+    def __init__(self, stages=None, model=None, generator=None, queue_size=1024, max_batch=256, overflow="block",
+                 seed=0):
+        if overflow not in ("block", "drop"):
+            raise ValueError("overflow must be 'block' or 'drop'")
+        self.generator = generator if generator is not None else DetectorDatasetGenerator(seed=seed)
+        if stages is None:
+            if model is None:
+                raise ValueError("Give the stages, or a model for the default featurize -> classify stages")
+            theta_deg = self.generator.theta_deg
+            stages = [("featurize", lambda I: window_features(I, theta_deg)), ("classify", model.predict)]
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.max_batch = max_batch
+        self.overflow = overflow
+        self.seed = seed
+
+    def run(self, rate, duration=5.0, block_size=1024, sample_interval=0.01):
+        """
+        This function streams frames at rate crossings per second for duration seconds and gives the report.\n
+        Args:
+            rate : Mean number of particle crossings (frames) per second
+            duration : Length of the simulated acquisition in seconds
+            block_size : Number of frames drawn from the generator at once
+            sample_interval : Time between two samples of the queue depths (s)
+        Returns:
+            Dictionary with the offered rate, emitted, completed and dropped frames, the sustained frames/s, the
+            latency percentiles (s), the mean and largest depth of every queue, the accuracy of the predicted
+            labels when the last stage gives labels, and the largest delay of the detector behind its schedule
+        """
+        return asyncio.run(self._run(rate, duration, block_size, sample_interval))
+
+    async def _run(self, rate, duration, block_size, sample_interval):
+        loop = asyncio.get_running_loop()
+        rng = np.random.default_rng(self.seed)
+        arrivals = np.cumsum(rng.exponential(1 / rate, size=int(rate * duration * 1.2) + 16))
+        arrivals = arrivals[arrivals < duration]
+        queues = [asyncio.Queue(self.queue_size) for _ in self.stages]
+        results = {"latency": [], "correct": 0, "labelled": 0, "dropped": 0, "lag": 0.0}
+        depths = []
+        done = asyncio.Event()
+
+        async def detector(start, source, frames):
+            # Emit every crossing whose time has come, then sleep until the next one. The frames are drawn in
+            # blocks by the source thread, one block ahead, so that drawing them never holds up the event loop
+            emitted = 0
+            upcoming = loop.run_in_executor(source, self.generator.batch, 1, block_size)
+            while emitted < arrivals.size:
+                now = loop.time() - start
+                if arrivals[emitted] > now:
+                    await asyncio.sleep(arrivals[emitted] - now)
+                    continue
+                results["lag"] = max(results["lag"], now - arrivals[emitted])
+                if emitted and emitted % block_size == 0:
+                    frames = await upcoming
+                    upcoming = loop.run_in_executor(source, self.generator.batch, emitted // block_size + 1,
+                                                    block_size)
+                row = emitted % block_size
+                frame = (start + arrivals[emitted], frames["I"][row], frames["label"][row])
+                if self.overflow == "block":
+                    await queues[0].put(frame)
+                else:
+                    try:
+                        queues[0].put_nowait(frame)
+                    except asyncio.QueueFull:
+                        results["dropped"] += 1
+                emitted += 1
+            await queues[0].put(None)
+
+        async def stage(index, function, executor):
+            # Take every waiting frame (up to max_batch), process them in the stage thread and pass them on
+            source = queues[index]
+            target = queues[index + 1] if index + 1 < len(queues) else None
+            while True:
+                frames = [await source.get()]
+                while frames[-1] is not None and len(frames) < self.max_batch and not source.empty():
+                    frames.append(source.get_nowait())
+                finished = frames[-1] is None
+                frames = [frame for frame in frames if frame is not None]
+                if frames:
+                    inputs = np.stack([frame[1] for frame in frames])
+                    outputs = await loop.run_in_executor(executor, function, inputs)
+                    if target is not None:
+                        for frame, output in zip(frames, outputs):
+                            await target.put((frame[0], output, frame[2]))
+                    else:
+                        end = loop.time()
+                        results["latency"].extend(end - frame[0] for frame in frames)
+                        outputs = np.asarray(outputs)
+                        if outputs.ndim == 1 and outputs.dtype.kind in "iu":
+                            results["correct"] += int(np.sum(outputs == [frame[2] for frame in frames]))
+                            results["labelled"] += len(frames)
+                if finished:
+                    if target is not None:
+                        await target.put(None)
+                    return
+
+        async def monitor():
+            while not done.is_set():
+                depths.append([queue.qsize() for queue in queues])
+                await asyncio.sleep(sample_interval)
+
+        executors = [ThreadPoolExecutor(1, thread_name_prefix=name) for name, _ in self.stages]
+        source = ThreadPoolExecutor(1, thread_name_prefix="detector")
+        watcher = None
+        try:
+            # The first block is drawn before the clock starts, so its cost is not counted as detector lag or latency
+            first = await loop.run_in_executor(source, self.generator.batch, 0, block_size)
+            start = loop.time()
+            watcher = asyncio.create_task(monitor())
+
+            # The detector and the stages run together; the first one that fails cancels the others and its error
+            # is raised, so a failing stage cannot leave the detector blocked on a full queue
+            tasks = [asyncio.create_task(stage(i, function, executor))
+                     for i, ((_, function), executor) in enumerate(zip(self.stages, executors))]
+            tasks.append(asyncio.create_task(detector(start, source, first)))
+            finished, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in finished:
+                if task.exception() is not None:
+                    raise task.exception()
+            elapsed = loop.time() - start
+        finally:
+            done.set()
+            if watcher is not None:
+                await watcher
+            for executor in executors + [source]:
+                executor.shutdown()
+
+        latency = np.array(results["latency"])
+        depths = np.array(depths, dtype=float).reshape(-1, len(queues))
+        report = {"rate": rate, "duration_s": duration, "emitted": int(arrivals.size),
+                  "completed": int(latency.size), "dropped": results["dropped"],
+                  "frames_per_s": latency.size / elapsed if elapsed > 0 else np.nan,
+                  "latency_p50_s": float(np.percentile(latency, 50)) if latency.size else np.nan,
+                  "latency_p99_s": float(np.percentile(latency, 99)) if latency.size else np.nan,
+                  "latency_max_s": float(latency.max()) if latency.size else np.nan,
+                  "detector_lag_s": float(results["lag"]),
+                  "accuracy": results["correct"] / results["labelled"] if results["labelled"] else np.nan}
+        for (name, _), mean, largest in zip(self.stages, depths.mean(axis=0), depths.max(axis=0)):
+            report[f"queue_{name}_mean"] = float(mean)
+            report[f"queue_{name}_max"] = int(largest)
+        return report
+
+    def max_rate(self, rates, duration=5.0, latency_limit=0.1, min_completed=0.99):
+        """
+        This function runs the simulation at increasing rates and gives the largest rate the pipeline sustains.\n
+        A rate is sustained when at least min_completed of the frames get through and the p99 latency stays below
+        latency_limit seconds, so that no backlog builds up.\n
+        Returns:
+            (largest sustained rate or None, list of the reports of every rate)
+        """
+        reports = []
+        best = None
+        for rate in sorted(rates):
+            report = self.run(rate, duration)
+            reports.append(report)
+            sustained = report["completed"] >= min_completed * report["emitted"] and \
+                report["latency_p99_s"] <= latency_limit
+            if not sustained:
+                break
+            best = rate
+        return best, reports
+
+# Example usage:
+if __name__ == "__main__":
+    from sklearn.ensemble import ExtraTreesClassifier
+    from window_features import featurize_batch
+
+    # Train the classify stage on a few batches of the same generator
+    generator = DetectorDatasetGenerator(seed=42)
+    X, y = featurize_batch(generator.batch(10**6, 8192), generator.theta_deg)
+    model = ExtraTreesClassifier(n_estimators=100, n_jobs=1).fit(X, y)
+
+    simulator = DetectorStreamSimulator(model=model, generator=generator, overflow="drop")
+    best, reports = simulator.max_rate([500, 1000, 2000, 5000, 10000, 20000], duration=3)
+    for report in reports:
+        print(f"{report['rate']:8.0f} /s offered: {report['frames_per_s']:8.0f} frames/s, "
+              f"p50 {1000 * report['latency_p50_s']:7.2f} ms, p99 {1000 * report['latency_p99_s']:7.2f} ms, "
+              f"dropped {report['dropped']}, queue max {report['queue_featurize_max']}, "
+              f"accuracy {report['accuracy']:.3f}")
+    print("Largest sustained rate:", best, "crossings/s")
@@ -0,0 +1,136 @@
+import numpy as np
+
+# Columns of the feature matrix returned by window_features
+FEATURE_NAMES = ("log_mean", "log_std", "log_skew", "log_kurtosis", "slope", "residual_std",
+                 "fringe_frequency", "fringe_power", "second_frequency", "spectral_centroid",
+                 "peak_count", "peak_spacing", "peak_spacing_std", "contrast")
+
+def _fringe_spectrum(residual, step, n_fft):
+    # Power spectrum of the Hann-windowed residual, without the zero frequency
+    taper = np.hanning(residual.shape[1])
+    power = np.abs(np.fft.rfft(residual * taper, n=n_fft, axis=1))**2
+    frequency = np.fft.rfftfreq(n_fft, d=step)
+    return frequency[1:], power[:, 1:]
+
+def _refine_peak(power, index):
+    # Parabolic interpolation of the spectral peak, in units of frequency bins
+    rows = np.arange(power.shape[0])
+    inner = np.clip(index, 1, power.shape[1] - 2)
+    left, centre, right = (np.log(power[rows, inner + k] + 1e-300) for k in (-1, 0, 1))
+    denominator = left - 2 * centre + right
+    shift = np.where(denominator < 0, 0.5 * (left - right) / np.where(denominator < 0, denominator, 1), 0.0)
+    return inner + np.clip(shift, -0.5, 0.5)
+
+def _peak_statistics(residual, step, smooth):
+    # Number, mean spacing and spread of spacing of the local maxima of the smoothed residual. Windows with fewer
+    # than 2 maxima get the window width as spacing and 0 as spread, so that the features stay finite
+    if smooth > 1:
+        cumulative = np.cumsum(np.pad(residual, ((0, 0), (smooth // 2, smooth - 1 - smooth // 2)), mode="edge"), axis=1)
+        cumulative = np.concatenate([np.zeros((residual.shape[0], 1)), cumulative], axis=1)
+        residual = (cumulative[:, smooth:] - cumulative[:, :-smooth]) / smooth
+    maxima = (residual[:, 1:-1] > residual[:, :-2]) & (residual[:, 1:-1] >= residual[:, 2:])
+    rows, positions = np.nonzero(maxima)
+    count = np.bincount(rows, minlength=residual.shape[0])
+
+    # Spacings between neighbouring maxima of the same window
+    same_row = rows[1:] == rows[:-1]
+    spacing = (positions[1:] - positions[:-1])[same_row] * step
+    spacing_rows = rows[1:][same_row]
+    n = np.bincount(spacing_rows, minlength=residual.shape[0])
+    total = np.bincount(spacing_rows, weights=spacing, minlength=residual.shape[0])
+    total_sq = np.bincount(spacing_rows, weights=spacing**2, minlength=residual.shape[0])
+    width = step * (residual.shape[1] - 1)
+    mean = np.divide(total, n, out=np.full(n.shape, width), where=n > 0)
+    variance = np.divide(total_sq, n, out=np.zeros(n.shape), where=n > 0) - np.where(n > 0, mean**2, 0)
+    return count, mean, np.sqrt(np.maximum(variance, 0))
+
+def window_features(I, theta_deg, n_fft=None, smooth=5, chunk_size=1024):
+    """
+    This function gives compact features of detector windows, one row of features per window.\n
+    The features are computed from log10 of the intensity: its moments, the slope of a straight line fit over
+    the window, the fringe frequency (cycles per degree, which grows with the radius) from the FFT of the
+    detrended log-intensity, and the number and spacing of the fringe maxima. A window with fewer than 2 maxima
+    (a small particle over a narrow window) gets the window width as peak_spacing and 0 as peak_spacing_std, so
+    every feature is finite.\n
+    Input the parameters in the following format -\n
+    Args:
+        I : Intensities of the windows, shape (windows, angles) or (angles,)
+        theta_deg : Uniform angle grid of the windows in degrees
+        n_fft : FFT length (defaults to 4 x the next power of two of the window, for a fine frequency grid)
+        smooth : Width (in samples) of the moving average applied before the maxima are located
+        chunk_size : Number of windows processed at once
+    Returns:
+        Feature matrix of shape (windows, len(FEATURE_NAMES))
+    """
+    I = np.atleast_2d(np.asarray(I, dtype=float))
+    theta_deg = np.asarray(theta_deg, dtype=float)
+    if I.shape[1] != theta_deg.size or theta_deg.size < 4:
+        raise ValueError("The windows must have one intensity per angle of theta_deg (at least 4 angles)")
+    step = (theta_deg[-1] - theta_deg[0]) / (theta_deg.size - 1)
+    if n_fft is None:
+        n_fft = 4 * 2**int(np.ceil(np.log2(theta_deg.size)))
+
+    # Least squares line on the centred angle grid
+    t = theta_deg - theta_deg.mean()
+    t_norm = (t**2).sum()
+
+    features = np.empty((I.shape[0], len(FEATURE_NAMES)))
+    for start in range(0, I.shape[0], chunk_size):
+        chunk = I[start:start + chunk_size]
+        log_I = np.log10(np.maximum(chunk, np.finfo(float).tiny))
+
+        # Moments of the log-intensity
+        mean = log_I.mean(axis=1)
+        centred = log_I - mean[:, np.newaxis]
+        std = centred.std(axis=1)
+        scaled = centred / np.where(std > 0, std, 1)[:, np.newaxis]
+        squared = scaled * scaled
+        skew = (squared * scaled).mean(axis=1)
+        kurtosis = (squared * squared).mean(axis=1) - 3
+
+        # Slope and the detrended fringes
+        slope = centred @ t / t_norm
+        residual = centred - slope[:, np.newaxis] * t
+        residual_std = residual.std(axis=1)
+
+        # Fringe frequency, its share of the spectral power, the next strongest frequency and the centroid
+        frequency, power = _fringe_spectrum(residual, step, n_fft)
+        total = np.maximum(power.sum(axis=1), np.finfo(float).tiny)
+        first = np.argmax(power, axis=1)
+        rows = np.arange(power.shape[0])
+        df = frequency[1] - frequency[0]
+        fringe_frequency = frequency[0] + _refine_peak(power, first) * df
+        fringe_power = power[rows, first] / total
+
+        # Mask the main lobe (Hann window: +-2 bins of the unpadded FFT) before looking for the second peak
+        lobe = int(np.ceil(2 * n_fft / theta_deg.size))
+        lobe_bins = np.clip(first[:, np.newaxis] + np.arange(-lobe, lobe + 1), 0, power.shape[1] - 1)
+        masked = power.copy()
+        np.put_along_axis(masked, lobe_bins, 0, axis=1)
+        second_frequency = frequency[np.argmax(masked, axis=1)]
+        spectral_centroid = power @ frequency / total
+
+        count, spacing, spacing_std = _peak_statistics(residual, step, smooth)
+        contrast = chunk.std(axis=1) / np.maximum(chunk.mean(axis=1), np.finfo(float).tiny)
+
+        features[start:start + chunk_size] = np.column_stack([
+            mean, std, skew, kurtosis, slope, residual_std, fringe_frequency, fringe_power, second_frequency,
+            spectral_centroid, count, spacing, spacing_std, contrast])
+    return features
+
+def featurize_batch(batch, theta_deg, **kwargs):
+    """
+    This function gives (X, y) for a batch of DetectorDatasetGenerator: the window features and the labels.
+    """
+    return window_features(batch["I"], theta_deg, **kwargs), batch["label"]
+
+# Example usage:
+if __name__ == "__main__":
+    from detector_dataset import DetectorDatasetGenerator, LABELS
+
+    generator = DetectorDatasetGenerator(seed=42)
+    batch = generator.batch(0, batch_size=4096)
+    X, y = featurize_batch(batch, generator.theta_deg)
+    print(X.shape)
+    for label in range(len(LABELS)):
+        print(LABELS[label], X[y == label, FEATURE_NAMES.index("fringe_frequency")].mean())
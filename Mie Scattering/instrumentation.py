@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+from contextlib import contextmanager
+
+class Collector:
+    """
+    This class collects timed events of the instrumented functions in this process.\n
+    Every event has a name, a start time, a duration and a dictionary of counters (e.g. n_max, angles,
+    bytes_written, hits, misses). Events are aggregated per name as they arrive; the individual events are also
+    kept, up to max_events, for the JSON and Chrome trace exports. Recording does nothing while the collector is
+    disabled, and the instrumented functions then only pay one attribute check per call.\n
+    Args:
+        max_events : Largest number of individual events kept (the aggregates count all of them)
+    """
+    def __init__(self, max_events=10**6):
+        self.enabled = False
+        self.max_events = max_events
+        self.events = []
+        self.totals = {}
+        self.dropped = 0
+        self.origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        """
+        This function forgets every recorded event.
+        """
+        with self._lock:
+            self.events = []
+            self.totals = {}
+            self.dropped = 0
+            self.origin = time.perf_counter_ns()
+
+    def record(self, name, start, duration, counters=None):
+        """
+        This function records one event (start and duration in perf_counter nanoseconds).
+        """
+        with self._lock:
+            total = self.totals.get(name)
+            if total is None:
+                total = self.totals[name] = {"calls": 0, "time": 0, "max_time": 0, "counters": {}}
+            total["calls"] += 1
+            total["time"] += duration
+            total["max_time"] = max(total["max_time"], duration)
+            if counters:
+                sums = total["counters"]
+                for key, value in counters.items():
+                    sums[key] = sums.get(key, 0) + value
+            if len(self.events) < self.max_events:
+                self.events.append((name, start, duration, threading.get_ident(), counters))
+            else:
+                self.dropped += 1
+
+    def summary(self):
+        """
+        This function gives the aggregates per event name: number of calls, total, mean and largest wall time
+        (s) and the sums of the counters, slowest total first.
+        """
+        rows = {}
+        for name, total in sorted(self.totals.items(), key=lambda item: -item[1]["time"]):
+            rows[name] = {"calls": total["calls"], "total_s": total["time"] / 1e9,
+                          "mean_s": total["time"] / total["calls"] / 1e9, "max_s": total["max_time"] / 1e9,
+                          **total["counters"]}
+        return rows
+
+    def print_summary(self):
+        """
+        This function prints the aggregates as a table.
+        """
+        print(f"{'name':32s} {'calls':>8s} {'total (s)':>10s} {'mean (ms)':>10s}  counters")
+        for name, row in self.summary().items():
+            counters = ", ".join(f"{key}={value:g}" for key, value in row.items()
+                                 if key not in ("calls", "total_s", "mean_s", "max_s"))
+            print(f"{name:32s} {row['calls']:8d} {row['total_s']:10.4f} {1000 * row['mean_s']:10.4f}  {counters}")
+
+    def to_json(self, path):
+        """
+        This function writes the aggregates and the individual events (times in microseconds) as JSON.
+        """
+        report = {"pid": os.getpid(), "dropped": self.dropped, "summary": self.summary(),
+                  "events": [{"name": name, "start_us": (start - self.origin) / 1000, "duration_us": duration / 1000,
+                              "thread": thread, "counters": counters or {}}
+                             for name, start, duration, thread, counters in self.events]}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1, default=float)
+        return path
+
+    def to_chrome_trace(self, path):
+        """
+        This function writes the events in the Chrome trace format (open it in chrome://tracing or Perfetto).
+        Nested calls, e.g. mie_ab inside scattering_intensity, show up as nested slices.
+        """
+        pid = os.getpid()
+        events = [{"name": name, "ph": "X", "ts": (start - self.origin) / 1000, "dur": duration / 1000, "pid": pid,
+                   "tid": thread, "args": counters or {}}
+                  for name, start, duration, thread, counters in self.events]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=float)
+        return path
+
+# The collector of this process
+collector = Collector()
+
+class _Span:
+    __slots__ = ("name", "counters", "start")
+
+    def __init__(self, name, counters):
+        self.name = name
+        self.counters = counters
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self.counters
+
+    def __exit__(self, *exc):
+        collector.record(self.name, self.start, time.perf_counter_ns() - self.start, self.counters)
+
+class _NullCounters(dict):
+    # Counters of a disabled span: reads give 0 and writes are dropped
+    def __missing__(self, key):
+        return 0
+
+    def __setitem__(self, key, value):
+        pass
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return _null_counters
+
+    def __exit__(self, *exc):
+        pass
+
+_null_counters = _NullCounters()
+_null_span = _NullSpan()
+
+def span(name, **counters):
+    """
+    This function times a block of code as one event. The with statement gives the counter dictionary, so the
+    block can add counters that are only known at its end:\n
+        with span("write", rows=n) as counters:
+            counters["bytes_written"] = f.write(data)
+    """
+    if not collector.enabled:
+        return _null_span
+    return _Span(name, counters)
+
+def instrumented(name=None, counters=None):
+    """
+    This function is a decorator that records every call of a function as one event while the collector is
+    enabled.\n
+    Args:
+        name : Event name (defaults to the qualified function name)
+        counters : Optional function counters(result, *args, **kwargs) giving the counter dictionary of a call
+    """
+    def decorate(function):
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not collector.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter_ns()
+            result = function(*args, **kwargs)
+            duration = time.perf_counter_ns() - start
+            collector.record(label, start, duration, counters(result, *args, **kwargs) if counters else None)
+            return result
+        return wrapper
+    return decorate
+
+@contextmanager
+def tracing(json_path=None, chrome_path=None, clear=True):
+    """
+    This function enables the collector for a with block and writes the trace files at its end.\n
+    Args:
+        json_path : Optional path of the JSON report
+        chrome_path : Optional path of the Chrome trace
+        clear : Forget the events recorded before the block
+    """
+    if clear:
+        collector.clear()
+    collector.enable()
+    try:
+        yield collector
+    finally:
+        collector.disable()
+        if json_path is not None:
+            collector.to_json(json_path)
+        if chrome_path is not None:
+            collector.to_chrome_trace(chrome_path)
+
+def _write_on_exit(path):
+    collector.disable()
+    collector.to_chrome_trace(path)
+    collector.to_json(os.path.splitext(path)[0] + "_summary.json")
+
+# Opt-in for whole scripts: MIE_TRACE=trace.json python mie_data_ext.py writes a Chrome trace (and a
+# trace_summary.json report) when the script ends
+if os.environ.get("MIE_TRACE"):
+    collector.enable()
+    atexit.register(_write_on_exit, os.environ["MIE_TRACE"])
+
+# Example usage:
+if __name__ == "__main__":
+    import numpy as np
+    from mie_engine import batch_scattering_function
+
+    with tracing("trace_summary.json", "trace.json"):
+        with span("example sweep") as counters:
+            theta, SL, SR, SU = batch_scattering_function(1.33257 + 1.67e-8j, 632, np.linspace(1000, 20000, 20),
+                                                          angularResolution=0.1)
+            counters["particles"] = len(SL)
+    collector.print_summary()
@@ -0,0 +1,158 @@
+import numpy as np
+from scipy.interpolate import CubicSpline
+from mie_engine import mie_ab, mie_S1_S2, scattering_angles, finish_scattering_function
+
+class AdaptiveScattering:
+    """
+    This class samples the Mie amplitudes of one particle on an adaptive angle grid.\n
+    The grid starts with points_per_fringe points per fringe period (about pi / x radians) and every interval is
+    then checked at its midpoint: the exact value there is compared with the cubic spline through the points so
+    far, and intervals whose relative intensity error is above tol are bisected again, down to min_step. Smooth
+    regions stop after one check, while the deep minima and the fast fringes are refined until they meet the
+    tolerance. As in MieSurrogate, the spline goes through the real and imaginary parts of S1 and S2 rather than
+    log SL and log SR, because the amplitudes stay smooth through the zeros of the intensity.\n
+    Relative errors are measured against max(S, floor x largest S), so that the minima are resolved down to
+    floor times the forward peak. Every checked midpoint is kept, so no evaluation is wasted.\n
+    Input the parameters in the following format -\n
+    Args:
+        m : Relative refractive index (particle / medium)
+        x : Size parameter
+        minAngle, maxAngle : Angle range in degrees
+        tol : Target relative error of SL and SR between the sampled angles
+        min_step : Smallest angle step in degrees
+        floor : Relative intensity floor of the error measure
+        points_per_fringe : Points per fringe period of the starting grid
+        max_points : Largest number of sampled angles (the refinement stops there)
+    """
+    def __init__(self, m, x, minAngle=0, maxAngle=180, tol=1e-2, min_step=0.001, floor=1e-6, points_per_fringe=2,
+                 max_points=10**6):
+        if x <= 0:
+            raise ValueError("The size parameter must be positive")
+        self.m = m
+        self.x = x
+        self.tol = tol
+        self.floor = floor
+        self.an, self.bn = mie_ab(m, x)
+
+        # Starting grid: points_per_fringe points per fringe, and at least one point per degree
+        lo, hi = np.deg2rad(minAngle), np.deg2rad(maxAngle)
+        step = min(np.pi / x / points_per_fringe, np.deg2rad(1))
+        self.theta = np.linspace(lo, hi, int(np.ceil((hi - lo) / step)) + 1)
+        self.S = self._exact(self.theta)
+        self.evaluations = self.theta.size
+        self.rounds = 0
+        self.converged = True
+
+        # Check the midpoints of the open intervals (given by their left point) and bisect the ones off by more
+        # than tol, until every interval meets the tolerance or reaches min_step
+        min_width = 2 * np.deg2rad(min_step)
+        intervals = np.arange(self.theta.size - 1)
+        while intervals.size:
+            if self.theta.size + intervals.size > max_points:
+                self.converged = False
+                break
+            self.rounds += 1
+            spline = CubicSpline(self.theta, self.S, axis=1)
+            middle = 0.5 * (self.theta[intervals] + self.theta[intervals + 1])
+            exact = self._exact(middle)
+            self.evaluations += middle.size
+            refine = (self._error(spline(middle), exact) > tol) & \
+                     (self.theta[intervals + 1] - self.theta[intervals] > min_width)
+
+            # Insert the midpoints and find where the refined intervals and their new halves moved to
+            order = np.argsort(np.concatenate([self.theta, middle]), kind="stable")
+            position = np.empty_like(order)
+            position[order] = np.arange(order.size)
+            self.theta = np.concatenate([self.theta, middle])[order]
+            self.S = np.concatenate([self.S, exact], axis=1)[:, order]
+            intervals = np.sort(np.concatenate([position[intervals[refine]],
+                                                position[self.theta.size - middle.size + np.flatnonzero(refine)]]))
+        self._spline = CubicSpline(self.theta, self.S, axis=1)
+
+    def _exact(self, theta):
+        # S1 and S2 at the given angles, shape (2, angles)
+        S1, S2 = mie_S1_S2(self.an, self.bn, np.cos(theta))
+        return np.concatenate([S1, S2])
+
+    def _error(self, fitted, exact):
+        # Largest relative error of SL and SR at every angle
+        fitted = (fitted.conjugate() * fitted).real
+        exact = (exact.conjugate() * exact).real
+        largest = (self.S.conjugate() * self.S).real.max(axis=1, keepdims=True)
+        return np.max(np.abs(fitted - exact) / np.maximum(exact, self.floor * largest), axis=0)
+
+    def intensity(self):
+        """
+        This function gives the sampled angles (radians) with SL and SR at them.
+        """
+        SL, SR = (self.S.conjugate() * self.S).real
+        return self.theta, SL, SR
+
+    def interpolate(self, theta):
+        """
+        This function gives SL and SR at any angles (radians) inside the sampled range, from the spline of S1, S2.
+        """
+        S = self._spline(np.asarray(theta, dtype=float))
+        SL, SR = (S.conjugate() * S).real
+        return SL, SR
+
+    def resample(self, angularResolution=0.01):
+        """
+        This function gives SL and SR on a uniform grid with the given step in degrees, e.g. for the exports
+        and plots that expect one.
+        """
+        theta = np.deg2rad(np.linspace(np.rad2deg(self.theta[0]), np.rad2deg(self.theta[-1]),
+                                       int(round(np.rad2deg(self.theta[-1] - self.theta[0]) / angularResolution)) + 1))
+        SL, SR = self.interpolate(theta)
+        return theta, SL, SR
+
+def adaptive_scattering_function(m, wavelength, diameter, nMedium=1.0, minAngle=0, maxAngle=180,
+                                 angularResolution=None, angleMeasure='radians', normalization=None, tol=1e-2,
+                                 min_step=0.001):
+    """
+    This function is an adaptive version of ScatteringFunction for one particle.\n
+    The angles are sampled by AdaptiveScattering. With angularResolution the result is resampled onto the
+    uniform grid of ScatteringFunction; without it the adaptive angles are returned, which are not equally spaced.\n
+    Input the parameters in the following format -\n
+    Args:
+        m : Refractive index of the particle
+        wavelength : Wavelength of light in nanometers
+        diameter : Diameter of the particle in nanometers
+        nMedium : Refractive index of the surrounding medium
+        minAngle, maxAngle : Angle range in degrees
+        angularResolution : Step of the uniform output grid in degrees (None keeps the adaptive angles)
+        angleMeasure : 'radians', 'degrees' or 'gradians' for the returned angles
+        normalization : None, 'max' or 'total'
+        tol, min_step : Tolerance and smallest step in degrees of AdaptiveScattering
+    Returns:
+        measure, SL, SR, SU
+    """
+    nMedium = np.real(nMedium)
+    m = m / nMedium
+    wavelength = wavelength / nMedium
+    sampler = AdaptiveScattering(m, np.pi * diameter / wavelength, minAngle, maxAngle, tol, min_step)
+
+    if angularResolution is None:
+        # The same angle measures as scattering_angles
+        theta, SL, SR = sampler.intensity()
+        if angleMeasure in ['radians', 'RADIANS', 'rad', 'RAD']:
+            measure = theta
+        elif angleMeasure in ['gradians', 'GRADIANS', 'grad', 'GRAD']:
+            measure = np.rad2deg(theta) / 200
+        else:
+            measure = np.rad2deg(theta)
+    else:
+        measure, theta, _ = scattering_angles(minAngle, maxAngle, angularResolution, angleMeasure=angleMeasure)
+        SL, SR = sampler.interpolate(theta)
+    return finish_scattering_function(measure, SL, SR, wavelength, diameter, normalization=normalization)
+
+# Example usage:
+if __name__ == "__main__":
+    m = 1.33257 + 1.67E-08j    # Refractive index
+    w = 632                    # Wavelength in nanometers
+    r = 30000                  # Radius in nanometers
+
+    sampler = AdaptiveScattering(m, np.pi * 2 * r / w)
+    print(sampler.evaluations, "angles instead of", 18001, "at 0.01 degrees")
+    theta, SL, SR, SU = adaptive_scattering_function(m, w, 2 * r, angularResolution=0.01, angleMeasure='degrees')
+    print(theta.shape, SL.shape)
@@ -0,0 +1,294 @@
+import os
+import glob
+import hashlib
+import zipfile
+from collections import OrderedDict
+import numpy as np
+from mie_engine import scattering_angles, scattering_intensity, finish_scattering_function
+from instrumentation import instrumented, span
+
+class MieCache:
+    """
+    This class is a two tier (memory + disk) cache for Mie angular tables.\n
+    Tables hold the unnormalized |S1|^2 and |S2|^2 on a uniform angle grid (start, step, count), keyed by a content
+    hash of (m, wavelength, diameter, nMedium, step) plus the grid start. A request for any window that lies on a
+    cached grid is served by slicing the cached table, so e.g. (31, 33) is answered from a cached (30, 50).
+    Normalization, q-space and the angle measure are applied after slicing, so they never cause a recomputation.
+    Lookups give copies, so callers may change the returned arrays in place.\n
+    The disk tier may be shared by several processes: a table is written to a temporary file (which is not a .npz
+    file, so other processes never see it half-written) and then renamed into place.\n
+    Input the parameters in the following format -\n
+    Args:
+        cache_dir : Folder for the disk tier (None keeps the cache in memory only)
+        max_memory_bytes : Size cap of the in-memory LRU tier
+        max_disk_bytes : Size cap of the disk tier; the least recently used files are deleted first
+        span : Optional (minAngle, maxAngle) window in degrees that is computed on every miss, so that later
+               windows inside it are served from the cache (e.g. (0, 180))
+    """
+    def __init__(self, cache_dir=None, max_memory_bytes=256 * 2**20, max_disk_bytes=2 * 2**30, span=None):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.span = span
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def parameter_key(m, wavelength, diameter, nMedium, step):
+        """
+        This function gives the content hash of the parameters that define a family of angle grids.
+        """
+        m = complex(m)
+        values = (m.real, m.imag, float(wavelength), float(diameter), float(np.real(nMedium)), float(f"{step:.12g}"))
+        return hashlib.sha256(",".join(v.hex() for v in values).encode()).hexdigest()
+
+    @staticmethod
+    def _slice(table, start, step, count):
+        # Position of the requested grid inside the cached grid, or None if it is not a sub-grid of it
+        if not np.isclose(step, table["step"], rtol=1e-9, atol=0):
+            return None
+        offset = (start - table["start"]) / table["step"]
+        first = int(round(offset))
+        if abs(offset - first) > 1e-6 or first < 0 or first + count > table["SL"].size:
+            return None
+        return slice(first, first + count)
+
+    def _store_memory(self, key, table):
+        # Insert as most recently used and evict the least recently used tables above the size cap
+        if key in self.memory:
+            self.memory_bytes -= self.memory.pop(key)["nbytes"]
+        table["nbytes"] = table["SL"].nbytes + table["SR"].nbytes
+        self.memory[key] = table
+        self.memory_bytes += table["nbytes"]
+        while self.memory_bytes > self.max_memory_bytes and len(self.memory) > 1:
+            _, old = self.memory.popitem(last=False)
+            self.memory_bytes -= old["nbytes"]
+
+    def _store_disk(self, key, table):
+        if self.cache_dir is None:
+            return
+        path = os.path.join(self.cache_dir, f"{key[0]}-{key[1]}.npz")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with span("MieCache.store_disk") as counters:
+            # Written through a file object so that np.savez does not append .npz to the temporary name
+            with open(tmp_path, "wb") as f:
+                np.savez(f, grid=np.array([table["start"], table["step"]]), SL=table["SL"], SR=table["SR"])
+            os.replace(tmp_path, path)
+            counters["bytes_written"] = os.path.getsize(path)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        # Delete the least recently used files until the disk tier is below its size cap. Another process may
+        # replace or delete a file at any time, so the files that are gone are skipped
+        files = []
+        for f in glob.glob(os.path.join(self.cache_dir, "*.npz")):
+            try:
+                stat = os.stat(f)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, f))
+        total = sum(size for _, size, _ in files)
+        for _, size, f in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    @instrumented("MieCache.lookup", lambda result, *args, **kwargs: {"hits": int(result is not None),
+                                                                       "misses": int(result is None)})
+    def lookup(self, m, wavelength, diameter, nMedium, start, step, count):
+        """
+        This function gives (SL, SR) on the grid start + step * arange(count) (degrees) if a cached table
+        contains it, else None. The arrays are copies of the cached table.
+        """
+        parameter_key = self.parameter_key(m, wavelength, diameter, nMedium, step)
+
+        # Memory tier
+        for key in list(self.memory):
+            if key[0] != parameter_key:
+                continue
+            window = self._slice(self.memory[key], start, step, count)
+            if window is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]["SL"][window].copy(), self.memory[key]["SR"][window].copy()
+
+        # Disk tier
+        if self.cache_dir is not None:
+            for path in glob.glob(os.path.join(self.cache_dir, f"{parameter_key}-*.npz")):
+                window_key = os.path.basename(path)[len(parameter_key) + 1:-len(".npz")]
+                if (parameter_key, window_key) in self.memory:
+                    continue
+                try:
+                    with np.load(path) as data:
+                        table = {"start": float(data["grid"][0]), "step": float(data["grid"][1]),
+                                 "SL": data["SL"], "SR": data["SR"]}
+                except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+                    continue
+                window = self._slice(table, start, step, count)
+                if window is not None:
+                    try:
+                        os.utime(path)
+                    except FileNotFoundError:
+                        pass
+                    self._store_memory((parameter_key, window_key), table)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return table["SL"][window].copy(), table["SR"][window].copy()
+
+        self.misses += 1
+        return None
+
+    def store(self, m, wavelength, diameter, nMedium, start, step, SL, SR):
+        """
+        This function stores unnormalized (SL, SR) tables on the grid start + step * arange(len(SL)) in both tiers.
+        """
+        parameter_key = self.parameter_key(m, wavelength, diameter, nMedium, step)
+        window_key = hashlib.sha256(f"{float(start).hex()},{len(SL)}".encode()).hexdigest()[:16]
+        table = {"start": float(start), "step": float(step), "SL": np.array(SL, dtype=float),
+                 "SR": np.array(SR, dtype=float)}
+        self._store_memory((parameter_key, window_key), table)
+        self._store_disk((parameter_key, window_key), table)
+        return table
+
+    def clear(self):
+        """
+        This function empties both tiers.
+        """
+        self.memory.clear()
+        self.memory_bytes = 0
+        if self.cache_dir is not None:
+            for f in glob.glob(os.path.join(self.cache_dir, "*.npz")):
+                try:
+                    os.remove(f)
+                except FileNotFoundError:
+                    pass
+
+_default_cache = None
+
+def default_cache():
+    """
+    This function gives the shared cache, stored in $MIE_CACHE_DIR or ~/.cache/msc-project/mie.
+    """
+    global _default_cache
+    if _default_cache is None:
+        cache_dir = os.environ.get("MIE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "msc-project", "mie"))
+        _default_cache = MieCache(cache_dir)
+    return _default_cache
+
+def cached_batch_intensity(m, wavelength, diameter, nMedium, start, step, count, cache=None):
+    """
+    This function gives unnormalized (SL, SR) on the grid start + step * arange(count) (degrees) for a batch of
+    particles through the cache.\n
+    Every particle is looked up on its own; the missing ones are computed together in one scattering_intensity
+    call (over the span of the cache if it covers the request) and stored.\n
+    Args:
+        m, wavelength, diameter : Scalars or arrays broadcast against each other (wavelength and diameter in nm)
+        nMedium : Refractive index of the surrounding medium
+        start, step, count : Uniform angle grid in degrees
+        cache : MieCache to use (defaults to default_cache())
+    Returns:
+        SL, SR : arrays of shape (broadcast shape of m, wavelength, diameter) + (count,)
+    """
+    if cache is None:
+        cache = default_cache()
+    m, wavelength, diameter = np.broadcast_arrays(np.asarray(m, dtype=complex), np.asarray(wavelength, dtype=float),
+                                                  np.asarray(diameter, dtype=float))
+    shape = m.shape
+    m, wavelength, diameter = m.ravel(), wavelength.ravel(), diameter.ravel()
+    SL = np.empty((m.size, count))
+    SR = np.empty((m.size, count))
+    missing = []
+    for i in range(m.size):
+        tables = cache.lookup(m[i], wavelength[i], diameter[i], nMedium, start, step, count)
+        if tables is None:
+            missing.append(i)
+        else:
+            SL[i], SR[i] = tables
+
+    if missing:
+        # Compute the configured span if it covers the request, otherwise just the requested window
+        first, last = 0, count - 1
+        tolerance = 1e-6 * step
+        if cache.span is not None and cache.span[0] - tolerance <= start and \
+                start + (count - 1) * step <= cache.span[1] + tolerance:
+            first = -int(np.floor((start - cache.span[0]) / step + 1e-6))
+            last = int(np.floor((cache.span[1] - start) / step + 1e-6))
+        grid = start + step * np.arange(first, last + 1)
+        missing = np.array(missing)
+        x = np.pi * diameter[missing] / (wavelength[missing] / np.real(nMedium))
+        SL_new, SR_new = scattering_intensity(m[missing] / np.real(nMedium), x, np.deg2rad(grid))
+        window = slice(-first, -first + count)
+        for i, SL_i, SR_i in zip(missing, SL_new, SR_new):
+            cache.store(m[i], wavelength[i], diameter[i], nMedium, grid[0], step, SL_i, SR_i)
+            SL[i], SR[i] = SL_i[window], SR_i[window]
+    return SL.reshape(shape + (count,)), SR.reshape(shape + (count,))
+
+def cached_intensity(m, wavelength, diameter, nMedium, start, step, count, cache=None):
+    """
+    This function gives unnormalized (SL, SR) on the grid start + step * arange(count) (degrees) through the cache.\n
+    Args:
+        m, wavelength, diameter, nMedium : Same as ScatteringFunction (wavelength and diameter in nanometers)
+        start, step, count : Uniform angle grid in degrees
+        cache : MieCache to use (defaults to default_cache())
+    """
+    return cached_batch_intensity(complex(m), float(wavelength), float(diameter), nMedium, start, step, count, cache)
+
+def cached_batch_scattering_function(m, wavelength, diameter, nMedium=1.0, minAngle=0, maxAngle=180,
+                                     angularResolution=0.5, space='theta', angleMeasure='radians', normalization=None,
+                                     cache=None):
+    """
+    This function is a cached drop-in for mie_engine.batch_scattering_function: the same arguments and outputs,
+    with every particle served from the cache when it was computed before (by this or an earlier run).\n
+    Input the parameters in the following format -\n
+    Args:
+        m, wavelength, diameter, nMedium, minAngle, maxAngle, angularResolution, space, angleMeasure, normalization :
+            Same as batch_scattering_function (wavelength and diameter in nanometers)
+        cache : MieCache to use (defaults to default_cache())
+    Returns:
+        measure, SL, SR, SU : SL, SR and SU have shape (broadcast shape of m, wavelength, diameter) + (angles,)
+    """
+    measure, theta, q_space = scattering_angles(minAngle, maxAngle, angularResolution, space, angleMeasure)
+    theta_deg = np.rad2deg(theta)
+    step = (theta_deg[-1] - theta_deg[0]) / (theta_deg.size - 1) if theta_deg.size > 1 else angularResolution
+
+    SL, SR = cached_batch_intensity(m, wavelength, diameter, nMedium, theta_deg[0], step, theta_deg.size, cache)
+    _, wavelength, diameter = np.broadcast_arrays(np.asarray(m), np.asarray(wavelength, dtype=float) / np.real(nMedium),
+                                                  np.asarray(diameter, dtype=float))
+    return finish_scattering_function(measure, SL, SR, wavelength, diameter, q_space, normalization)
+
+def cached_scattering_function(m, wavelength, diameter, nMedium=1.0, minAngle=0, maxAngle=180, angularResolution=0.5,
+                               space='theta', angleMeasure='radians', normalization=None, cache=None):
+    """
+    This function is a cached drop-in for PyMieScatt.ScatteringFunction for a single particle.\n
+    Input the parameters in the following format -\n
+    Args:
+        m, wavelength, diameter, nMedium, minAngle, maxAngle, angularResolution, space, angleMeasure, normalization :
+            Same as ScatteringFunction (wavelength and diameter in nanometers)
+        cache : MieCache to use (defaults to default_cache())
+    Returns:
+        measure, SL, SR, SU
+    """
+    return cached_batch_scattering_function(complex(m), float(wavelength), float(diameter), nMedium, minAngle,
+                                            maxAngle, angularResolution, space, angleMeasure, normalization, cache)
+
+# Example usage:
+if __name__ == "__main__":
+    m = 1.33257 + 1.67e-8j  # refractive index
+    r = 10  # microns
+    diameter = 2 * r * 1000  # nm
+    wavelength = 632  # nm
+
+    cache = MieCache(span=(30, 60))
+    for min_angle, max_angle in [(30, 32), (31, 33), (30, 35), (32, 37), (30, 40), (35, 45), (30, 50)]:
+        theta, SL, SR, SU = cached_scattering_function(m, wavelength, diameter, minAngle=min_angle, maxAngle=max_angle,
+                                                       angularResolution=0.01, cache=cache)
+    print(f"hits = {cache.hits}, misses = {cache.misses}")
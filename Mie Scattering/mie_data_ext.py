@@ -1,13 +1,18 @@
-import PyMieScatt as ps
+import os
+import sys
 import numpy as np
-import pandas as pd
+from mie_cache import cached_batch_scattering_function
+
+# The export layer lives in the Data Export folder
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Data Export"))
+from scattering_io import write_table
 
 m = 1.33257 + 1.67E-08j    # Refractive index
 w = 630                   # Wavelength in nanometers
 r = 1000                   # Radius in nanometers
 d = 2*r  
 
-theta, SL, SR, SU = ps.ScatteringFunction(m, w, d, angularResolution=0.1)
+theta, SL, SR, SU = cached_batch_scattering_function(m, w, d, angularResolution=0.1)
 theta_deg = theta*(180/np.pi)
 data = {
     "Angle(degree)":theta_deg,
@@ -15,8 +20,7 @@ data = {
     "Parallel":SR,
     "Unpolarized":SU
 }
-#Create a dataframe 
-df = pd.DataFrame(data)
+parameters = {"m": [m.real, m.imag], "wavelength_nm": w, "radius_nm": r, "angularResolution": 0.1}
 
-#Save the data in CSV format in current directory
-df.to_csv("Mie Scattering Data")
\ No newline at end of file
+#Save the data as a columnar table in current directory (open it with scattering_io.open_table)
+write_table("Mie Scattering Data", data, metadata=parameters)
\ No newline at end of file
@@ -0,0 +1,344 @@
+import numpy as np
+from instrumentation import instrumented
+
+# Above this number of series terms (x of about 1000) mie_S1_S2 sums the series in blocks of terms instead of
+# building the whole pi_n/tau_n tables
+STREAMING_N_MAX = 1000
+
+def mie_n_max(x):
+    """
+    This function gives the number of series terms needed for size parameter x (Wiscombe criterion, as in PyMieScatt).\n
+    Args:
+        x : Size parameter (scalar or array)
+    """
+    return np.round(2 + np.asarray(x) + 4 * np.asarray(x)**(1/3)).astype(int)
+
+@instrumented("mie_ab", lambda result, *args, **kwargs: {"particles": result[0].shape[0],
+                                                          "n_max": result[0].shape[1]})
+def mie_ab(m, x, n_max=None):
+    """
+    This function calculates the Mie coefficients a_n and b_n for a whole batch of particles at once.\n
+    The particles are padded to a common number of terms; a_n = b_n = 0 beyond each particle's own n_max,
+    so the padded terms never contribute to the series.\n
+    Input the parameters in the following format -\n
+    Args:
+        m : Relative refractive index (scalar or array)
+        x : Size parameter (scalar or array, broadcast against m)
+        n_max : Number of terms to compute (defaults to the largest n_max of the batch)
+    Returns:
+        an, bn : complex arrays of shape (batch, n_max)
+    """
+    m, x = np.broadcast_arrays(np.asarray(m, dtype=complex), np.asarray(x, dtype=float))
+    m = m.ravel()
+    x = x.ravel()
+    mx = m * x
+
+    # Number of terms for every particle and for the padded batch
+    nmax = mie_n_max(x)
+    if n_max is None:
+        n_max = int(nmax.max())
+    n = np.arange(1, n_max + 1)
+    active = n[np.newaxis, :] <= nmax[:, np.newaxis]
+
+    # Logarithmic derivative D_n(mx) by downward recurrence (B&H Equation 4.89), stable for all n.
+    # The extra 8|mx|^(1/3) start terms are needed for convergence at large, nearly real mx.
+    nmx = int(np.round(max(n_max, np.abs(mx).max()) + 8 * np.abs(mx).max()**(1/3) + 16))
+    Dn = np.zeros(x.shape, dtype=complex)
+    D = np.zeros((x.size, n_max), dtype=complex)
+    for i in range(nmx, 1, -1):
+        Dn = i / mx - 1 / (Dn + i / mx)
+        if i - 1 <= n_max:
+            D[:, i - 2] = Dn
+
+    # Riccati-Bessel functions psi_n(x) and chi_n(x) by upward recurrence (B&H BHMIE),
+    # frozen once a particle has passed its own n_max so that the padding cannot overflow
+    psi = np.zeros((x.size, n_max))
+    chi = np.zeros((x.size, n_max))
+    psi_prev, psi_curr = np.cos(x), np.sin(x)
+    chi_prev, chi_curr = -np.sin(x), np.cos(x)
+    for j in range(n_max):
+        order = j + 1
+        psi_next = np.where(active[:, j], (2 * order - 1) / x * psi_curr - psi_prev, psi_curr)
+        chi_next = np.where(active[:, j], (2 * order - 1) / x * chi_curr - chi_prev, chi_curr)
+        psi[:, j] = psi_next
+        chi[:, j] = chi_next
+        psi_prev, psi_curr = psi_curr, psi_next
+        chi_prev, chi_curr = chi_curr, chi_next
+
+    # psi_{n-1} and chi_{n-1} for every term
+    psi1 = np.concatenate([np.sin(x)[:, np.newaxis], psi[:, :-1]], axis=1)
+    chi1 = np.concatenate([np.cos(x)[:, np.newaxis], chi[:, :-1]], axis=1)
+    xi = psi - 1j * chi
+    xi1 = psi1 - 1j * chi1
+
+    # Mie coefficients (B&H Equation 4.88)
+    da = D / m[:, np.newaxis] + n / x[:, np.newaxis]
+    db = D * m[:, np.newaxis] + n / x[:, np.newaxis]
+    with np.errstate(all='ignore'):
+        an = (da * psi - psi1) / (da * xi - xi1)
+        bn = (db * psi - psi1) / (db * xi - xi1)
+    an = np.where(active, an, 0)
+    bn = np.where(active, bn, 0)
+    return an, bn
+
+@instrumented("mie_pi_tau", lambda result, *args, **kwargs: {"n_max": result[0].shape[0],
+                                                              "angles": result[0].shape[1]})
+def mie_pi_tau(mu, n_max):
+    """
+    This function calculates the angular functions pi_n and tau_n for every angle at once.\n
+    Args:
+        mu : cos(theta) for every angle (1-D array)
+        n_max : Number of terms
+    Returns:
+        pin, taun : arrays of shape (n_max, number of angles)
+    """
+    mu = np.asarray(mu, dtype=float)
+    pin = np.zeros((n_max, mu.size))
+    taun = np.zeros((n_max, mu.size))
+    p_prev = np.zeros_like(mu)
+    p_curr = np.ones_like(mu)
+    for j in range(n_max):
+        order = j + 1
+        pin[j] = p_curr
+        taun[j] = order * mu * p_curr - (order + 1) * p_prev
+        p_prev, p_curr = p_curr, ((2 * order + 1) * mu * p_curr - (order + 1) * p_prev) / order
+    return pin, taun
+
+@instrumented("mie_S1_S2", lambda result, an, *args, **kwargs: {"particles": an.shape[0], "n_max": an.shape[1],
+                                                                 "angles": result[0].shape[1]})
+def mie_S1_S2(an, bn, mu, max_chunk_elements=2**22, streaming=None):
+    """
+    This function sums the Mie series for S1 and S2 for a batch of coefficient sets against a shared angle grid.\n
+    The angle grid is processed in chunks so that the (n_max x angles) tables of pi_n/tau_n stay below
+    max_chunk_elements entries. For large particles the series is summed by mie_S1_S2_streaming instead.\n
+    Args:
+        an, bn : Mie coefficients of shape (batch, n_max)
+        mu : cos(theta) for every angle (1-D array)
+        max_chunk_elements : Upper bound on the size of one pi_n/tau_n table
+        streaming : Use mie_S1_S2_streaming (defaults to True above STREAMING_N_MAX terms)
+    Returns:
+        S1, S2 : complex arrays of shape (batch, number of angles)
+    """
+    mu = np.atleast_1d(np.asarray(mu, dtype=float))
+    n_max = an.shape[1]
+    if streaming is None:
+        streaming = n_max > STREAMING_N_MAX
+    if streaming:
+        return mie_S1_S2_streaming(an, bn, mu)
+    n = np.arange(1, n_max + 1)
+    n2 = (2 * n + 1) / (n * (n + 1))
+    a = an * n2
+    b = bn * n2
+
+    S1 = np.zeros((an.shape[0], mu.size), dtype=complex)
+    S2 = np.zeros((an.shape[0], mu.size), dtype=complex)
+    chunk = max(1, max_chunk_elements // max(n_max, 1))
+    for start in range(0, mu.size, chunk):
+        stop = min(start + chunk, mu.size)
+        pin, taun = mie_pi_tau(mu[start:stop], n_max)
+
+        # Real matrix products over the series index, for the real and imaginary parts separately
+        S1[:, start:stop] = (a.real @ pin + b.real @ taun) + 1j * (a.imag @ pin + b.imag @ taun)
+        S2[:, start:stop] = (a.real @ taun + b.real @ pin) + 1j * (a.imag @ taun + b.imag @ pin)
+    return S1, S2
+
+@instrumented("mie_S1_S2_streaming", lambda result, an, *args, **kwargs: {
+    "particles": an.shape[0], "n_max": an.shape[1], "angles": result[0].shape[1]})
+def mie_S1_S2_streaming(an, bn, mu, angle_chunk=16384, term_block=32):
+    """
+    This function sums the Mie series for S1 and S2 like mie_S1_S2, with memory that does not grow with n_max
+    times the number of angles (for x up to 10^4 and beyond).\n
+    The angles are split into equal chunks of at most angle_chunk angles. For every chunk pi_n and tau_n are
+    carried up the recurrence term_block terms at a time in two small reused tables (term_block x chunk, a few
+    MB, so they stay in cache) and every block is added to S1 and S2 before the next one overwrites it. Apart
+    from the outputs the memory is O(n_max + angles).\n
+    Args:
+        an, bn : Mie coefficients of shape (batch, n_max)
+        mu : cos(theta) for every angle (1-D array)
+        angle_chunk : Largest number of angles per chunk
+        term_block : Number of series terms per block
+    Returns:
+        S1, S2 : complex arrays of shape (batch, number of angles)
+    """
+    mu = np.atleast_1d(np.asarray(mu, dtype=float))
+    batch, n_max = an.shape
+    n = np.arange(1, n_max + 1)
+    n2 = (2 * n + 1) / (n * (n + 1))
+    # Real and imaginary parts stacked, so that one matrix product gives both
+    a = np.concatenate([(an * n2).real, (an * n2).imag])
+    b = np.concatenate([(bn * n2).real, (bn * n2).imag])
+
+    S1 = np.zeros((batch, mu.size), dtype=complex)
+    S2 = np.zeros((batch, mu.size), dtype=complex)
+    chunk = -(-mu.size // -(-mu.size // angle_chunk)) if mu.size else 1
+    pin = np.empty((term_block + 1, chunk))
+    taun = np.empty((term_block, chunk))
+    mu_pi = np.empty(chunk)
+    scaled = np.empty(chunk)
+    previous = np.empty(chunk)
+    for start in range(0, mu.size, chunk):
+        mu_c = mu[start:start + chunk]
+        k = mu_c.size
+        s1 = np.zeros((2 * batch, k))
+        s2 = np.zeros((2 * batch, k))
+
+        # pin[i] holds pi_n of the current block, pin[0] is carried over from the block before
+        pin[0, :k] = 1
+        previous[:k] = 0
+        for first in range(0, n_max, term_block):
+            rows = min(term_block, n_max - first)
+            pi_previous = previous[:k]
+            for i in range(rows):
+                order = first + i + 1
+                # tau_n = n mu pi_n - (n+1) pi_{n-1} and pi_{n+1} = ((2n+1) mu pi_n - (n+1) pi_{n-1}) / n,
+                # in place to keep the loop free of temporary arrays
+                np.multiply(mu_c, pin[i, :k], out=mu_pi[:k])
+                np.multiply(pi_previous, order + 1, out=scaled[:k])
+                np.multiply(mu_pi[:k], order, out=taun[i, :k])
+                np.subtract(taun[i, :k], scaled[:k], out=taun[i, :k])
+                np.multiply(mu_pi[:k], 2 * order + 1, out=pin[i + 1, :k])
+                np.subtract(pin[i + 1, :k], scaled[:k], out=pin[i + 1, :k])
+                np.divide(pin[i + 1, :k], order, out=pin[i + 1, :k])
+                pi_previous = pin[i, :k]
+
+            # Add the block to the sums, then carry pi_{n-1} and pi_n into the next block
+            pi_block = pin[:rows, :k]
+            tau_block = taun[:rows, :k]
+            s1 += a[:, first:first + rows] @ pi_block + b[:, first:first + rows] @ tau_block
+            s2 += a[:, first:first + rows] @ tau_block + b[:, first:first + rows] @ pi_block
+            previous[:k] = pin[rows - 1, :k]
+            pin[0, :k] = pin[rows, :k]
+        S1[:, start:start + k] = s1[:batch] + 1j * s1[batch:]
+        S2[:, start:start + k] = s2[:batch] + 1j * s2[batch:]
+    return S1, S2
+
+def scattering_angles(minAngle=0, maxAngle=180, angularResolution=0.5, space='theta', angleMeasure='radians'):
+    """
+    This function gives the angle grid used by ScatteringFunction for the given range.\n
+    Returns:
+        measure : Angles in the requested angleMeasure (in radians for q-space, converted to q later)
+        theta : The same angles in radians, used for the calculation
+        q_space : True if the measure has to be converted to q-space
+    """
+    _steps = int(1 + (maxAngle - minAngle) / angularResolution)
+
+    if angleMeasure in ['radians', 'RADIANS', 'rad', 'RAD']:
+        adjust = np.pi / 180
+    elif angleMeasure in ['gradians', 'GRADIANS', 'grad', 'GRAD']:
+        adjust = 1 / 200
+    else:
+        adjust = 1
+
+    if space in ['q', 'qspace', 'QSPACE', 'qSpace']:
+        _steps += 1
+        if minAngle == 0:
+            minAngle = 1e-5
+        measure = np.linspace(minAngle, maxAngle, _steps) * np.pi / 180
+        q_space = True
+    else:
+        measure = np.linspace(minAngle, maxAngle, _steps) * adjust
+        q_space = False
+    theta = np.linspace(minAngle, maxAngle, _steps) * np.pi / 180
+    return measure, theta, q_space
+
+def normalize_intensity(SL, SR, SU, measure, normalization=None):
+    """
+    This function applies the ScatteringFunction normalization ('max' or 'total') along the angle axis.
+    """
+    if normalization in ['m', 'M', 'max', 'MAX']:
+        SL = SL / np.max(SL, axis=-1, keepdims=True)
+        SR = SR / np.max(SR, axis=-1, keepdims=True)
+        SU = SU / np.max(SU, axis=-1, keepdims=True)
+    elif normalization in ['t', 'T', 'total', 'TOTAL']:
+        # Trapezoidal integral over the measure
+        def total(S):
+            return np.sum((S[..., 1:] + S[..., :-1]) * np.diff(measure, axis=-1) / 2, axis=-1, keepdims=True)
+        SL = SL / total(SL)
+        SR = SR / total(SR)
+        SU = SU / total(SU)
+    return SL, SR, SU
+
+def finish_scattering_function(measure, SL, SR, wavelength, diameter, q_space=False, normalization=None):
+    """
+    This function turns |S1|^2 and |S2|^2 into the ScatteringFunction outputs (SU, normalization and q-space).\n
+    Args:
+        measure : Angles as returned by scattering_angles
+        SL, SR : |S1|^2 and |S2|^2 with the angles on the last axis
+        wavelength, diameter : Wavelength in the medium and diameter in nanometers (only used in q-space)
+        q_space : Convert the measure to q-space
+        normalization : None, 'max' or 'total'
+    """
+    SU = (SR + SL) / 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        SL, SR, SU = normalize_intensity(SL, SR, SU, measure, normalization)
+    if q_space:
+        wavelength = np.asarray(wavelength, dtype=float)
+        diameter = np.asarray(diameter, dtype=float)
+        measure = (4 * np.pi / wavelength[..., np.newaxis]) * np.sin(measure / 2) * (diameter[..., np.newaxis] / 2)
+    return measure, SL, SR, SU
+
+@instrumented("scattering_intensity", lambda result, *args, **kwargs: {
+    "particles": result[0].size // max(result[0].shape[-1], 1), "angles": result[0].shape[-1]})
+def scattering_intensity(m, x, theta):
+    """
+    This function calculates |S1|^2 and |S2|^2 for a batch of particles at arbitrary angles.\n
+    Args:
+        m : Relative refractive index (scalar or array)
+        x : Size parameter (scalar or array, broadcast against m)
+        theta : Scattering angles in radians (1-D array)
+    Returns:
+        SL, SR : arrays of shape (broadcast shape of m and x) + (angles,)
+    """
+    m, x = np.broadcast_arrays(np.asarray(m, dtype=complex), np.asarray(x, dtype=float))
+    theta = np.atleast_1d(np.asarray(theta, dtype=float))
+
+    # Evaluate every particle with x > 0; particles with x == 0 do not scatter
+    SL = np.zeros(x.shape + theta.shape)
+    SR = np.zeros(x.shape + theta.shape)
+    scattering = x > 0
+    if scattering.any():
+        an, bn = mie_ab(m[scattering], x[scattering])
+        S1, S2 = mie_S1_S2(an, bn, np.cos(theta))
+        SL[scattering] = (S1.conjugate() * S1).real
+        SR[scattering] = (S2.conjugate() * S2).real
+    return SL, SR
+
+def batch_scattering_function(m, wavelength, diameter, nMedium=1.0, minAngle=0, maxAngle=180, angularResolution=0.5,
+                              space='theta', angleMeasure='radians', normalization=None):
+    """
+    This function is a batched replacement for PyMieScatt.ScatteringFunction.\n
+    m, wavelength and diameter may be scalars or arrays; they are broadcast against each other and every
+    combination is evaluated against the same angle grid in one call. The keyword arguments and the returned
+    SL, SR, SU have the same meaning as in ScatteringFunction (SL = |S1|^2, SR = |S2|^2, SU = (SL+SR)/2).\n
+    Input the parameters in the following format -\n
+    Args:
+        m : Refractive index of the particle
+        wavelength : Wavelength of light in nanometers
+        diameter : Diameter of the particle in nanometers
+        nMedium : Refractive index of the surrounding medium
+        minAngle, maxAngle, angularResolution : Angle range and step in degrees
+        space : 'theta' or 'qspace'
+        angleMeasure : 'radians', 'degrees' or 'gradians' for the returned angles
+        normalization : None, 'max' or 'total'
+    Returns:
+        measure, SL, SR, SU : SL, SR and SU have shape (broadcast shape of m, wavelength, diameter) + (angles,)
+    """
+    nMedium = np.real(nMedium)
+    m = np.asarray(m, dtype=complex) / nMedium
+    wavelength = np.asarray(wavelength, dtype=float) / nMedium
+    diameter = np.asarray(diameter, dtype=float)
+    m, wavelength, diameter = np.broadcast_arrays(m, wavelength, diameter)
+    x = np.pi * diameter / wavelength
+
+    measure, theta, q_space = scattering_angles(minAngle, maxAngle, angularResolution, space, angleMeasure)
+    SL, SR = scattering_intensity(m, x, theta)
+    return finish_scattering_function(measure, SL, SR, wavelength, diameter, q_space, normalization)
+
+# Example usage:
+if __name__ == "__main__":
+    m = 1.33257 + 1.67E-08j    # Refractive index
+    w = 632                    # Wavelength in nanometers
+    radii = np.array([500, 5000, 50000])  # Radii in nanometers
+
+    theta, SL, SR, SU = batch_scattering_function(m, w, 2 * radii, angularResolution=0.1)
+    print(theta.shape, SL.shape)
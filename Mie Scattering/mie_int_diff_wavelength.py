@@ -1,6 +1,6 @@
-import PyMieScatt as ps
 import numpy as np
 import matplotlib.pyplot as plt
+from mie_cache import cached_batch_scattering_function
 
 # Input parameters
 refractive_index = 1.33257 + 1.67E-08j
@@ -10,16 +10,16 @@ wavelengths = [532, 650, 800]  # Wavelengths in nanometers
 # Create a figure
 fig, ax = plt.subplots(figsize=(12, 8))
 
-# Loop over wavelengths
-for w in wavelengths:
-    d = 2 * radius  # Diameter
+d = 2 * radius  # Diameter
 
-    # Calculate scattering intensity
-    theta, SL, SR, SU = ps.ScatteringFunction(refractive_index, w, d)
-    theta_deg = theta * (180 / np.pi)
+# Calculate scattering intensity for all wavelengths in one batch, through the Mie cache so that reruns reuse them
+theta, SL, SR, SU = cached_batch_scattering_function(refractive_index, np.array(wavelengths), d)
+theta_deg = theta * (180 / np.pi)
 
+# Loop over wavelengths
+for w, SU_w in zip(wavelengths, SU):
     # Plot the scattering intensity
-    ax.semilogy(theta_deg, SU, label=f'λ = {w} nm')
+    ax.semilogy(theta_deg, SU_w, label=f'λ = {w} nm')
 
 # Create a table inside the graph to display parameter values
 column_labels = ['Input Parameters', 'Values']
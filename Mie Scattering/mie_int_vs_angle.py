@@ -1,13 +1,13 @@
-import PyMieScatt as ps
 import numpy as np
 import matplotlib.pyplot as plt
+from mie_cache import cached_scattering_function
 
 m = 1.33257 + 1.67E-08j    # Refractive index
 w = 532                    # Wavelength in nanometers
 r = 1000                   # Radius in nanometers
 d = 2*r  
 
-theta, SL, SR, SU = ps.ScatteringFunction(m, w, d)
+theta, SL, SR, SU = cached_scattering_function(m, w, d)
 theta_deg = theta*(180/np.pi)
 plt.figure(figsize=(10, 6))
 
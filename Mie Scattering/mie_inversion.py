@@ -0,0 +1,418 @@
+import math
+import numpy as np
+from mie_engine import mie_ab, mie_n_max, mie_pi_tau
+
+# Order of the fitted parameters: radius (um), real and imaginary refractive index, log of the scale
+PARAMETERS = ("r", "n", "k", "scale")
+
+def mie_ab_derivatives(m, x, n_max=None):
+    """
+    This function calculates the Mie coefficients a_n and b_n of one particle together with their exact
+    derivatives with respect to the size parameter x and the relative refractive index m.\n
+    The coefficients are those of mie_ab (B&H Equation 4.88, with the same recurrences). They are differentiated
+    through the Riccati-Bessel relations psi_n' = psi_{n-1} - n psi_n / x and psi_{n-1}' = n psi_{n-1} / x - psi_n
+    (the same for xi_n) and the Riccati equation of the logarithmic derivative, D_n'(z) = n(n+1)/z^2 - 1 - D_n^2.
+    a_n and b_n are analytic in m, so the derivative with respect to the imaginary part k of m is i da_n/dm.
+    The recurrences run on Python scalars, which is faster than numpy for a single particle.\n
+    Input the parameters in the following format -\n
+    Args:
+        m : Relative refractive index
+        x : Size parameter
+        n_max : Number of terms (defaults to mie_n_max(x))
+    Returns:
+        an, bn, dan_dx, dbn_dx, dan_dm, dbn_dm : complex arrays of n_max terms
+    """
+    m = complex(m)
+    x = float(x)
+    if n_max is None:
+        n_max = int(mie_n_max(x))
+    mx = m * x
+    n = np.arange(1, n_max + 1)
+
+    # Logarithmic derivative D_n(mx) by downward recurrence, started as in mie_ab
+    nmx = int(round(max(n_max, abs(mx)) + 8 * abs(mx)**(1/3) + 16))
+    D = [0j] * n_max
+    Dn = 0j
+    for i in range(nmx, 1, -1):
+        Dn = i / mx - 1 / (Dn + i / mx)
+        if i - 1 <= n_max:
+            D[i - 2] = Dn
+    D = np.array(D)
+
+    # Riccati-Bessel functions psi_n(x) and chi_n(x) for n = 0 .. n_max by upward recurrence
+    psi = [math.sin(x)]
+    chi = [math.cos(x)]
+    psi_prev, chi_prev = math.cos(x), -math.sin(x)
+    for order in range(1, n_max + 1):
+        psi_prev, psi_curr = psi[-1], (2 * order - 1) / x * psi[-1] - psi_prev
+        chi_prev, chi_curr = chi[-1], (2 * order - 1) / x * chi[-1] - chi_prev
+        psi.append(psi_curr)
+        chi.append(chi_curr)
+    psi = np.array(psi)
+    xi = psi - 1j * np.array(chi)
+    psi_n, psi1, xi_n, xi1 = psi[1:], psi[:-1], xi[1:], xi[:-1]
+
+    # Derivatives of the Riccati-Bessel functions and of D_n
+    dpsi_n, dpsi1 = psi1 - n / x * psi_n, n / x * psi1 - psi_n
+    dxi_n, dxi1 = xi1 - n / x * xi_n, n / x * xi1 - xi_n
+    dD = n * (n + 1) / mx**2 - 1 - D**2
+
+    # a_n = (A psi_n - psi_{n-1}) / (A xi_n - xi_{n-1}) with A = D_n/m + n/x, and b_n the same with
+    # B = m D_n + n/x; the quotient rule gives the derivatives from those of the numerator and denominator
+    A, dA_dx, dA_dm = D / m + n / x, dD - n / x**2, dD * x / m - D / m**2
+    B, dB_dx, dB_dm = m * D + n / x, m**2 * dD - n / x**2, D + mx * dD
+    result = []
+    for C, dC_dx, dC_dm in ((A, dA_dx, dA_dm), (B, dB_dx, dB_dm)):
+        with np.errstate(all='ignore'):
+            denominator = C * xi_n - xi1
+            coefficient = (C * psi_n - psi1) / denominator
+            d_dx = (dC_dx * psi_n + C * dpsi_n - dpsi1 - coefficient * (dC_dx * xi_n + C * dxi_n - dxi1)) / denominator
+            d_dm = dC_dm * (psi_n - coefficient * xi_n) / denominator
+        result.append((coefficient, d_dx, d_dm))
+    (an, dan_dx, dan_dm), (bn, dbn_dx, dbn_dm) = result
+    return an, bn, dan_dx, dbn_dx, dan_dm, dbn_dm
+
+class PatternFitter:
+    """
+    This class finds the radius, the complex refractive index and the intensity scale of a particle from its
+    measured angular pattern, by nonlinear least squares on the log-intensity.\n
+    The model is scale x SL (or SR, SU) of the Mie series on the detector angles. The residuals are
+    log(model + eps) - log(measured + eps), with eps = floor x the largest measured value, so every fringe
+    counts whatever its brightness. They are minimized by Levenberg-Marquardt with the exact Jacobian: the
+    derivatives of a_n and b_n from mie_ab_derivatives are summed against the same pi_n and tau_n tables as the
+    pattern, so one Jacobian costs about as much as three patterns and no finite differences are needed. The
+    pi_n/tau_n tables of the detector angles are computed once and grown when a larger particle needs more terms.\n
+    The sum of squares has narrow local minima, a few tenths of a unit of size parameter apart (and narrower still
+    where the resonance ripple of large particles shows), so a cold fit starts from the fringe frequency: the
+    strongest peaks of the spectrum of the detrended log-intensity give radius estimates through a calibration
+    table of the fringe frequency against the radius (computed once for m0). The minima are just as narrow in the
+    real part of m (about 0.2 / x), so around every estimate the scan covers a grid of n within n_spread of m0,
+    each n with its own radius estimate (the frequency at that n) and radii in steps of the size parameter, with
+    the scale solved in closed form and a few angles per fringe. Levenberg-Marquardt is run from the best minima.
+    Consecutive frames of a particle stream are warm started instead: a short scan of the radius around the
+    previous one (m kept) and one Levenberg-Marquardt run, with a cold fit only when the result is clearly worse.\n
+    With a surrogate (a MieSurrogate of m0 / nMedium over the detector angles, see mie_surrogate.py) the patterns
+    at m0 - the calibration table and the radius scans - are interpolated instead of summed, whenever the size
+    parameters are inside its range. Levenberg-Marquardt always uses the exact series, since it needs the
+    derivatives with respect to m, so the surrogate only has to be accurate enough to find the right minimum.\n
+    The uncertainties are the standard deviations of the covariance s^2 (J^T J)^-1 at the optimum, with s^2 the
+    residual variance, for the parameters that are fitted.\n
+    Input the parameters in the following format -\n
+    Args:
+        theta_deg : Detector angles in degrees (1-D array, uniform for the fringe estimate)
+        wavelength : Wavelength of light in nanometers
+        nMedium : Refractive index of the surrounding medium
+        m0 : Starting refractive index of the particle (and its value for the parameters kept fixed)
+        component : 'SL', 'SR' or 'SU'
+        fixed : Names of PARAMETERS (other than r) kept at their starting values, e.g. ('k',) for a transparent particle
+        floor : Relative intensity floor of the log residuals
+        r_range : (lo, hi) radii in micrometers allowed for the particle
+        calibration : Number of radii (geometric grid over r_range) of the fringe frequency calibration table
+        surrogate : MieSurrogate of m0 / nMedium covering theta_deg, used for the patterns at m0 (None: exact)
+    """
+    def __init__(self, theta_deg, wavelength=632, nMedium=1.0, m0=1.33257 + 1.67e-8j, component="SL", fixed=(),
+                 floor=1e-6, r_range=(0.5, 200), calibration=32, surrogate=None):
+        if component not in ("SL", "SR", "SU"):
+            raise ValueError("component must be 'SL', 'SR' or 'SU'")
+        if any(name not in PARAMETERS[1:] for name in fixed):
+            raise ValueError(f"The fixed parameters must be among {PARAMETERS[1:]}")
+        if surrogate is not None and (np.min(theta_deg) < surrogate.theta_range[0]
+                                      or np.max(theta_deg) > surrogate.theta_range[1]):
+            raise ValueError(f"The surrogate covers theta in {surrogate.theta_range} degrees only.\n"
+                             "Build it over the detector angles")
+        self.theta_deg = np.asarray(theta_deg, dtype=float)
+        self.mu = np.cos(np.deg2rad(self.theta_deg))
+        self.wavelength = wavelength
+        self.nMedium = np.real(nMedium)
+        self.m0 = complex(m0)
+        self.component = component
+        self.free = np.array([name not in fixed for name in PARAMETERS])
+        self.floor = floor
+        self.r_range = tuple(float(v) for v in r_range)
+        self.previous = None
+        self.surrogate = surrogate
+
+        # Angle tables (grown on demand) and the fringe frequency of a grid of radii, made increasing so that it
+        # can be inverted (the small radii have less than one fringe in the window)
+        self.pin = np.zeros((0, self.mu.size))
+        self.taun = np.zeros((0, self.mu.size))
+        self.step = (self.theta_deg[-1] - self.theta_deg[0]) / (self.theta_deg.size - 1)
+        self.r_table = np.geomspace(*self.r_range, calibration)
+        self.f_table = np.maximum.accumulate([self._fringe_peaks(I, 1)[0] for I in self.patterns(self.r_table,
+                                                                                                 self.m0)])
+
+    def size_parameter(self, r_um):
+        """
+        This function gives the size parameter of radius r_um (micrometers) in the medium.
+        """
+        return 2 * np.pi * np.asarray(r_um, dtype=float) * 1000 * self.nMedium / self.wavelength
+
+    def _tables(self, n_max):
+        # pi_n and tau_n of the detector angles for at least n_max terms, with the series weights applied
+        if self.pin.shape[0] < n_max:
+            rows = max(n_max, int(1.25 * self.pin.shape[0]))
+            pin, taun = mie_pi_tau(self.mu, rows)
+            n = np.arange(1, rows + 1)[:, np.newaxis]
+            n2 = (2 * n + 1) / (n * (n + 1))
+            self.pin, self.taun = pin * n2, taun * n2
+        return self.pin[:n_max], self.taun[:n_max]
+
+    def _intensity(self, S1, S2):
+        # The fitted component from the amplitudes (rows of S1, S2)
+        SL = (S1.conjugate() * S1).real
+        SR = (S2.conjugate() * S2).real
+        return {"SL": SL, "SR": SR, "SU": (SL + SR) / 2}[self.component]
+
+    def _sum(self, a, b, n_max):
+        # S1 and S2 of every row of coefficients (rows, n_max) with real matrix products, as in mie_S1_S2
+        pin, taun = self._tables(n_max)
+        S1 = (a.real @ pin + b.real @ taun) + 1j * (a.imag @ pin + b.imag @ taun)
+        S2 = (a.real @ taun + b.real @ pin) + 1j * (a.imag @ taun + b.imag @ pin)
+        return S1, S2
+
+    def patterns(self, r_um, m):
+        """
+        This function gives the unscaled patterns (component over theta_deg) of a batch of radii in micrometers
+        for one refractive index m of the particle, in one mie_ab batch (or from the surrogate, at its m and inside
+        its range of size parameters).
+        """
+        x = self.size_parameter(np.atleast_1d(r_um))
+        if (self.surrogate is not None and m / self.nMedium == self.surrogate.m
+                and self.surrogate.x_range[0] <= x.min() and x.max() <= self.surrogate.x_range[1]):
+            SL, SR = self.surrogate.intensity(x[:, np.newaxis], np.deg2rad(self.theta_deg))
+            return {"SL": SL, "SR": SR, "SU": (SL + SR) / 2}[self.component]
+        an, bn = mie_ab(m / self.nMedium, x)
+        return self._intensity(*self._sum(an, bn, an.shape[1]))
+
+    def model(self, params):
+        """
+        This function gives the model pattern and its Jacobian.\n
+        Args:
+            params : (radius in um, n, k, log of the scale)
+        Returns:
+            I, J : Model intensity over theta_deg and its derivatives, shape (angles, 4), in the order of PARAMETERS
+        """
+        r_um, n, k, log_scale = params
+        m = (n + 1j * k) / self.nMedium
+        x = float(self.size_parameter(r_um))
+        an, bn, dan_dx, dbn_dx, dan_dm, dbn_dm = mie_ab_derivatives(m, x)
+
+        # Amplitudes and their derivatives with respect to x and m in one product
+        S1, S2 = self._sum(np.array([an, dan_dx, dan_dm]), np.array([bn, dbn_dx, dbn_dm]), an.size)
+        scale = np.exp(log_scale)
+        I = scale * self._intensity(S1[:1], S2[:1])[0]
+
+        # d|S|^2 = 2 Re(conj(S) dS); dx/dr = x/r, dm/dn = 1/nMedium and dm/dk = i/nMedium
+        dS = [(S1[1] * x / r_um, S2[1] * x / r_um), (S1[2] / self.nMedium, S2[2] / self.nMedium),
+              (1j * S1[2] / self.nMedium, 1j * S2[2] / self.nMedium)]
+        J = np.empty((self.mu.size, 4))
+        for column, (dS1, dS2) in enumerate(dS):
+            dSL = 2 * (S1[0].conjugate() * dS1).real
+            dSR = 2 * (S2[0].conjugate() * dS2).real
+            J[:, column] = scale * {"SL": dSL, "SR": dSR, "SU": (dSL + dSR) / 2}[self.component]
+        J[:, 3] = I
+        return I, J
+
+    def _fringe_peaks(self, I, count):
+        # Frequencies (cycles per degree) of the strongest peaks of the spectrum of the detrended log-intensity,
+        # refined by parabolic interpolation as in window_features
+        log_I = np.log(np.maximum(I, self.floor * I.max()))
+        t = self.theta_deg - self.theta_deg.mean()
+        residual = log_I - log_I.mean() - (log_I @ t) / (t @ t) * t
+        n_fft = 4 * 2**int(np.ceil(np.log2(residual.size)))
+        power = np.abs(np.fft.rfft(residual * np.hanning(residual.size), n_fft))**2
+        power[0] = 0
+        inner = np.flatnonzero((power[1:-1] > power[:-2]) & (power[1:-1] >= power[2:])) + 1
+        peaks = inner[np.argsort(power[inner])[::-1][:count]]
+        left, centre, right = (np.log(power[peaks + s] + 1e-300) for s in (-1, 0, 1))
+        denominator = left - 2 * centre + right
+        shift = np.where(denominator < 0, 0.5 * (left - right) / np.where(denominator < 0, denominator, 1), 0.0)
+        return (peaks + np.clip(shift, -0.5, 0.5)) / (n_fft * self.step)
+
+    def _residuals(self, I, log_measured, eps):
+        return np.log(I + eps) - log_measured
+
+    def _grid_cost(self, log_measured, radii, m, eps, stride=1, chunk_size=128):
+        # Mean squared log residual of every radius for one m (every stride-th angle), with the scale solved in
+        # closed form
+        cost = np.empty(radii.size)
+        log_scale = np.empty(radii.size)
+        for start in range(0, radii.size, chunk_size):
+            part = slice(start, start + chunk_size)
+            log_model = np.log(self.patterns(radii[part], m)[:, ::stride] + eps)
+            log_scale[part] = (log_measured[::stride] - log_model).mean(axis=1)
+            cost[part] = ((log_model + log_scale[part, np.newaxis] - log_measured[::stride])**2).mean(axis=1)
+        return cost, log_scale
+
+    def _scan(self, log_measured, frequencies, eps, spread, step, n_spread, n_step, keep):
+        # Grid of (n, size parameter) around the radius estimate of every fringe frequency; the keep best points at
+        # least two steps apart
+        points, evaluations = [], 0
+        width = self.theta_deg[-1] - self.theta_deg[0]
+        for frequency in frequencies:
+            r = np.interp(frequency, self.f_table, self.r_table)
+            x = float(self.size_parameter(r))
+            x_lo, x_hi = x * (1 - spread), x * (1 + spread)
+            if frequency * width < 2:
+                # Less than two fringes in the window: the frequency says little, so scan all the small radii
+                x_lo = float(self.size_parameter(self.r_range[0]))
+                x_hi = x = float(self.size_parameter(np.interp(2 / width, self.f_table, self.r_table))) * (1 + spread)
+            n_values = [self.m0.real]
+            if self.free[1] and n_spread > 0:
+                dn = 0.2 / x if n_step is None else n_step
+                n_values = self.m0.real + dn * np.arange(-np.floor(n_spread / dn), np.floor(n_spread / dn) + 1)
+
+            # Radius estimate of every n, from the fringe frequency at r with that n
+            f_n = [self._fringe_peaks(pattern, 1)[0] for pattern in
+                   (self.patterns([r], n + 1j * self.m0.imag)[0] for n in n_values)]
+            stride = max(1, int(1 / (4 * max(frequency, 2 / width) * self.step)))
+            for n, f in zip(n_values, f_n):
+                shift = frequency / f if frequency * width >= 2 else 1
+                radii = np.clip(np.arange(x_lo * shift, x_hi * shift, step) / self.size_parameter(1), *self.r_range)
+                cost, log_scale = self._grid_cost(log_measured, radii, n + 1j * self.m0.imag, eps, stride)
+                points.extend(zip(cost, radii, [n] * radii.size, log_scale))
+                evaluations += radii.size + 1
+
+        # The best points, skipping the neighbours of the ones already kept
+        chosen = []
+        size = self.size_parameter(1)
+        for cost, r, n, log_scale in sorted(points, key=lambda point: point[0]):
+            if len(chosen) == keep:
+                break
+            if all(abs(r - other[0]) * size > 2 * step or abs(n - other[1]) > 1.5 * (0.2 / (r * size)
+                   if n_step is None else n_step) for other in chosen):
+                chosen.append(np.array([r, n, self.m0.imag, log_scale]))
+        return chosen, evaluations
+
+    def _levenberg_marquardt(self, params, log_measured, eps, max_iter, tol, free):
+        # Damped Gauss-Newton steps on the free parameters, within the allowed radii and k >= 0
+        params = np.array(params, dtype=float)
+        I, J = self.model(params)
+        residual = self._residuals(I, log_measured, eps)
+        J = J / (I + eps)[:, np.newaxis]
+        cost = residual @ residual
+        damping = 1e-3
+        evaluations, converged = 1, False
+        for iteration in range(1, max_iter + 1):
+            Jf = J[:, free]
+            g = Jf.T @ residual
+            H = Jf.T @ Jf
+            while True:
+                step = np.linalg.solve(H + damping * np.diag(np.maximum(np.diag(H), 1e-12)), -g)
+                trial = params.copy()
+                trial[free] += step
+                trial[0] = np.clip(trial[0], *self.r_range)
+                trial[2] = max(trial[2], 0.0)
+                I_trial, J_trial = self.model(trial)
+                evaluations += 1
+                residual_trial = self._residuals(I_trial, log_measured, eps)
+                cost_trial = residual_trial @ residual_trial
+                if cost_trial < cost:
+                    damping = 1e-3
+                    break
+                damping *= 10
+                if damping > 1e8:
+                    break
+            if cost_trial >= cost:
+                converged = True
+                break
+            change = cost - cost_trial
+            params, cost, residual = trial, cost_trial, residual_trial
+            J = J_trial / (I_trial + eps)[:, np.newaxis]
+            if change <= tol * cost:
+                converged = True
+                break
+        return params, cost, J, iteration, evaluations, converged
+
+    def fit(self, I, warm=True, starts=5, peaks=1, spread=0.01, scan_step=0.2, n_spread=0.005, n_step=None,
+            track=0.5, track_step=0.05, max_iter=50, tol=1e-10, restart=2.0):
+        """
+        This function fits one measured pattern.\n
+        Args:
+            I : Measured intensity over theta_deg
+            warm : Start from the previous result when there is one
+            starts : Number of Levenberg-Marquardt starts of a cold fit
+            peaks : Number of spectral peaks giving radius estimates
+            spread : Relative range of the radius scan around every estimate
+            scan_step : Step of the radius scan in size parameter
+            n_spread : Range of the real refractive index scanned around m0 (0 scans m0 only)
+            n_step : Step of the refractive index scan (defaults to 0.2 / x)
+            track, track_step : Range and step (in size parameter) of the radius scan of a warm start
+            max_iter : Largest number of Levenberg-Marquardt iterations per start
+            tol : Relative decrease of the sum of squares below which a fit stops
+            restart : A warm fit whose rms residual is above restart x that of the previous fit is redone cold
+        Returns:
+            Dictionary with r_um, m, scale, their standard errors (r_err, n_err, k_err, scale_err), the rms log
+            residual, the iterations and model evaluations, convergence and whether the fit was warm started
+        """
+        I = np.asarray(I, dtype=float)
+        if I.shape != self.theta_deg.shape:
+            raise ValueError("The measured pattern must have one intensity per angle of theta_deg")
+        if not np.all(np.isfinite(I)) or I.max() <= 0:
+            raise ValueError("The measured pattern must be finite with a positive maximum")
+        eps = self.floor * I.max()
+        log_measured = np.log(np.maximum(I, 0) + eps)
+
+        candidates, evaluations, warm_started = [], 0, False
+        if warm and self.previous is not None:
+            # Warm start: the radius drifts from frame to frame while m stays, and the resonance ripple of large
+            # particles makes the minima narrower than the drift, so scan the radius near the previous one first
+            r, n, k, _ = self.previous["params"]
+            x = self.size_parameter(r) + np.arange(-track, track + track_step / 2, track_step)
+            radii = np.clip(x / self.size_parameter(1), *self.r_range)
+            cost, log_scale = self._grid_cost(log_measured, radii, n + 1j * k, eps)
+            best = np.argmin(cost)
+            candidates = [np.array([radii[best], n, k, log_scale[best]])]
+            evaluations += radii.size
+            warm_started = True
+        best = None
+        while best is None:
+            if not candidates:
+                # Cold fit: radius estimates from the fringe peaks, refined by the radius scan
+                frequencies = self._fringe_peaks(np.maximum(I, 0) + eps, peaks)
+                candidates, count = self._scan(log_measured, frequencies, eps, spread, scan_step, n_spread, n_step,
+                                               starts)
+                evaluations += count
+                warm_started = False
+            for start in candidates:
+                start = np.where(self.free, start, [start[0], self.m0.real, self.m0.imag, start[3]])
+                params, cost, J, iterations, count, converged = self._levenberg_marquardt(start, log_measured, eps,
+                                                                                          max_iter, tol, self.free)
+                evaluations += count
+                if best is None or cost < best[1]:
+                    best = (params, cost, J, iterations, converged)
+            rms = np.sqrt(best[1] / I.size)
+            if warm_started and rms > restart * self.previous["rms"]:
+                best, candidates = None, []
+
+        # Covariance of the free parameters from the Jacobian at the optimum
+        params, cost, J, iterations, converged = best
+        Jf = J[:, self.free]
+        dof = max(I.size - int(self.free.sum()), 1)
+        errors = np.zeros(4)
+        errors[self.free] = np.sqrt(np.maximum(np.diag(np.linalg.pinv(Jf.T @ Jf)) * cost / dof, 0))
+        scale = np.exp(params[3])
+        result = {"r_um": params[0], "m": params[1] + 1j * params[2], "scale": scale,
+                  "r_err": errors[0], "n_err": errors[1], "k_err": errors[2], "scale_err": scale * errors[3],
+                  "rms": rms, "iterations": iterations, "evaluations": evaluations, "converged": converged,
+                  "warm": warm_started, "params": params}
+        self.previous = result
+        return result
+
+# Example usage:
+if __name__ == "__main__":
+    import time
+
+    theta_deg = 30 + 0.01 * np.arange(1001)
+    fitter = PatternFitter(theta_deg, fixed=("k",))
+    rng = np.random.default_rng(0)
+
+    # An evaporating droplet with 2% multiplicative noise, fitted frame by frame (cold, then warm started)
+    for frame, r in enumerate(25 - 0.005 * np.arange(8)):
+        I = 3e-4 * fitter.patterns([r], 1.334 + 1.67e-8j)[0] * rng.lognormal(0, 0.02, theta_deg.size)
+        start = time.perf_counter()
+        result = fitter.fit(I)
+        print(f"frame {frame}: r = {result['r_um']:.4f} +- {result['r_err']:.1e} um (true {r:.4f}), "
+              f"n = {result['m'].real:.5f} +- {result['n_err']:.1e}, scale = {result['scale']:.2e}, "
+              f"{'warm' if result['warm'] else 'cold'}, {result['evaluations']} evaluations, "
+              f"{1000 * (time.perf_counter() - start):.1f} ms")
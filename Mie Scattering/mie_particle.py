@@ -0,0 +1,101 @@
+from functools import lru_cache
+import numpy as np
+from mie_engine import mie_ab, mie_S1_S2, scattering_angles, finish_scattering_function
+
+class MieParticle:
+    """
+    This class holds the Mie coefficients of one particle so that any number of angle windows can be evaluated
+    without recomputing a_n and b_n.\n
+    Input the parameters in the following format -\n
+    Args:
+        m : Refractive index of the particle
+        wavelength : Wavelength of light in nanometers
+        diameter : Diameter of the particle in nanometers
+        nMedium : Refractive index of the surrounding medium
+    """
+    def __init__(self, m, wavelength, diameter, nMedium=1.0):
+        self.m = m
+        self.wavelength = wavelength
+        self.diameter = diameter
+        self.nMedium = np.real(nMedium)
+
+        # Size parameter and coefficients in the medium, computed once
+        self.x = np.pi * diameter / (wavelength / self.nMedium)
+        if self.x > 0:
+            self.an, self.bn = mie_ab(m / self.nMedium, self.x)
+        else:
+            self.an = self.bn = np.zeros((1, 0), dtype=complex)
+
+    @property
+    def n_max(self):
+        return self.an.shape[1]
+
+    def amplitudes(self, theta, chunk_size=4096):
+        """
+        This function gives the amplitude functions S1 and S2 at the angles theta (radians), chunk by chunk.
+        """
+        theta = np.atleast_1d(np.asarray(theta, dtype=float))
+        S1 = np.zeros(theta.shape, dtype=complex)
+        S2 = np.zeros(theta.shape, dtype=complex)
+        if self.n_max == 0:
+            return S1, S2
+        flat = theta.ravel()
+        for start in range(0, flat.size, chunk_size):
+            stop = min(start + chunk_size, flat.size)
+            s1, s2 = mie_S1_S2(self.an, self.bn, np.cos(flat[start:stop]))
+            S1.ravel()[start:stop] = s1[0]
+            S2.ravel()[start:stop] = s2[0]
+        return S1, S2
+
+    def intensity(self, theta, chunk_size=4096):
+        """
+        This function gives SL = |S1|^2, SR = |S2|^2 and SU = (SL+SR)/2 only at the requested angles theta (radians).\n
+        Args:
+            theta : Scattering angles in radians (any shape)
+            chunk_size : Number of angles evaluated per step, bounds the size of the pi_n/tau_n tables
+        """
+        S1, S2 = self.amplitudes(theta, chunk_size)
+        SL = (S1.conjugate() * S1).real
+        SR = (S2.conjugate() * S2).real
+        return SL, SR, (SL + SR) / 2
+
+    def iter_intensity(self, theta, chunk_size=4096):
+        """
+        This function yields (theta, SL, SR, SU) chunk by chunk, so long angle grids never have to be held at once.
+        """
+        theta = np.atleast_1d(np.asarray(theta, dtype=float)).ravel()
+        for start in range(0, theta.size, chunk_size):
+            chunk = theta[start:start + chunk_size]
+            yield (chunk,) + self.intensity(chunk, chunk_size)
+
+    def scattering_function(self, minAngle=0, maxAngle=180, angularResolution=0.5, space='theta',
+                            angleMeasure='radians', normalization=None):
+        """
+        This function gives the same output as PyMieScatt.ScatteringFunction for this particle and angle window.
+        """
+        measure, theta, q_space = scattering_angles(minAngle, maxAngle, angularResolution, space, angleMeasure)
+        SL, SR, _ = self.intensity(theta)
+        return finish_scattering_function(measure, SL, SR, self.wavelength / self.nMedium, self.diameter,
+                                          q_space, normalization)
+
+@lru_cache(maxsize=256)
+def get_particle(m, wavelength, diameter, nMedium=1.0):
+    """
+    This function gives a shared MieParticle for (m, wavelength, diameter, nMedium), so repeated windows for the
+    same particle reuse its coefficients.
+    """
+    return MieParticle(m, wavelength, diameter, nMedium)
+
+# Example usage:
+if __name__ == "__main__":
+    m = 1.33257 + 1.67e-8j  # refractive index
+    r = 100  # microns
+    diameter = 2 * r * 1000  # nm
+    wavelength = 632  # nm
+
+    # Slide a 10 degree detector window across the pattern, paying for the coefficients only once
+    particle = get_particle(m, wavelength, diameter)
+    for min_angle in range(30, 60, 5):
+        theta, SL, SR, SU = particle.scattering_function(minAngle=min_angle, maxAngle=min_angle + 10,
+                                                         angularResolution=0.01)
+    print(f"x = {particle.x:.1f}, n_max = {particle.n_max}")
@@ -0,0 +1,212 @@
+import math
+import numpy as np
+from mie_engine import scattering_intensity
+
+def lognormal_distribution(median_um, sigma_g):
+    """
+    This function gives a lognormal number distribution of radii.\n
+    Args:
+        median_um : Median radius in micrometers
+        sigma_g : Geometric standard deviation (> 1)
+    Returns:
+        pdf, (r_min, r_max) : Probability density in 1/um and the radius range that holds practically all of it
+    """
+    s = math.log(sigma_g)
+
+    def pdf(r):
+        r = np.asarray(r, dtype=float)
+        return np.exp(-(np.log(r / median_um))**2 / (2 * s**2)) / (r * s * math.sqrt(2 * math.pi))
+
+    return pdf, (median_um * sigma_g**-5, median_um * sigma_g**5)
+
+def gamma_distribution(mean_um, std_um):
+    """
+    This function gives a gamma number distribution of radii with the given mean and standard deviation.\n
+    Args:
+        mean_um : Mean radius in micrometers
+        std_um : Standard deviation of the radius in micrometers
+    Returns:
+        pdf, (r_min, r_max)
+    """
+    shape = (mean_um / std_um)**2
+    scale = std_um**2 / mean_um
+    log_norm = math.lgamma(shape) + shape * math.log(scale)
+
+    def pdf(r):
+        r = np.asarray(r, dtype=float)
+        return np.exp((shape - 1) * np.log(r) - r / scale - log_norm)
+
+    return pdf, (max(mean_um - 8 * std_um, mean_um * 1e-3), mean_um + 8 * std_um)
+
+def histogram_distribution(edges_um, counts):
+    """
+    This function gives a piecewise constant number distribution from a measured histogram of radii.\n
+    The quadrature runs in ln(r), so a first edge of 0 um is replaced by 1e-6 of the second edge as the lower limit
+    of the radius range (the particles below it hold at most 1e-6 of the first bin).\n
+    Args:
+        edges_um : Increasing bin edges in micrometers, the first one >= 0 (length len(counts) + 1)
+        counts : Number of particles in every bin (>= 0)
+    Returns:
+        pdf, (r_min, r_max)
+    """
+    edges_um = np.asarray(edges_um, dtype=float)
+    counts = np.asarray(counts, dtype=float)
+    if edges_um.ndim != 1 or edges_um.size != counts.size + 1:
+        raise ValueError("The histogram needs one more bin edge than counts\n"
+                         f"Got {edges_um.size} edges for {counts.size} counts")
+    if not np.all(np.isfinite(edges_um)) or edges_um[0] < 0 or np.any(np.diff(edges_um) <= 0):
+        raise ValueError("The bin edges must be finite, strictly increasing radii >= 0 um\n"
+                         f"Got edges from {edges_um[0]} to {edges_um[-1]} um")
+    if np.any(counts < 0) or counts.sum() <= 0:
+        raise ValueError("The counts must be >= 0 with at least one particle")
+    density = counts / np.diff(edges_um)
+
+    def pdf(r):
+        r = np.asarray(r, dtype=float)
+        index = np.searchsorted(edges_um, r, side="right") - 1
+        inside = (index >= 0) & (index < density.size)
+        return np.where(inside, density[np.clip(index, 0, density.size - 1)], 0.0)
+
+    r_min = edges_um[0] if edges_um[0] > 0 else 1e-6 * edges_um[1]
+    return pdf, (r_min, edges_um[-1])
+
+class PolydisperseMie:
+    """
+    This class averages the Mie angular intensities over size distributions by adaptive quadrature in radius.\n
+    The quadrature panels lie on a fixed dyadic lattice in ln(r), so different distributions use the same radius
+    nodes. The intensities of every node are computed in batches and kept, which means that after a few
+    distributions most new ones only need a weighted sum of rows that are already known.\n
+    Input the parameters in the following format -\n
+    Args:
+        m : Refractive index of the particles
+        wavelength : Wavelength of light in nanometers
+        theta : Scattering angles in radians (1-D array)
+        nMedium : Refractive index of the surrounding medium
+        order : Number of Gauss-Legendre nodes per panel
+        panel_width : Width of the coarsest panels in ln(r)
+    """
+    def __init__(self, m, wavelength, theta, nMedium=1.0, order=8, panel_width=0.125):
+        self.m = m
+        self.wavelength = wavelength
+        self.nMedium = np.real(nMedium)
+        self.theta = np.atleast_1d(np.asarray(theta, dtype=float))
+        self.order = order
+        self.panel_width = panel_width
+        self.nodes, self.weights = np.polynomial.legendre.leggauss(order)
+
+        # Node intensities, stored panel by panel: the rows offset[panel] ... offset[panel] + order - 1
+        self.offset = {}
+        self.size = 0
+        self.SL = np.zeros((0, self.theta.size))
+        self.SR = np.zeros((0, self.theta.size))
+
+    def _panel_nodes(self, panels):
+        # Radii (um) and ln(r) quadrature weights of lattice panels, shape (panels, order)
+        level = np.array([p[0] for p in panels], dtype=float)
+        index = np.array([p[1] for p in panels], dtype=float)
+        h = self.panel_width / 2**level
+        u = ((index + 0.5) * h)[:, np.newaxis] + 0.5 * h[:, np.newaxis] * self.nodes
+        return np.exp(u), 0.5 * h[:, np.newaxis] * self.weights
+
+    def _evaluate(self, panels, batch_size=64):
+        # Compute the intensities of all nodes of the panels that are not known yet, in batches
+        missing = [panel for panel in dict.fromkeys(panels) if panel not in self.offset]
+        if not missing:
+            return 0
+        radii, _ = self._panel_nodes(missing)
+        radii = radii.ravel()
+        needed = self.size + radii.size
+        if needed > self.SL.shape[0]:
+            capacity = max(needed, 2 * self.SL.shape[0])
+            self.SL = np.resize(self.SL, (capacity, self.theta.size))
+            self.SR = np.resize(self.SR, (capacity, self.theta.size))
+        x = 2 * np.pi * radii * 1000 / (self.wavelength / self.nMedium)
+        for start in range(0, radii.size, batch_size):
+            stop = min(start + batch_size, radii.size)
+            SL, SR = scattering_intensity(self.m / self.nMedium, x[start:stop], self.theta)
+            self.SL[self.size + start:self.size + stop] = SL
+            self.SR[self.size + start:self.size + stop] = SR
+        for i, panel in enumerate(missing):
+            self.offset[panel] = self.size + i * self.order
+        self.size = needed
+        return radii.size
+
+    def _panel_integrals(self, pdf, panels):
+        # Integrals of pdf(r) * [1, SL + SR] and of pdf(r) * SL, pdf(r) * SR over every panel, with dr = r du
+        radii, weights = self._panel_nodes(panels)
+        w = weights * radii * pdf(radii)
+        rows = np.array([self.offset[panel] for panel in panels])[:, np.newaxis] + np.arange(self.order)
+        SL = np.einsum("pk,pka->pa", w, self.SL[rows])
+        SR = np.einsum("pk,pka->pa", w, self.SR[rows])
+        return w.sum(axis=1), SL, SR
+
+    def ensemble(self, distribution, tol=1e-3, max_level=10):
+        """
+        This function gives the number-averaged SL, SR and SU of a size distribution.\n
+        Args:
+            distribution : (pdf, (r_min, r_max)) as returned by lognormal_distribution, gamma_distribution or
+                           histogram_distribution
+            tol : Relative tolerance on the averaged intensity at every angle
+            max_level : Maximum number of panel halvings
+        Returns:
+            SL, SR, SU, info : info holds the number of panels, nodes used and nodes newly computed
+        """
+        pdf, (r_min, r_max) = distribution
+        if not 0 < r_min < r_max:
+            raise ValueError("The radius range of the distribution must satisfy 0 < r_min < r_max\n"
+                             f"Got r_min = {r_min} um and r_max = {r_max} um")
+        u_min, u_max = math.log(r_min), math.log(r_max)
+        first = int(math.floor(u_min / self.panel_width))
+        last = int(math.ceil(u_max / self.panel_width))
+        panels = [(0, index) for index in range(first, last)]
+        width = u_max - u_min
+
+        computed = self._evaluate(panels)
+        number, SL, SR = self._panel_integrals(pdf, panels)
+        scale = np.maximum(SL.sum(axis=0) + SR.sum(axis=0), np.finfo(float).tiny)
+
+        accepted_number, accepted_SL, accepted_SR, accepted_panels = 0.0, 0.0, 0.0, 0
+        level = 0
+        while panels:
+            if level == max_level:
+                accepted_number += number.sum()
+                accepted_SL = accepted_SL + SL.sum(axis=0)
+                accepted_SR = accepted_SR + SR.sum(axis=0)
+                accepted_panels += len(panels)
+                break
+
+            # Split every panel of this level and compare the parent estimate with the sum of its children
+            children = [(level + 1, 2 * index + c) for _, index in panels for c in (0, 1)]
+            computed += self._evaluate(children)
+            kid_number, kid_SL, kid_SR = self._panel_integrals(pdf, children)
+            pair_SL = kid_SL[0::2] + kid_SL[1::2]
+            pair_SR = kid_SR[0::2] + kid_SR[1::2]
+            error = np.max(np.abs(SL + SR - pair_SL - pair_SR) / scale, axis=1)
+            h = self.panel_width / 2**level
+            converged = error <= tol * h / width
+
+            # Converged panels contribute their (more accurate) children, the others are split again
+            accepted_number += (kid_number[0::2] + kid_number[1::2])[converged].sum()
+            accepted_SL = accepted_SL + pair_SL[converged].sum(axis=0)
+            accepted_SR = accepted_SR + pair_SR[converged].sum(axis=0)
+            accepted_panels += 2 * int(converged.sum())
+            refine = np.repeat(~converged, 2)
+            panels = [child for child, keep in zip(children, refine) if keep]
+            number, SL, SR = kid_number[refine], kid_SL[refine], kid_SR[refine]
+            level += 1
+
+        SL = accepted_SL / accepted_number
+        SR = accepted_SR / accepted_number
+        info = {"panels": accepted_panels, "nodes": accepted_panels * self.order, "computed": computed}
+        return SL, SR, (SL + SR) / 2, info
+
+# Example usage:
+if __name__ == "__main__":
+    m = 1.33257 + 1.67e-8j  # refractive index
+    wavelength = 632  # nm
+    theta = np.deg2rad(np.arange(30, 40.01, 0.01))
+
+    solver = PolydisperseMie(m, wavelength, theta)
+    for median in [4.0, 4.5, 5.0]:
+        SL, SR, SU, info = solver.ensemble(lognormal_distribution(median, 1.2))
+        print(median, info)
@@ -1,6 +1,6 @@
-import PyMieScatt as ps
 import numpy as np
 import matplotlib.pyplot as plt
+from mie_cache import cached_batch_scattering_function
 
 m = 1.33257 + 1.67E-08j    # Refractive index
 w = 800                    # Wavelength in nanometers
@@ -9,13 +9,14 @@ theta_deg = np.linspace(0, 180, 100)
 
 plt.figure(figsize=(10, 6))
 
+# Calculate the scattering intensity functions for all radii in one batch, through the Mie cache (reruns reuse them)
+theta, SL, SR, SU = cached_batch_scattering_function(m, w, 2 * np.array(radii) * 1000)
+theta_deg = theta * (180 / np.pi)
+
 # Iterate over different radii and plot their scattering intensity functions for both polarizations
-for r in radii:
-    d = 2 * r * 1000
-    theta, SL, SR, SU = ps.ScatteringFunction(m, w, d)
-    theta_deg = theta * (180 / np.pi)
+for r, SU_r in zip(radii, SU):
     label = f"Radius {r} μm"
-    plt.semilogy(theta_deg, SU, label=f"{label}")
+    plt.semilogy(theta_deg, SU_r, label=f"{label}")
 
 plt.xlim(0, 180)
 plt.xticks(np.arange(0, 181, 30))
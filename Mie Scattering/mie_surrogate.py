@@ -0,0 +1,251 @@
+import numpy as np
+from mie_engine import mie_ab, mie_S1_S2
+
+def _chebyshev_points(n):
+    # Chebyshev points of the first kind on [-1, 1]
+    return np.cos(np.pi * (np.arange(n) + 0.5) / n)[::-1]
+
+def _chebyshev_basis(u, n):
+    # T_0(u) ... T_{n-1}(u) for every u, shape (points, n)
+    T = np.empty((u.size, n))
+    T[:, 0] = 1
+    if n > 1:
+        T[:, 1] = u
+    for i in range(2, n):
+        T[:, i] = 2 * u * T[:, i - 1] - T[:, i - 2]
+    return T
+
+class MieSurrogate:
+    """
+    This class is a piecewise Chebyshev surrogate of SL and SR over (size parameter, angle) for one m.\n
+    The domain is split adaptively (a k-d tree of rectangles) and on every rectangle the real and imaginary parts
+    of the amplitudes S1 and S2 are interpolated by tensor Chebyshev polynomials of degree order - 1 from exact
+    Mie values; SL = |S1|^2 and SR = |S2|^2 follow from them. The amplitudes are used instead of log SL and log SR
+    because S1 and S2 pass through zero at isolated (x, theta) points, where the logarithm is singular and no
+    polynomial converges. Every rectangle is then checked against the exact result on a finer grid of check
+    points; rectangles whose relative error is above tol are split along the direction with the slower decaying
+    coefficients, so the refinement follows the dense fringes. The checked error of every region is the largest
+    relative error of SL and SR found on its check grid with the stored (float32) coefficients. It is a sampled
+    estimate, not a bound: between the check points the error can be larger.\n
+    Relative errors are measured against max(S, floor x reference), because the deep minima of the fringes carry
+    almost no intensity. The reference is the largest S of the enclosing region envelope_depth splits below the
+    whole domain, so that it does not shrink while a region around a zero of the amplitude is refined.\n
+    Input the parameters in the following format -\n
+    Args:
+        m : Relative refractive index (particle / medium)
+        x_range : (x_min, x_max) size parameter range
+        theta_range : (min, max) scattering angle range in degrees
+        tol : Target relative error
+        order : Number of Chebyshev points per direction on every rectangle
+        floor : Relative intensity floor of the error measure
+        max_depth : Largest number of splits of a region
+        envelope_depth : Depth of the regions whose largest S sets the intensity floor
+    """
+    def __init__(self, m, x_range, theta_range, tol=1e-3, order=16, floor=1e-3, max_depth=24, envelope_depth=4):
+        self.m = m
+        self.tol = tol
+        self.order = order
+        self.floor = floor
+        self.x_range = tuple(float(v) for v in x_range)
+        self.theta_range = tuple(float(v) for v in theta_range)
+
+        # Tree arrays: split axis (-1 for leaves), split value, children and the leaf index
+        self.axis, self.split, self.left, self.right, self.leaf = [], [], [], [], []
+        # Leaf arrays: bounds (x0, x1, t0, t1), coefficients of Re/Im S1 and S2, checked errors of SL and SR
+        self.bounds, self.coefficients, self.errors = [], [], []
+        self.evaluations = 0
+
+        # Split rectangles until every one meets the tolerance
+        root = self._new_node()
+        work = [(root, self.x_range + tuple(np.deg2rad(self.theta_range)), 0, None)]
+        while work:
+            node, box, depth, reference = work.pop()
+            coefficients, errors, tails, largest = self._fit(box, reference)
+            if depth <= envelope_depth:
+                reference = largest
+            if max(errors) <= tol or depth >= max_depth:
+                self.leaf[node] = len(self.bounds)
+                self.bounds.append(box)
+                self.coefficients.append(coefficients)
+                self.errors.append(errors)
+                continue
+            axis = 0 if tails[0] >= tails[1] else 1
+            lo, hi = box[2 * axis], box[2 * axis + 1]
+            middle = 0.5 * (lo + hi)
+            self.axis[node], self.split[node] = axis, middle
+            self.left[node], self.right[node] = self._new_node(), self._new_node()
+            left_box, right_box = list(box), list(box)
+            left_box[2 * axis + 1] = middle
+            right_box[2 * axis] = middle
+            work.append((self.left[node], tuple(left_box), depth + 1, reference))
+            work.append((self.right[node], tuple(right_box), depth + 1, reference))
+
+        self.axis = np.array(self.axis)
+        self.split = np.array(self.split)
+        self.left = np.array(self.left)
+        self.right = np.array(self.right)
+        self.leaf = np.array(self.leaf)
+        self.bounds = np.array(self.bounds)
+        self.coefficients = np.array(self.coefficients, dtype=np.float32)
+        self.errors = np.array(self.errors)
+
+    def _new_node(self):
+        for array, value in ((self.axis, -1), (self.split, 0.0), (self.left, -1), (self.right, -1), (self.leaf, -1)):
+            array.append(value)
+        return len(self.axis) - 1
+
+    def _exact(self, x, theta):
+        # Exact S1 and S2 on the tensor grid x (rows) x theta (columns)
+        self.evaluations += x.size * theta.size
+        an, bn = mie_ab(self.m, x)
+        return mie_S1_S2(an, bn, np.cos(theta))
+
+    def _fit(self, box, reference=None):
+        # Interpolate on the Chebyshev grid of the rectangle and measure the error on a finer check grid
+        x0, x1, t0, t1 = box
+        u = _chebyshev_points(self.order)
+        x = 0.5 * (x0 + x1) + 0.5 * (x1 - x0) * u
+        theta = 0.5 * (t0 + t1) + 0.5 * (t1 - t0) * u
+        V_inverse = np.linalg.inv(_chebyshev_basis(u, self.order))
+
+        check = np.linspace(-1, 1, 2 * self.order + 1)
+        check_x = 0.5 * (x0 + x1) + 0.5 * (x1 - x0) * check
+        check_theta = 0.5 * (t0 + t1) + 0.5 * (t1 - t0) * check
+        T = _chebyshev_basis(check, self.order)
+
+        coefficients, errors, tails, largest = [], [], np.zeros(2), []
+        for k, (values, exact) in enumerate(zip(self._exact(x, theta), self._exact(check_x, check_theta))):
+            fitted = 0
+            for part in (values.real, values.imag):
+                C = (V_inverse @ part @ V_inverse.T).astype(np.float32)
+                fitted = fitted + (T @ C.astype(float) @ T.T)**2
+                coefficients.append(C)
+                tails += [np.abs(C[-2:, :]).sum(), np.abs(C[:, -2:]).sum()]
+
+            # Relative error of the intensity |S|^2
+            exact = (exact.conjugate() * exact).real
+            largest.append(exact.max())
+            scale = np.maximum(exact, self.floor * (largest[k] if reference is None else reference[k]))
+            errors.append(float(np.max(np.abs(fitted - exact) / scale)))
+        return np.array(coefficients), errors, tails, largest
+
+    def locate(self, x, theta):
+        """
+        This function gives the leaf index of every point (x, theta in radians).
+        """
+        node = np.zeros(x.shape, dtype=int)
+        while True:
+            inner = self.axis[node] >= 0
+            if not inner.any():
+                return self.leaf[node]
+            n = node[inner]
+            value = np.where(self.axis[n] == 0, x[inner], theta[inner])
+            node[inner] = np.where(value < self.split[n], self.left[n], self.right[n])
+
+    def intensity(self, x, theta, chunk_size=4096):
+        """
+        This function gives SL and SR of the surrogate at the size parameters x and angles theta (radians),
+        broadcast against each other.
+        """
+        x, theta = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(theta, dtype=float))
+        shape = x.shape
+        x, theta = x.ravel(), theta.ravel()
+        t_min, t_max = np.deg2rad(self.theta_range)
+        if (x.min() < self.x_range[0] or x.max() > self.x_range[1] or theta.min() < t_min - 1e-12
+                or theta.max() > t_max + 1e-12):
+            raise ValueError(f"The surrogate covers x in {self.x_range} and theta in {self.theta_range} degrees only")
+
+        leaves = self.locate(x, theta)
+        order = np.argsort(leaves, kind="stable")
+        boundaries = np.flatnonzero(np.diff(leaves[order])) + 1
+        SL = np.empty(x.size)
+        SR = np.empty(x.size)
+
+        # Scattered points (few per region): gather the coefficients of every point, chunk by chunk
+        if x.size < 64 * (boundaries.size + 1):
+            for start in range(0, x.size, chunk_size):
+                points = slice(start, start + chunk_size)
+                x0, x1, t0, t1 = self.bounds[leaves[points]].T
+                Tx = _chebyshev_basis((2 * x[points] - x0 - x1) / (x1 - x0), self.order)
+                Tt = _chebyshev_basis((2 * theta[points] - t0 - t1) / (t1 - t0), self.order)
+                C = self.coefficients[leaves[points]].astype(float)
+                S = (np.matmul(Tx[:, np.newaxis, np.newaxis, :], C)[:, :, 0, :] * Tt[:, np.newaxis, :]).sum(axis=2)
+                SL[points] = S[:, 0]**2 + S[:, 1]**2
+                SR[points] = S[:, 2]**2 + S[:, 3]**2
+            return SL.reshape(shape), SR.reshape(shape)
+
+        # Grids and dense points: evaluate region by region
+        for points in np.split(order, boundaries):
+            leaf = leaves[points[0]]
+            x0, x1, t0, t1 = self.bounds[leaf]
+            Tx = _chebyshev_basis((2 * x[points] - x0 - x1) / (x1 - x0), self.order)
+            Tt = _chebyshev_basis((2 * theta[points] - t0 - t1) / (t1 - t0), self.order)
+            S = ((Tx @ self.coefficients[leaf].astype(float)) * Tt).sum(axis=2)
+            SL[points] = S[0]**2 + S[1]**2
+            SR[points] = S[2]**2 + S[3]**2
+        return SL.reshape(shape), SR.reshape(shape)
+
+    def checked_error(self, x, theta):
+        """
+        This function gives the checked relative error (max of SL and SR, sampled on the check grid) of the region
+        holding every point.
+        """
+        x, theta = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(theta, dtype=float))
+        return self.errors.max(axis=1)[self.locate(x.ravel(), theta.ravel())].reshape(x.shape)
+
+    def regions(self):
+        """
+        This function gives the regions as a table: x0, x1, theta0, theta1 (degrees), error of SL and SR.
+        """
+        bounds = self.bounds.copy()
+        bounds[:, 2:] = np.rad2deg(bounds[:, 2:])
+        return np.column_stack([bounds, self.errors])
+
+    def save(self, path):
+        """
+        This function saves the surrogate in a compact .npz file (float32 coefficients).
+        """
+        np.savez_compressed(path, m=np.array([self.m.real, self.m.imag]), x_range=self.x_range,
+                            theta_range=self.theta_range, settings=np.array([self.tol, self.order, self.floor]),
+                            axis=self.axis, split=self.split, left=self.left, right=self.right, leaf=self.leaf,
+                            bounds=self.bounds, coefficients=self.coefficients, errors=self.errors)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """
+        This function loads a surrogate saved with save.
+        """
+        surrogate = cls.__new__(cls)
+        with np.load(path) as data:
+            surrogate.m = complex(*data["m"])
+            surrogate.x_range = tuple(data["x_range"])
+            surrogate.theta_range = tuple(data["theta_range"])
+            surrogate.tol, order, surrogate.floor = data["settings"]
+            surrogate.order = int(order)
+            for name in ("axis", "split", "left", "right", "leaf", "bounds", "coefficients", "errors"):
+                setattr(surrogate, name, data[name])
+        surrogate.evaluations = 0
+        return surrogate
+
+# Example usage:
+if __name__ == "__main__":
+    import time
+
+    m = 1.33257 + 1.67e-8j  # refractive index
+    wavelength = 632  # nm
+    radii = np.array([5.0, 10.0])  # microns, range covered by the surrogate
+    x_range = 2 * np.pi * radii * 1000 / wavelength
+
+    start = time.perf_counter()
+    surrogate = MieSurrogate(m, x_range, (30, 40))
+    print(f"{len(surrogate.bounds)} regions, max checked error {surrogate.errors.max():.2e}, "
+          f"{surrogate.coefficients.nbytes / 1e6:.2f} MB, built in {time.perf_counter() - start:.1f} s")
+
+    # Random (radius, angle) points
+    rng = np.random.default_rng(0)
+    x = rng.uniform(*x_range, size=100000)
+    theta = np.deg2rad(rng.uniform(30, 40, size=100000))
+    start = time.perf_counter()
+    SL, SR = surrogate.intensity(x, theta)
+    print(f"{1e9 * (time.perf_counter() - start) / x.size:.0f} ns per point")
@@ -0,0 +1,198 @@
+import os
+import json
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from mie_engine import mie_n_max, scattering_angles, scattering_intensity
+
+# Arrays shared with the worker processes, set up by _init_worker
+_storage = {}
+
+def estimate_cost(m, wavelength, diameter, n_angles, nMedium=1.0):
+    """
+    This function estimates the relative cost of one Mie task from its number of series terms.\n
+    The coefficient recurrences cost ~max(n_max, |mx|) steps and the angular sums ~n_max x n_angles operations.
+    """
+    nMedium = np.real(nMedium)
+    x = np.pi * np.asarray(diameter, dtype=float) / (np.asarray(wavelength, dtype=float) / nMedium)
+    n_max = mie_n_max(x)
+    mx = np.abs(np.asarray(m) / nMedium) * x
+    return np.maximum(n_max, mx) + n_max * n_angles
+
+def schedule_tasks(costs, processes, groups_per_process=8):
+    """
+    This function orders the tasks largest-first and packs the cheap tail into groups of similar total cost.\n
+    Every group is evaluated with one batched engine call, and the pool hands the groups out in order, which
+    gives a longest-processing-time-first schedule.\n
+    Args:
+        costs : Estimated cost of every task (1-D array)
+        processes : Number of worker processes
+        groups_per_process : Target number of groups per worker (more groups balance better)
+    Returns:
+        List of arrays of task indices
+    """
+    costs = np.asarray(costs, dtype=float)
+    order = np.argsort(-costs, kind="stable")
+    target = costs.sum() / max(1, processes * groups_per_process)
+    groups, current, current_cost = [], [], 0.0
+    for index in order:
+        current.append(index)
+        current_cost += costs[index]
+        if current_cost >= target:
+            groups.append(np.array(current))
+            current, current_cost = [], 0.0
+    if current:
+        groups.append(np.array(current))
+    return groups
+
+def _open_storage(spec):
+    # Attach to the result arrays, either shared memory blocks or memory-mapped checkpoint files
+    arrays, handles = {}, []
+    for name in ("SL", "SR"):
+        if spec["kind"] == "shm":
+            block = shared_memory.SharedMemory(name=spec[name])
+            handles.append(block)
+            arrays[name] = np.ndarray(spec["shape"], dtype=np.float64, buffer=block.buf)
+        else:
+            arrays[name] = np.lib.format.open_memmap(spec[name], mode="r+")
+    return arrays, handles
+
+def _init_worker(spec):
+    _storage["spec"] = spec
+    _storage["arrays"], _storage["handles"] = _open_storage(spec)
+
+def _run_group(task):
+    # Evaluate one group of (m, wavelength, diameter) tasks in a single batched call and write the rows in place
+    indices, m, wavelength, diameter = task
+    spec = _storage["spec"]
+    nMedium = spec["nMedium"]
+    theta = np.asarray(spec["theta"])
+    x = np.pi * diameter / (wavelength / nMedium)
+    SL, SR = scattering_intensity(m / nMedium, x, theta)
+    arrays = _storage["arrays"]
+    arrays["SL"][indices] = SL
+    arrays["SR"][indices] = SR
+    if spec["kind"] == "memmap":
+        arrays["SL"].flush()
+        arrays["SR"].flush()
+    return indices
+
+def run_sweep(m_values, wavelengths, diameters, nMedium=1.0, minAngle=0, maxAngle=180, angularResolution=0.5,
+              processes=None, checkpoint_dir=None):
+    """
+    This function evaluates the Mie angular intensities for every combination of (m, wavelength, diameter)
+    across a process pool.\n
+    Tasks are scheduled largest-first by their estimated cost, and the workers write their rows directly into
+    shared-memory arrays, so no results are pickled. With a checkpoint_dir the arrays are memory-mapped .npy files
+    in that folder together with a per-task completion mask, and calling run_sweep again with the same arguments
+    resumes an interrupted sweep.\n
+    Input the parameters in the following format -\n
+    Args:
+        m_values : Refractive indices (list or array)
+        wavelengths : Wavelengths of light in nanometers (list or array)
+        diameters : Diameters of the particles in nanometers (list or array)
+        nMedium : Refractive index of the surrounding medium
+        minAngle, maxAngle, angularResolution : Angle range and step in degrees, as in ScatteringFunction
+        processes : Number of worker processes (defaults to the number of CPUs, 1 runs in this process)
+        checkpoint_dir : Folder used to store the results and resume the sweep
+    Returns:
+        theta, SL, SR, SU : theta in radians, SL/SR/SU of shape (len(m_values), len(wavelengths), len(diameters), angles)
+    """
+    m_values = np.atleast_1d(np.asarray(m_values, dtype=complex))
+    wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+    diameters = np.atleast_1d(np.asarray(diameters, dtype=float))
+    nMedium = float(np.real(nMedium))
+    _, theta, _ = scattering_angles(minAngle, maxAngle, angularResolution)
+    grid_shape = (m_values.size, wavelengths.size, diameters.size)
+    shape = (int(np.prod(grid_shape)), theta.size)
+
+    # Flattened task list
+    M, W, D = (a.ravel() for a in np.meshgrid(m_values, wavelengths, diameters, indexing="ij"))
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    # Result storage and the tasks that are still to be done
+    handles = []
+    if checkpoint_dir is None:
+        spec = {"kind": "shm", "shape": shape}
+        for name in ("SL", "SR"):
+            block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+            handles.append(block)
+            spec[name] = block.name
+        done = np.zeros(shape[0], dtype=bool)
+    else:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        metadata = {"m": [[v.real, v.imag] for v in m_values], "wavelength": wavelengths.tolist(),
+                    "diameter": diameters.tolist(), "nMedium": nMedium, "minAngle": minAngle,
+                    "maxAngle": maxAngle, "angularResolution": angularResolution}
+        metadata_path = os.path.join(checkpoint_dir, "sweep.json")
+        spec = {"kind": "memmap", "shape": shape,
+                "SL": os.path.join(checkpoint_dir, "SL.npy"), "SR": os.path.join(checkpoint_dir, "SR.npy")}
+        done_path = os.path.join(checkpoint_dir, "done.npy")
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                if json.load(f) != json.loads(json.dumps(metadata)):
+                    raise ValueError(f"{checkpoint_dir} holds a different sweep.\nUse a new checkpoint_dir for these parameters")
+            done = np.lib.format.open_memmap(done_path, mode="r+")
+        else:
+            for name in ("SL", "SR"):
+                np.lib.format.open_memmap(spec[name], mode="w+", dtype=np.float64, shape=shape).flush()
+            done = np.lib.format.open_memmap(done_path, mode="w+", dtype=bool, shape=(shape[0],))
+            with open(metadata_path, "w") as f:
+                json.dump(metadata, f)
+    spec["nMedium"] = nMedium
+    spec["theta"] = theta.tolist()
+
+    try:
+        todo = np.flatnonzero(~np.asarray(done))
+        costs = estimate_cost(M[todo], W[todo], D[todo], theta.size, nMedium)
+        groups = [todo[g] for g in schedule_tasks(costs, processes)]
+        tasks = [(g, M[g], W[g], D[g]) for g in groups]
+
+        if processes == 1 or len(tasks) <= 1:
+            _init_worker(spec)
+            completed = map(_run_group, tasks)
+            pool = None
+        else:
+            pool = mp.Pool(processes, initializer=_init_worker, initargs=(spec,))
+            completed = pool.imap_unordered(_run_group, tasks, chunksize=1)
+        try:
+            for indices in completed:
+                done[indices] = True
+                if checkpoint_dir is not None:
+                    done.flush()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            for handle in _storage.pop("handles", []):
+                handle.close()
+            _storage.clear()
+
+        # Copy the results out of shared memory, or hand back the memory-mapped checkpoint files
+        arrays, storage_handles = _open_storage(spec)
+        if checkpoint_dir is None:
+            SL = np.array(arrays["SL"])
+            SR = np.array(arrays["SR"])
+        else:
+            SL, SR = arrays["SL"], arrays["SR"]
+        del arrays
+        for handle in storage_handles:
+            handle.close()
+    finally:
+        for block in handles:
+            block.close()
+            block.unlink()
+
+    SL = SL.reshape(grid_shape + (theta.size,))
+    SR = SR.reshape(grid_shape + (theta.size,))
+    return theta, SL, SR, (SL + SR) / 2
+
+# Example usage:
+if __name__ == "__main__":
+    m = 1.33257 + 1.67E-08j    # Refractive index
+    wavelengths = [532, 650, 800]  # Wavelengths in nanometers
+    radii = np.arange(10, 51)  # Radii in micrometers
+
+    theta, SL, SR, SU = run_sweep(m, wavelengths, 2 * radii * 1000, angularResolution=0.1)
+    print(SU.shape)
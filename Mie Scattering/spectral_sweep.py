@@ -0,0 +1,116 @@
+import numpy as np
+from mie_engine import mie_ab, mie_n_max, mie_pi_tau
+from unified_scattering import choose_method, rayleigh_S, rgd_S
+
+def read_dispersion(csv_path):
+    """
+    This function reads a refractive index dispersion table from a CSV file with the columns wavelength_nm, n and
+    (optionally) k, e.g. exported from refractiveindex.info.\n
+    Returns:
+        wavelength_nm, m : Sorted wavelengths in nanometers and the complex refractive index n + ik at them
+    """
+    import pandas as pd
+    table = pd.read_csv(csv_path).sort_values("wavelength_nm")
+    k = table["k"].to_numpy() if "k" in table else np.zeros(len(table))
+    return table["wavelength_nm"].to_numpy(dtype=float), table["n"].to_numpy() + 1j * k
+
+def dispersion(wavelength, m):
+    """
+    This function gives the refractive index at every wavelength.\n
+    Args:
+        wavelength : Wavelengths in nanometers (1-D array)
+        m : A single refractive index, one per wavelength, or a dispersion table (wavelength_nm, m) as given by
+            read_dispersion; n and k are interpolated linearly between the table wavelengths
+    """
+    wavelength = np.atleast_1d(np.asarray(wavelength, dtype=float))
+    if not isinstance(m, tuple):
+        return np.broadcast_to(np.asarray(m, dtype=complex), wavelength.shape).copy()
+    table_wavelength, table_m = np.asarray(m[0], dtype=float), np.asarray(m[1], dtype=complex)
+    if wavelength.min() < table_wavelength.min() or wavelength.max() > table_wavelength.max():
+        raise ValueError(f"The dispersion table covers {table_wavelength.min()} to {table_wavelength.max()} nm.\n"
+                         "Wavelengths outside it cannot be interpolated")
+    return np.interp(wavelength, table_wavelength, table_m.real) + 1j * np.interp(wavelength, table_wavelength,
+                                                                                  table_m.imag)
+
+def spectral_sweep(wavelength, m, r_um, theta_deg, nMedium=1.0, tol=1e-3, max_chunk_elements=2**22):
+    """
+    This function calculates SL = |S1|^2 and SR = |S2|^2 for hundreds of wavelengths in one call, as a
+    (wavelength x angle) cube for every radius.\n
+    Every (radius, wavelength) pair is sent to the cheapest accurate method as in unified_scattering. Pairs in
+    the Rayleigh regime use the closed form, which scales analytically with |K(lambda)|^2 / lambda^6 on the
+    shared cos^2 theta curve. The Mie pairs get their a_n and b_n in one batch, and the angle-only tables pi_n
+    and tau_n are computed once per chunk of angles, for the largest number of terms, and shared by every
+    wavelength: each group of similar series length uses the first rows of the same tables.\n
+    Input the parameters in the following format -\n
+    Args:
+        wavelength : Wavelengths of light in nanometers (1-D array)
+        m : Refractive index of the particle: one value, one per wavelength or a dispersion table (see dispersion)
+        r_um : Radius of the particle in micrometers (scalar or 1-D array)
+        theta_deg : Scattering angles in degrees (1-D array)
+        nMedium : Refractive index of the surrounding medium
+        tol : Largest accepted estimated error of the Rayleigh and Rayleigh-Gans-Debye approximations, relative to the
+              peak of each curve (see unified_scattering.regime_errors)
+        max_chunk_elements : Upper bound on the size of one pi_n/tau_n table
+    Returns:
+        SL, SR, method : SL and SR of shape (wavelengths, angles), or (radii, wavelengths, angles) for an array of
+        radii, and the method code of every pair (index into unified_scattering.METHODS)
+    """
+    wavelength = np.atleast_1d(np.asarray(wavelength, dtype=float))
+    m = dispersion(wavelength, m)
+    radii = np.atleast_1d(np.asarray(r_um, dtype=float))
+    theta = np.deg2rad(np.atleast_1d(np.asarray(theta_deg, dtype=float)))
+    shape = np.shape(r_um) + wavelength.shape
+
+    # Size parameter and refractive index of every (radius, wavelength) pair, relative to the medium
+    nMedium = np.real(nMedium)
+    m_rel = np.broadcast_to(m / nMedium, (radii.size, wavelength.size)).ravel()
+    x = (2 * np.pi * radii[:, np.newaxis] * 1000 / (wavelength / nMedium)).ravel()
+    codes = choose_method(m_rel, x, tol)
+
+    SL = np.empty((x.size, theta.size))
+    SR = np.empty((x.size, theta.size))
+    for code, function in ((0, rayleigh_S), (1, rgd_S)):
+        part = np.flatnonzero(codes == code)
+        if part.size:
+            SL[part], SR[part] = function(m_rel[part], x[part], theta)
+
+    part = np.flatnonzero(codes == 2)
+    if part.size:
+        # Coefficients of every Mie pair at once, with the series weights (2n+1)/(n(n+1)) applied
+        an, bn = mie_ab(m_rel[part], x[part])
+        n_max = an.shape[1]
+        n = np.arange(1, n_max + 1)
+        n2 = (2 * n + 1) / (n * (n + 1))
+        a = an * n2
+        b = bn * n2
+
+        # Groups of similar series length, each summed over its own number of terms only
+        terms = mie_n_max(x[part])
+        group = np.floor(np.log2(terms)).astype(int)
+        groups = [(np.flatnonzero(group == g), int(terms[group == g].max())) for g in np.unique(group)]
+
+        mu = np.cos(theta)
+        chunk = max(1, max_chunk_elements // n_max)
+        for start in range(0, mu.size, chunk):
+            stop = min(start + chunk, mu.size)
+            pin, taun = mie_pi_tau(mu[start:stop], n_max)
+            for members, count in groups:
+                a_g, b_g = a[members, :count], b[members, :count]
+                pin_g, taun_g = pin[:count], taun[:count]
+                S1 = (a_g.real @ pin_g + b_g.real @ taun_g) + 1j * (a_g.imag @ pin_g + b_g.imag @ taun_g)
+                S2 = (a_g.real @ taun_g + b_g.real @ pin_g) + 1j * (a_g.imag @ taun_g + b_g.imag @ pin_g)
+                SL[part[members], start:stop] = (S1.conjugate() * S1).real
+                SR[part[members], start:stop] = (S2.conjugate() * S2).real
+
+    return SL.reshape(shape + (theta.size,)), SR.reshape(shape + (theta.size,)), codes.reshape(shape)
+
+# Example usage:
+if __name__ == "__main__":
+    # Approximate dispersion of water in the visible (wavelength in nm, n + ik)
+    water = (np.array([400, 500, 600, 700, 800]),
+             np.array([1.339 + 1.86e-9j, 1.335 + 1.0e-9j, 1.332 + 1.09e-8j, 1.331 + 3.35e-8j, 1.329 + 1.25e-7j]))
+    wavelengths = np.linspace(400, 800, 401)
+    theta_deg = np.arange(0, 180.1, 0.1)
+
+    SL, SR, method = spectral_sweep(wavelengths, water, 1, theta_deg)
+    print(SL.shape, np.bincount(method.ravel(), minlength=3))
@@ -0,0 +1,133 @@
+import numpy as np
+from mie_engine import mie_n_max, scattering_intensity
+
+# Methods in order of cost, as used in the per-element method codes
+METHODS = ("rayleigh", "rgd", "mie")
+
+def regime_errors(m, x):
+    """
+    This function estimates the peak-relative error of the Rayleigh and Rayleigh-Gans-Debye approximations.\n
+    The error is measured relative to the peak of each curve, max |S_approx - S_mie| / max S_mie over 0-180 degrees,
+    taking the larger of SL and SR. A pointwise relative error is not usable because SR of the Rayleigh limit has a
+    zero at 90 degrees that the Mie curve does not have. The estimates are conservative fits against the full Mie
+    series: Rayleigh ~ 2 (x max(1, |m|))^2 and Rayleigh-Gans-Debye ~ 2 |m - 1| min(1, x^2) + 4 (x |m - 1|)^2 (the
+    second term is the phase shift across the particle). Both were calibrated for 1e-3 <= |m - 1| <= 2 and x up to
+    60; for smaller contrasts the Mie series itself loses digits to cancellation.\n
+    Args:
+        m : Relative refractive index (particle / medium)
+        x : Size parameter
+    Returns:
+        rayleigh_error, rgd_error
+    """
+    m, x = np.broadcast_arrays(np.asarray(m, dtype=complex), np.asarray(x, dtype=float))
+    rayleigh_error = 2 * (x * np.maximum(1, np.abs(m)))**2
+    contrast = np.abs(m - 1)
+    rgd_error = 2 * contrast * np.minimum(1, x**2) + 4 * (x * contrast)**2
+    return rayleigh_error, rgd_error
+
+def choose_method(m, x, tol=1e-3):
+    """
+    This function gives the code (index into METHODS) of the cheapest method whose estimated peak-relative error
+    (see regime_errors) is below tol.
+    """
+    rayleigh_error, rgd_error = regime_errors(m, x)
+    return np.where(rayleigh_error <= tol, 0, np.where(rgd_error <= tol, 1, 2)).astype(np.int8)
+
+def rayleigh_S(m, x, theta):
+    """
+    This function gives SL = |S1|^2 and SR = |S2|^2 of the closed-form Rayleigh limit (S1 = -i x^3 K, S2 = S1 cos theta).\n
+    Args:
+        m, x : Relative refractive index and size parameter (1-D arrays of the same length)
+        theta : Scattering angles in radians (1-D array)
+    """
+    K = (m**2 - 1) / (m**2 + 2)
+    SL = np.broadcast_to((np.abs(K)**2 * x**6)[:, np.newaxis], (x.size, theta.size))
+    return SL.copy(), SL * np.cos(theta)**2
+
+def rgd_S(m, x, theta):
+    """
+    This function gives SL and SR of the Rayleigh-Gans-Debye approximation: the Rayleigh amplitudes times the
+    form factor G(u) = 3 (sin u - u cos u) / u^3 of a homogeneous sphere, with u = 2 x sin(theta / 2).
+    """
+    K = (m**2 - 1) / (m**2 + 2)
+    u = 2 * x[:, np.newaxis] * np.sin(theta / 2)
+    safe_u = np.maximum(u, 1e-2)
+    G = np.where(u > 1e-2, 3 * (np.sin(safe_u) - safe_u * np.cos(safe_u)) / safe_u**3, 1 - u**2 / 10 + u**4 / 280)
+    SL = (np.abs(K)**2 * x**6)[:, np.newaxis] * G**2
+    return SL, SL * np.cos(theta)**2
+
+def unified_scattering(m, wavelength, r_um, theta_deg, nMedium=1.0, tol=1e-3, method=None):
+    """
+    This function calculates SL = |S1|^2 and SR = |S2|^2 (as in PyMieScatt.ScatteringFunction) for a whole batch of
+    particles, using for every particle the cheapest method that is accurate enough.\n
+    The batch is split by size parameter and refractive index contrast into closed-form Rayleigh, Rayleigh-Gans-Debye
+    and full Mie parts (see regime_errors), every part is evaluated vectorized, and the results are put back in
+    input order. The Mie part is grouped by number of series terms so that small particles are not padded to the
+    series length of the largest one.\n
+    Input the parameters in the following format -\n
+    Args:
+        m : Refractive index of the particles (scalar or array)
+        wavelength : Wavelength of light in nanometers (scalar or array)
+        r_um : Radius of the particles in micrometers (scalar or array)
+        theta_deg : Scattering angles in degrees (1-D array)
+        nMedium : Refractive index of the surrounding medium
+        tol : Largest accepted estimated error of the approximations, relative to the peak of each curve
+        method : None to choose automatically, or 'rayleigh', 'rgd' or 'mie' to force one method
+    Returns:
+        SL, SR, method : SL and SR of shape broadcast(m, wavelength, r_um) + (angles,), and the method code of every
+        particle (index into METHODS)
+    """
+    m, wavelength, r_um = np.broadcast_arrays(np.asarray(m, dtype=complex), np.asarray(wavelength, dtype=float),
+                                              np.asarray(r_um, dtype=float))
+    shape = m.shape
+    theta = np.deg2rad(np.atleast_1d(np.asarray(theta_deg, dtype=float)))
+
+    # Size parameter and refractive index relative to the medium
+    nMedium = np.real(nMedium)
+    m_rel = m.ravel() / nMedium
+    x = 2 * np.pi * r_um.ravel() * 1000 / (wavelength.ravel() / nMedium)
+
+    if method is None:
+        codes = choose_method(m_rel, x, tol)
+    elif method in METHODS:
+        codes = np.full(x.shape, METHODS.index(method), dtype=np.int8)
+    else:
+        raise ValueError(f"Unknown method {method}.\nUse one of {METHODS} or None")
+
+    SL = np.empty((x.size, theta.size))
+    SR = np.empty((x.size, theta.size))
+    for code, function in ((0, rayleigh_S), (1, rgd_S)):
+        part = np.flatnonzero(codes == code)
+        if part.size:
+            SL[part], SR[part] = function(m_rel[part], x[part], theta)
+
+    # Full Mie, in groups of similar series length
+    part = np.flatnonzero(codes == 2)
+    if part.size:
+        group = np.floor(np.log2(mie_n_max(x[part]))).astype(int)
+        for g in np.unique(group):
+            members = part[group == g]
+            SL[members], SR[members] = scattering_intensity(m_rel[members], x[members], theta)
+
+    return SL.reshape(shape + (theta.size,)), SR.reshape(shape + (theta.size,)), codes.reshape(shape)
+
+def intensity_at_distance(S, wavelength, d_cm, I_0=1, nMedium=1.0):
+    """
+    This function converts SL or SR to the scattered intensity at distance d_cm, I = I_0 S / (k d)^2, in the units
+    of the Rayleigh scripts.
+    """
+    k = 2 * np.pi / (np.asarray(wavelength, dtype=float) * 1e-9 / np.real(nMedium))
+    d = np.asarray(d_cm, dtype=float) * 1e-2
+    return I_0 * np.asarray(S) / (k * d)**2
+
+# Example usage:
+if __name__ == "__main__":
+    m = 1.33257 + 1.67e-8j  # refractive index
+    wavelength = 650  # nm
+    theta_deg = np.arange(0, 180.1, 0.1)
+
+    # The radii of rayleigh_intensity_diff_r.py together with micrometre droplets
+    r_um = np.concatenate([np.geomspace(0.0001, 0.1, 1000), np.arange(1, 51)])
+    SL, SR, method = unified_scattering(m, wavelength, r_um, theta_deg)
+    for code, name in enumerate(METHODS):
+        print(name, np.count_nonzero(method == code))
@@ -1,43 +1,34 @@
+import os
+import sys
 import numpy as np
-import pandas as pd
 
-def calculate_rayleigh_intensity(lambda_nm, I_0, r_um, n, d_range):
-    # Create an Excel writer
-    writer = pd.ExcelWriter('rayleigh_intensity_data.xlsx', engine='xlsxwriter')
-
-    # Convert input parameters to SI units
-    lambda_m = lambda_nm * 1e-9
-    r = r_um * 1e-6
-
-    for d_cm in d_range:
-        d = d_cm * 1e-2
-
-        # Condition for Rayleigh scattering
-        if r >= lambda_m:
-            raise ValueError("Rayleigh scattering condition not satisfied.\nRadius of particle r should not be greater than the wavelength of light λ")
-
-        # Scattering angles in degrees (from 0 to 180 degrees)
-        theta_degrees = np.arange(0, 180.1, 0.1)
+# The Rayleigh kernel lives in the parent folder and the export layer in the Data Export folder
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(PROJECT_DIR, "Rayleigh Scattering"))
+sys.path.append(os.path.join(PROJECT_DIR, "Data Export"))
+from rayleigh_kernel import rayleigh_intensity
+from scattering_io import write_table
 
-        # Convert scattering angles from degrees to radians
-        theta_radians = np.deg2rad(theta_degrees)
-
-        # Calculate the Rayleigh scattering intensity for each scattering angle
-        intensity_parallel = I_0 * (16 * np.pi**4 * r**6 / (lambda_m**4 * d**2)) * ((n**2 - 1) / (n**2 + 2))**2 * (np.cos(theta_radians))**2
-        intensity_perpendicular = I_0 * (16 * np.pi**4 * r**6 / (lambda_m**4 * d**2)) * ((n**2 - 1) / (n**2 + 2))**2
-
-        # Create a DataFrame for the current d_cm value
-        data = pd.DataFrame({
-            'Scattering Angle (degrees)': theta_degrees,
-            'Intensity Perpendicular': intensity_perpendicular,
-            'Intensity Parallel': intensity_parallel
-        })
-
-        # Write the DataFrame to a new sheet in the Excel file
-        data.to_excel(writer, sheet_name=f'd_cm_{d_cm:.1f}', index=False)
-
-    # Save the Excel file
-    writer._save()
+def calculate_rayleigh_intensity(lambda_nm, I_0, r_um, n, d_range):
+    # Scattering angles in degrees (from 0 to 180 degrees)
+    theta_degrees = np.arange(0, 180.1, 0.1)
+
+    # Calculate the Rayleigh scattering intensity for every distance and angle in one pass
+    d_range = np.asarray(d_range)
+    intensity_parallel, intensity_perpendicular, _, valid = rayleigh_intensity(
+        lambda_nm, I_0, r_um, n, d_range[:, np.newaxis], theta_degrees)
+
+    # Condition for Rayleigh scattering
+    if not valid.all():
+        raise ValueError("Rayleigh scattering condition not satisfied.\nRadius of particle r should not be greater than the wavelength of light λ")
+
+    # Save one row per distance, with the angles stored once as an axis (open it with scattering_io.open_table)
+    parameters = {'lambda_nm': lambda_nm, 'I_0': I_0, 'r_um': r_um, 'n': n}
+    write_table('rayleigh_intensity_data', {
+        'd_cm': d_range,
+        'Intensity Perpendicular': intensity_perpendicular,
+        'Intensity Parallel': intensity_parallel
+    }, metadata=parameters, axes={'theta_deg': theta_degrees})
 
 # Example usage:
 lambda_nm = 650
@@ -1,8 +1,14 @@
+import os
+import sys
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import csv 
 
+# The Rayleigh kernel lives in the parent folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rayleigh_kernel import rayleigh_intensity
+
 def calculate_rayleigh_intensity(lambda_nm, I_0, r_um, n, d_cm):
     
     """
@@ -16,25 +22,15 @@ def calculate_rayleigh_intensity(lambda_nm, I_0, r_um, n, d_cm):
     d_cm : distance between scattering particle and observing point in cm
     """
     
-    # Convert input parameters to SI units
-    lambda_m = lambda_nm * 1e-9
-    r = r_um * 1e-6
-    d = d_cm * 1e-2
-
-    # Condition for Rayleigh scattering
-    if r >= lambda_m:
-        raise ValueError("Rayleigh scattering condition not satisfied.\nRadius of particle r should not be greater than the wavelength of light λ")
-
     # Scattering angles in degrees (from 0 to 180 degrees)
     theta_degrees = np.arange(0, 180.1, 0.1)
 
-    # Convert scattering angles from degrees to radians
-    theta_radians = np.deg2rad(theta_degrees)
-
     # Calculate the Rayleigh scattering intensity for each scattering angle
-    intensity_parallel = I_0 * (16 * np.pi**4 * r**6 / (lambda_m**4 * d**2)) * ((n**2 - 1) / (n**2 + 2))**2 * (np.cos(theta_radians))**2
-    intensity_perpendicular = I_0 * (16 * np.pi**4 * r**6 / (lambda_m**4 * d**2)) * ((n**2 - 1) / (n**2 + 2))**2
-    intensity_perpendicular = np.full_like(theta_degrees, intensity_perpendicular)
+    intensity_parallel, intensity_perpendicular, _, valid = rayleigh_intensity(lambda_nm, I_0, r_um, n, d_cm, theta_degrees)
+
+    # Condition for Rayleigh scattering
+    if not valid.all():
+        raise ValueError("Rayleigh scattering condition not satisfied.\nRadius of particle r should not be greater than the wavelength of light λ")
 
     # Create a DataFrame to store the data
     data = pd.DataFrame({
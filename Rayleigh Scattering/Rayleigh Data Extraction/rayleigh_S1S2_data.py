@@ -1,10 +1,15 @@
+import os
+import sys
 import numpy as np
-import pandas as pd
+
+# The export layer lives in the Data Export folder
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "Data Export"))
+from scattering_io import write_table
 
 def rayleigh_scattering_data(lambda_nm, r_um, n):
     
     """
-    This function gives the data of S1 and S2 wrt scattering angles in csv format as saves the file in current directory.\n
+    This function gives the data of S1 and S2 wrt scattering angles as a columnar table and saves it in current directory.\n
     **Note: Radius of particle r should not be greater than the wavelength of light λ**\n
     Input the parameters in the following format -\n
     lambda_nm : Wavelength of light in nanometers
@@ -29,15 +34,16 @@ def rayleigh_scattering_data(lambda_nm, r_um, n):
     S1 = (2 * np.pi * r / lambda_m)**2 * (n**2 - 1) / (n**2 + 2)
     S2 = (2 * np.pi * r / lambda_m)**2 * (n**2 - 1) / (n**2 + 2) * np.cos(theta_radians)
 
-    # Create a DataFrame to store the data
-    data = pd.DataFrame({
+    # Store the data as typed columns, with the input parameters in the header
+    data = {
         'Scattering Angle (degrees)': theta_degrees,
-        'S1': S1,
+        'S1': np.full_like(theta_degrees, S1),
         'S2': S2
-    })
+    }
+    parameters = {'lambda_nm': lambda_nm, 'r_um': r_um, 'n': n}
 
-    # Save the data to a CSV file
-    data.to_csv('rayleigh_scattering_data.csv', index=False)
+    # Save the data to a columnar table (open it with scattering_io.open_table)
+    write_table('rayleigh_scattering_data', data, metadata=parameters)
 
 # Example usage:
 lambda_nm = 650
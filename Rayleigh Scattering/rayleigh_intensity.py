@@ -1,5 +1,6 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from rayleigh_kernel import rayleigh_intensity
 
 def plot_rayleigh_scattering_intensity(lambda_nm, I_0, r_um, n, d_cm):
     """
@@ -13,25 +14,15 @@ def plot_rayleigh_scattering_intensity(lambda_nm, I_0, r_um, n, d_cm):
         I_0 : Input intensity of light 
         d_cm : distance between scattering particle and observing point in cm.
     """
-    # Convert input parameters to SI units
-    lambda_m = lambda_nm * 1e-9
-    r = r_um * 1e-6
-    d = d_cm * 1e-2
-
-    # Condition for Rayleigh scattering
-    if r >= lambda_m:
-        raise ValueError("Rayleigh scattering condition not satisfied.\n Radius of particle r should not be greater than the wavelength of light λ")
-
     # Scattering angles in degrees (from 0 to 180 degrees)
     theta_degrees = np.linspace(0, 180, 1000)
 
-    # Convert scattering angles from degrees to radians
-    theta_radians = np.deg2rad(theta_degrees)
-
     # Calculate the Rayleigh scattering intensity for each scattering angle
-    intensity_parallel = I_0 * (16 * np.pi**4 * r**6 / (lambda_m**4 * d**2)) * ((n**2 - 1) / (n**2 + 2))**2 * (np.cos(theta_radians))**2
-    intensity_perpendicular = I_0 * (16 * np.pi**4 * r**6 / (lambda_m**4 * d**2)) * ((n**2 - 1) / (n**2 + 2))**2
-    intensity_perpendicular = np.full_like(theta_degrees, intensity_perpendicular)
+    intensity_parallel, intensity_perpendicular, _, valid = rayleigh_intensity(lambda_nm, I_0, r_um, n, d_cm, theta_degrees)
+
+    # Condition for Rayleigh scattering
+    if not valid.all():
+        raise ValueError("Rayleigh scattering condition not satisfied.\n Radius of particle r should not be greater than the wavelength of light λ")
 
     # Create a figure with two subplots
     fig, axs = plt.subplots(1, 2, figsize=(14, 6))
@@ -1,5 +1,6 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from rayleigh_kernel import rayleigh_intensity
 
 def plot_rayleigh_scattering_intensity(lambda_nm, I_0, r_um, n, d_cm_values):
     """
@@ -17,31 +18,23 @@ def plot_rayleigh_scattering_intensity(lambda_nm, I_0, r_um, n, d_cm_values):
         I_0 : Input intensity of light
         d_cm_values : List of observer distances in cm.
     """
-    # Convert input parameters to SI units
-    lambda_m = lambda_nm * 1e-9
-    r = r_um * 1e-6
-
-    # Condition for Rayleigh scattering
-    if r >= lambda_m:
-        raise ValueError("Rayleigh scattering condition not satisfied.\n Radius of particle r should not be greater than the wavelength of light λ")
-
     # Scattering angles in degrees (from 0 to 180 degrees)
     theta_degrees = np.arange(0, 180.1, 0.1)
 
-    # Convert scattering angles from degrees to radians
-    theta_radians = np.deg2rad(theta_degrees)
+    # Calculate the Rayleigh scattering intensity for every observer distance and angle in one pass
+    d_cm_values = np.asarray(d_cm_values)
+    intensity_parallel, _, _, valid = rayleigh_intensity(lambda_nm, I_0, r_um, n, d_cm_values[:, np.newaxis], theta_degrees)
+
+    # Condition for Rayleigh scattering
+    if not valid.all():
+        raise ValueError("Rayleigh scattering condition not satisfied.\n Radius of particle r should not be greater than the wavelength of light λ")
 
     plt.figure(figsize=(10, 6))
     plt.style.use('seaborn-ticks')
     
-    for d_cm in d_cm_values:
-        d = d_cm * 1e-2
-
-        # Calculate the Rayleigh scattering intensity for each scattering angle
-        intensity_parallel = I_0 * (16 * np.pi**4 * r**6 / (lambda_m**4 * d**2)) * ((n**2 - 1) / (n**2 + 2))**2 * (np.cos(theta_radians))**2
-
+    for d_cm, intensity in zip(d_cm_values, intensity_parallel):
         # Plot the graph for the current observer distance
-        plt.plot(theta_degrees, intensity_parallel, label=f'd = {d_cm} cm')
+        plt.plot(theta_degrees, intensity, label=f'd = {d_cm} cm')
 
     plt.xlabel('Scattering Angle (degrees)', color='black')
     plt.ylabel('Intensity', color='black')
@@ -1,5 +1,6 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from rayleigh_kernel import rayleigh_intensity
 
 def plot_rayleigh_scattering_intensity(lambda_nm, I_0, d_cm, n, r_um_values):
     """
@@ -12,15 +13,16 @@ def plot_rayleigh_scattering_intensity(lambda_nm, I_0, d_cm, n, r_um_values):
     I_0 : Input intensity of light
     r_um_values : List of particle radii in micrometers.
     """
-    # Convert input parameters to SI units
-    lambda_m = lambda_nm * 1e-9
-    d = d_cm * 1e-2
-
     # Scattering angles in degrees (from 0 to 180 degrees)
     theta_degrees = np.arange(0, 180.1, 0.1)
 
-    # Convert scattering angles from degrees to radians
-    theta_radians = np.deg2rad(theta_degrees)
+    # Calculate the Rayleigh scattering intensity for every particle radius and angle in one pass
+    r_um_values = np.asarray(r_um_values)
+    intensity_parallel, _, _, valid = rayleigh_intensity(lambda_nm, I_0, r_um_values[:, np.newaxis], n, d_cm, theta_degrees)
+
+    # Condition for Rayleigh scattering
+    if not valid.all():
+        raise ValueError("Rayleigh scattering condition not satisfied.\n Radius of particle r should not be greater than the wavelength of light λ")
 
     plt.figure(figsize=(14, 6))  # Increase figure width to accommodate two subplots
 
@@ -28,18 +30,9 @@ def plot_rayleigh_scattering_intensity(lambda_nm, I_0, d_cm, n, r_um_values):
     plt.subplot(1, 2, 1)
     plt.style.use('seaborn-ticks')
 
-    for r_um in r_um_values:
-        r = r_um * 1e-6
-
-        # Condition for Rayleigh scattering
-        if r >= lambda_m:
-            raise ValueError("Rayleigh scattering condition not satisfied.\n Radius of particle r should not be greater than the wavelength of light λ")
-
-        # Calculate the Rayleigh scattering intensity for each scattering angle
-        intensity_parallel = I_0 * (16 * np.pi**4 * r**6 / (lambda_m**4 * d**2)) * ((n**2 - 1) / (n**2 + 2))**2 * (np.cos(theta_radians))**2
-
+    for r_um, intensity in zip(r_um_values, intensity_parallel):
         # Plot the graph for the current particle radius
-        plt.plot(theta_degrees, intensity_parallel, label=f'r = {r_um} μm')
+        plt.plot(theta_degrees, intensity, label=f'r = {r_um} μm')
 
     plt.xlabel('Scattering Angle (degrees)', color='black')
     plt.ylabel('Intensity', color='black')
@@ -51,18 +44,9 @@ def plot_rayleigh_scattering_intensity(lambda_nm, I_0, d_cm, n, r_um_values):
 
     # Plot the log y-scale graph on the right side
     plt.subplot(1, 2, 2)
-    for r_um in r_um_values:
-        r = r_um * 1e-6
-
-        # Condition for Rayleigh scattering
-        if r >= lambda_m:
-            raise ValueError("Rayleigh scattering condition not satisfied.\n Radius of particle r should not be greater than the wavelength of light λ")
-
-        # Calculate the Rayleigh scattering intensity for each scattering angle
-        intensity_parallel = I_0 * (16 * np.pi**4 * r**6 / (lambda_m**4 * d**2)) * ((n**2 - 1) / (n**2 + 2))**2 * (np.cos(theta_radians))**2
-
+    for r_um, intensity in zip(r_um_values, intensity_parallel):
         # Plot the graph for the current particle radius
-        plt.plot(theta_degrees, intensity_parallel, label=f'r = {r_um} μm')
+        plt.plot(theta_degrees, intensity, label=f'r = {r_um} μm')
 
     plt.xlabel('Scattering Angle (degrees)', color='black')
     plt.yscale('log')
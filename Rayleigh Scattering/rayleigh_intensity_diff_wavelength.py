@@ -1,5 +1,6 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from rayleigh_kernel import rayleigh_intensity
 
 def plot_rayleigh_scattering_intensity(lambda_nm, I_0, r_um, n, d_cm, ax_linear=None, ax_log=None, label=None):
     """
@@ -7,39 +8,33 @@ def plot_rayleigh_scattering_intensity(lambda_nm, I_0, r_um, n, d_cm, ax_linear=
     **Note: Radius of particle r should not be greater than the wavelength of light λ**
     Input the parameters in the following format -
     Args:
-        lambda_nm : Wavelength of light in nanometers
+        lambda_nm : Wavelength of light in nanometers (a single value or a list of wavelengths)
         r_um : Radius of the particle in micrometers
         n : Refractive index
         I_0 : Input intensity of light
         d_cm : distance between scattering particle and observing point in cm.
     """
-    # Convert input parameters to SI units
-    lambda_m = lambda_nm * 1e-9
-    r = r_um * 1e-6
-    d = d_cm * 1e-2
-
-    # Condition for Rayleigh scattering
-    if r >= lambda_m:
-        raise ValueError("Rayleigh scattering condition not satisfied.\n Radius of particle r should not be greater than the wavelength of light λ")
-
     # Scattering angles in degrees (from 0 to 180 degrees)
     theta_degrees = np.linspace(0, 180, 1000)
 
-    # Convert scattering angles from degrees to radians
-    theta_radians = np.deg2rad(theta_degrees)
+    # Calculate the Rayleigh scattering intensity for every wavelength and angle in one pass
+    wavelengths = np.atleast_1d(lambda_nm)
+    intensity_parallel, _, _, valid = rayleigh_intensity(wavelengths[:, np.newaxis], I_0, r_um, n, d_cm, theta_degrees)
+
+    # Condition for Rayleigh scattering
+    if not valid.all():
+        raise ValueError("Rayleigh scattering condition not satisfied.\n Radius of particle r should not be greater than the wavelength of light λ")
 
-    # Calculate the Rayleigh scattering intensity for each scattering angle
-    intensity_parallel = I_0 * (16 * np.pi**4 * r**6 / (lambda_m**4 * d**2)) * ((n**2 - 1) / (n**2 + 2))**2 * (np.cos(theta_radians))**2
-    intensity_perpendicular = I_0 * (16 * np.pi**4 * r**6 / (lambda_m**4 * d**2)) * ((n**2 - 1) / (n**2 + 2))**2
-    intensity_perpendicular = np.full_like(theta_degrees, intensity_perpendicular)
+    for wavelength, intensity in zip(wavelengths, intensity_parallel):
+        curve_label = f'λ = {wavelength} nm' if label is None else label
 
-    # Plot the Rayleigh scattering intensity for the given wavelength on linear scale
-    if ax_linear is not None:
-        ax_linear.plot(theta_degrees, intensity_parallel, label=f'λ = {lambda_nm} nm' if label is None else label)
+        # Plot the Rayleigh scattering intensity for the given wavelength on linear scale
+        if ax_linear is not None:
+            ax_linear.plot(theta_degrees, intensity, label=curve_label)
 
-    # Plot the Rayleigh scattering intensity for the given wavelength on log scale
-    if ax_log is not None:
-        ax_log.plot(theta_degrees, intensity_parallel, label=f'λ = {lambda_nm} nm' if label is None else label)
+        # Plot the Rayleigh scattering intensity for the given wavelength on log scale
+        if ax_log is not None:
+            ax_log.plot(theta_degrees, intensity, label=curve_label)
 
     return ax_linear, ax_log
 
@@ -80,9 +75,8 @@ my_table = axs[1].table(cellText=tableValues,
                             colWidths=[0.25, 0.15],
                             loc='lower right')
 
-# Iterate over wavelengths and plot on both linear and log scales
-for wavelength in wavelengths:
-    plot_rayleigh_scattering_intensity(wavelength, I_0, r_um, n, d_cm, ax_linear=axs[0], ax_log=axs[1])
+# Plot all wavelengths on both linear and log scales
+plot_rayleigh_scattering_intensity(wavelengths, I_0, r_um, n, d_cm, ax_linear=axs[0], ax_log=axs[1])
 
 # Add legends
 axs[0].legend(frameon=False)
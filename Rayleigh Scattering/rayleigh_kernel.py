@@ -0,0 +1,89 @@
+import os
+import sys
+import numpy as np
+
+# The instrumentation layer lives in the Mie Scattering folder
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Mie Scattering"))
+from instrumentation import instrumented
+
+@instrumented("rayleigh_intensity", lambda result, *args, **kwargs: {"points": result[0].size})
+def rayleigh_intensity(lambda_nm, I_0, r_um, n, d_cm, theta_degrees):
+    """
+    This function calculates the Rayleigh scattering intensity for whole grids of parameters in one broadcast pass.\n
+    Every argument may be a scalar or a NumPy array; the arrays are combined with the usual NumPy broadcasting rules,
+    so e.g. a column of distances and a row of angles give a (distances x angles) table.\n
+    **Note: Radius of particle r should not be greater than the wavelength of light λ**\n
+    Instead of raising, entries that break this condition are flagged in the returned mask and set to NaN.\n
+    Input the parameters in the following format -\n
+    Args:
+        lambda_nm : Wavelength of light in nanometers
+        I_0 : Input intensity of light
+        r_um : Radius of the particle in micrometers
+        n : Refractive index
+        d_cm : distance between scattering particle and observing point in cm
+        theta_degrees : Scattering angles in degrees
+    Returns:
+        intensity_parallel, intensity_perpendicular, intensity_unpolarized, valid
+    """
+    # Convert input parameters to SI units
+    lambda_m = np.asarray(lambda_nm, dtype=float) * 1e-9
+    r = np.asarray(r_um, dtype=float) * 1e-6
+    d = np.asarray(d_cm, dtype=float) * 1e-2
+    n = np.asarray(n)
+
+    # Condition for Rayleigh scattering, checked once per parameter combination
+    valid = r < lambda_m
+
+    # Angle independent part of the intensity, evaluated on the (small) parameter grid only
+    polarizability = np.abs((n**2 - 1) / (n**2 + 2))**2
+    prefactor = I_0 * (16 * np.pi**4 * r**6 / (lambda_m**4 * d**2)) * polarizability
+    prefactor = np.where(valid, prefactor, np.nan)
+
+    # Angular part, evaluated once for the angle grid
+    cos2_theta = np.cos(np.deg2rad(theta_degrees))**2
+
+    # Broadcast both parts against each other to get the full intensity tables
+    intensity_parallel = prefactor * cos2_theta
+    intensity_perpendicular = np.broadcast_to(prefactor, intensity_parallel.shape)
+    intensity_unpolarized = (intensity_parallel + intensity_perpendicular) / 2
+    valid = np.broadcast_to(valid, np.broadcast_shapes(valid.shape, prefactor.shape))
+
+    return intensity_parallel, intensity_perpendicular, intensity_unpolarized, valid
+
+def rayleigh_intensity_grid(lambda_nm, I_0, r_um, n, d_cm, theta_degrees):
+    """
+    This function calculates the Rayleigh scattering intensity on the outer product of 1-D parameter arrays.\n
+    The returned arrays have the axes (wavelength, radius, distance, refractive index, angle), so
+    intensity_parallel[i, j, k, l, :] is the angular curve for lambda_nm[i], r_um[j], d_cm[k] and n[l].\n
+    Input the parameters in the following format -\n
+    Args:
+        lambda_nm : Wavelengths of light in nanometers
+        I_0 : Input intensity of light
+        r_um : Radii of the particle in micrometers
+        n : Refractive indices
+        d_cm : distances between scattering particle and observing point in cm
+        theta_degrees : Scattering angles in degrees
+    Returns:
+        intensity_parallel, intensity_perpendicular, intensity_unpolarized, valid
+    """
+    # Put every parameter on its own axis so that broadcasting builds the full grid
+    lambda_nm = np.atleast_1d(lambda_nm).reshape(-1, 1, 1, 1, 1)
+    r_um = np.atleast_1d(r_um).reshape(1, -1, 1, 1, 1)
+    d_cm = np.atleast_1d(d_cm).reshape(1, 1, -1, 1, 1)
+    n = np.atleast_1d(n).reshape(1, 1, 1, -1, 1)
+    theta_degrees = np.atleast_1d(theta_degrees).reshape(1, 1, 1, 1, -1)
+
+    return rayleigh_intensity(lambda_nm, I_0, r_um, n, d_cm, theta_degrees)
+
+# Example usage:
+if __name__ == "__main__":
+    lambda_nm = np.array([532, 650, 800])
+    r_um = np.array([0.001, 0.01, 0.1])
+    n = 1.33257
+    I_0 = 1
+    d_cm = np.arange(2.1, 5.1, 0.1)
+    theta_degrees = np.arange(0, 180.1, 0.1)
+
+    intensity_parallel, intensity_perpendicular, intensity_unpolarized, valid = rayleigh_intensity_grid(
+        lambda_nm, I_0, r_um, n, d_cm, theta_degrees)
+    print(intensity_parallel.shape, valid.sum(), "valid parameter combinations")